@@ -1,3 +1,23 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Chapter, Manga, Provider
+
+
+@admin.register(Provider)
+class ProviderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'lang', 'is_nsfw', 'updated_at')
+    search_fields = ('id', 'name')
+
+
+@admin.register(Manga)
+class MangaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'provider', 'details_synced_at', 'chapters_synced_at')
+    list_select_related = ('provider',)
+    search_fields = ('title',)
+
+
+@admin.register(Chapter)
+class ChapterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'manga', 'position', 'name', 'chapter_number')
+    list_select_related = ('manga',)
+    raw_id_fields = ('manga',)
@@ -1,32 +1,437 @@
 # gateway_service/api/api_service.py
 
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from typing import Dict, Any, Optional # Adicionado Optional para compatibilidade
+from typing import Dict, Any, List, Optional, Tuple
+
+from . import metrics, timing
+from .resilience import ACQUIRED, QUEUE_FULL, QUEUE_TIMEOUT, SHED, AdaptiveLimiter, CircuitBreaker, Deadline, LatencyTracker
+from .singleflight import SingleFlight
+
+GRAPHQL_HEADERS = {
+    'Content-Type': 'application/json',
+    'Accept': 'application/json',
+}
+
+# --- Pool de conexões (uma sessão por processo) ---
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+def _build_session() -> requests.Session:
+    pool_size = getattr(settings, 'EXTERNAL_PROVIDER_POOL_SIZE', 20)
+    pool_connections = getattr(settings, 'EXTERNAL_PROVIDER_POOL_CONNECTIONS', 4)
+    keep_alive = getattr(settings, 'EXTERNAL_PROVIDER_KEEPALIVE', True)
 
-def execute_externalprovider_query(query: str, variables: Optional[Dict[str, Any]] = None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    return session
+
+def get_session() -> requests.Session:
     """
-    Executa uma query GraphQL no servidor ExternalProvider e retorna a resposta em JSON.
-    Lê a URL e o timeout do arquivo de settings do Django.
+    Retorna a sessão HTTP compartilhada pelo processo atual.
+    As conexões com o ExternalProvider ficam abertas (keep-alive) e são
+    reaproveitadas entre requisições. A sessão é recriada após um fork
+    (ex.: workers do gunicorn com --preload) para não compartilhar sockets.
     """
-    api_url = settings.EXTERNAL_PROVIDER_API_URL
-    timeout = getattr(settings, 'EXTERNAL_PROVIDER_TIMEOUT', 10)
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
 
-    if not api_url:
-        raise ValueError("A variável EXTERNAL_PROVIDER_API_URL não está configurada no ambiente.")
+_OPERATION_NAME_RE = re.compile(r'\b(?:query|mutation)\s+(\w+)')
 
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'query': query,
-        'variables': variables or {}
-    }
-    try:
-        response = requests.post(api_url, json=payload, headers=headers, timeout=timeout)
-        response.raise_for_status()
+@lru_cache(maxsize=128)
+def graphql_operation_name(query: str) -> str:
+    """Nome da operação GraphQL (ex.: GetSourcesList), usado em chaves de cache e logs."""
+    match = _OPERATION_NAME_RE.search(query)
+    return match.group(1) if match else 'anonymous'
+
+# --- Payloads pré-serializados ---
+@lru_cache(maxsize=128)
+def _query_prefix(query: str) -> bytes:
+    # As queries são constantes: serializa o texto uma única vez.
+    return b'{"query":' + json.dumps(query).encode('utf-8') + b',"variables":'
+
+def encode_graphql_payload(query: str, variables: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Monta o corpo JSON da requisição GraphQL reaproveitando a query já serializada.
+    """
+    return _query_prefix(query) + json.dumps(variables or {}, separators=(',', ':')).encode('utf-8') + b'}'
+
+def post_graphql(url: str, body: bytes, timeout: float) -> Dict[str, Any]:
+    """
+    Envia um payload GraphQL já serializado pela sessão compartilhada.
+    Propaga as exceções do requests e ValueError se a resposta não for JSON.
+    """
+    response = get_session().post(url, data=body, headers=GRAPHQL_HEADERS, timeout=timeout)
+    response.raise_for_status()
+    with timing.phase('decode'):
         return response.json()
-    except requests.exceptions.Timeout:
-        raise ConnectionError(f"Timeout ao tentar conectar com o ExternalProvider em {api_url}")
-    except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"Erro de conexão com o ExternalProvider Server: {e}")
+
+class UpstreamError(Exception):
+    """
+    Falha ao consultar o ExternalProvider. Carrega a mensagem, os detalhes e o
+    status HTTP que a view deve devolver ao cliente.
+    """
+    def __init__(self, message: str, details: Any = None, status_code: int = 502, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status_code = status_code
+        # Segundos para o Retry-After (recusas por sobrecarga do gateway)
+        self.retry_after = retry_after
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"error": self.message, "details": self.details}
+
+def upstream_urls():
+    return settings.EXTERNAL_PROVIDER_API_URL, getattr(settings, 'EXTERNAL_PROVIDER_API_URL_2', None)
+
+# --- Saúde dos upstreams ---
+class Upstream:
+    """URL GraphQL do ExternalProvider com seu circuit breaker e histórico de latência."""
+
+    def __init__(self, url: str, name: str = 'primary'):
+        self.url = url
+        # Label das métricas: primary (EXTERNAL_PROVIDER_API_URL) ou secondary (_URL_2)
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'UPSTREAM_BREAKER_FAILURES', 5),
+            reset_timeout=getattr(settings, 'UPSTREAM_BREAKER_RESET_TIMEOUT', 30),
+        )
+        self.latency = LatencyTracker()
+
+    def hedge_delay(self) -> float:
+        """Tempo de espera antes de disparar a mesma requisição na próxima URL (p95 observado)."""
+        observed = self.latency.percentile(getattr(settings, 'UPSTREAM_HEDGE_PERCENTILE', 95))
+        if observed is None:
+            return getattr(settings, 'UPSTREAM_HEDGE_DEFAULT_DELAY', 1.0)
+        return max(observed, getattr(settings, 'UPSTREAM_HEDGE_MIN_DELAY', 0.05))
+
+_upstreams: Dict[Tuple[str, str], Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+def get_upstreams() -> List[Upstream]:
+    """Upstreams configurados, em ordem de preferência (URL principal, depois URL_2)."""
+    result = []
+    for name, url in zip(('primary', 'secondary'), upstream_urls()):
+        if not url:
+            continue
+        upstream = _upstreams.get((name, url))
+        if upstream is None:
+            with _upstreams_lock:
+                upstream = _upstreams.setdefault((name, url), Upstream(url, name))
+        result.append(upstream)
+    return result
+
+def _is_partial(data: Dict[str, Any]) -> bool:
+    # Erros de execução trazem `path`; erros de validação invalidam o documento inteiro
+    return bool(data.get('data')) or any(error.get('path') for error in data['errors'])
+
+def record_attempt(upstream: Upstream, started: float, data: Optional[Dict[str, Any]] = None, error: Optional[Exception] = None, partial: bool = False, operation: str = 'anonymous') -> Tuple[str, Any]:
+    """
+    Registra o resultado de uma tentativa no breaker/latência do upstream e o classifica:
+    ('ok', data), ('graphql', data) para respostas com erros GraphQL ou ('error', mensagem).
+    Erros GraphQL não contam como falha do upstream: ele respondeu. Com partial=True
+    respostas com erros de execução em parte dos campos são aceitas (documentos
+    com aliases em lote).
+    """
+    if error is not None:
+        upstream.breaker.record_failure()
+        metrics.observe_upstream(operation, upstream.name, started, error=error)
+        return 'error', str(error)
+    upstream.latency.observe(time.monotonic() - started)
+    upstream.breaker.record_success()
+    if 'errors' in data and not (partial and _is_partial(data)):
+        metrics.observe_upstream(operation, upstream.name, started, graphql_errors=True)
+        return 'graphql', data
+    metrics.observe_upstream(operation, upstream.name, started)
+    return 'ok', data
+
+def raise_for_attempts(attempts: List[Tuple[str, Any]], operation: str = 'anonymous'):
+    """Converte as tentativas malsucedidas na UpstreamError devolvida ao cliente."""
+    if not attempts:
+        metrics.count_rejected(operation, 'circuit_open')
+        raise UpstreamError("ExternalProvider indisponível (circuit breaker aberto para todas as URLs).", None, 503)
+    graphql_errors = [payload['errors'] for kind, payload in attempts if kind == 'graphql']
+    failures = [payload for kind, payload in attempts if kind == 'error']
+    if len(attempts) == 1:
+        if graphql_errors:
+            raise UpstreamError("Erro na resposta da API GraphQL do ExternalProvider.", graphql_errors[0])
+        raise UpstreamError("Falha ao comunicar com o ExternalProvider-Server.", failures[0], 503)
+    if not failures:
+        raise UpstreamError("Erro nas duas APIs GraphQL do ExternalProvider.", graphql_errors)
+    if not graphql_errors:
+        raise UpstreamError("Falha ao comunicar com ambas as APIs do ExternalProvider.", failures, 503)
+    # Uma URL respondeu com erros GraphQL e a outra falhou
+    raise UpstreamError("Erro na resposta da API GraphQL do ExternalProvider.", graphql_errors + failures)
+
+def _attempt(upstream: Upstream, body: bytes, timeout: float, partial: bool = False, operation: str = 'anonymous') -> Tuple[str, Any]:
+    started = time.monotonic()
+    try:
+        data = post_graphql(upstream.url, body, timeout)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return record_attempt(upstream, started, error=e, operation=operation)
+    return record_attempt(upstream, started, data=data, partial=partial, operation=operation)
+
+def hedging_enabled() -> bool:
+    return getattr(settings, 'UPSTREAM_HEDGING', False)
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _upstreams_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'UPSTREAM_HEDGE_WORKERS', 16),
+                    thread_name_prefix='upstream-hedge',
+                )
+    return _hedge_executor
+
+_hedge_slots: Optional[threading.BoundedSemaphore] = None
+
+def _hedge_limiter() -> threading.BoundedSemaphore:
+    """Vagas para chamadas com tentativa duplicada (hedge) em andamento (UPSTREAM_HEDGE_MAX_INFLIGHT)."""
+    global _hedge_slots
+    if _hedge_slots is None:
+        with _upstreams_lock:
+            if _hedge_slots is None:
+                _hedge_slots = threading.BoundedSemaphore(max(0, getattr(settings, 'UPSTREAM_HEDGE_MAX_INFLIGHT', 4)))
+    return _hedge_slots
+
+def _release_when_done(slots: threading.BoundedSemaphore, futures: List[Future]) -> None:
+    """Devolve a vaga quando a última das tentativas terminar, mesmo depois de quem chamou já ter retornado."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            slots.release()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+def _execute_sequential(upstreams: List[Upstream], body: bytes, deadline: Deadline, partial: bool = False, operation: str = 'anonymous') -> Dict[str, Any]:
+    attempts = []
+    for index, upstream in enumerate(upstreams):
+        if deadline.expired:
+            metrics.count_rejected(operation, 'deadline')
+            attempts.append(('error', 'Tempo limite da requisição esgotado.'))
+            break
+        # allow() é chamado só quando a URL vai de fato ser usada (consome a sonda do half-open)
+        if not upstream.breaker.allow():
+            continue
+        if index > 0:
+            metrics.count_failover(operation, attempts[-1][0] if attempts else 'circuit_open')
+        kind, payload = _attempt(upstream, body, deadline.remaining(), partial, operation)
+        if kind == 'ok':
+            return payload
+        attempts.append((kind, payload))
+    raise_for_attempts(attempts, operation)
+
+def _execute_hedged(upstreams: List[Upstream], body: bytes, deadline: Deadline, partial: bool = False, operation: str = 'anonymous') -> Dict[str, Any]:
+    """
+    Dispara na URL principal e, se ela não responder dentro do seu p95, repete a
+    requisição na próxima URL; vale a primeira resposta bem-sucedida. Falhas
+    disparam a próxima URL imediatamente. A tentativa perdedora termina em
+    segundo plano e só atualiza a saúde do upstream; como ela segue ocupando o
+    pool, no máximo UPSTREAM_HEDGE_MAX_INFLIGHT chamadas podem ter tentativas
+    duplicadas ao mesmo tempo e, sem vaga, a chamada espera a URL principal.
+    """
+    pool = _hedge_pool()
+    pending: Dict[Future, Upstream] = {}
+    attempts = []
+    remaining_upstreams = list(upstreams)
+
+    def launch(reason=None):
+        # reason: motivo do failover (None na primeira URL)
+        while remaining_upstreams:
+            upstream = remaining_upstreams.pop(0)
+            if upstream.breaker.allow():
+                if reason:
+                    metrics.count_failover(operation, reason)
+                pending[pool.submit(_attempt, upstream, body, deadline.remaining(), partial, operation)] = upstream
+                return upstream
+            reason = 'circuit_open'
+        return None
+
+    hedging = True
+    last = launch()
+    while pending:
+        wait_for = deadline.remaining()
+        if remaining_upstreams and hedging:
+            wait_for = min(wait_for, last.hedge_delay())
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        if not done:
+            if deadline.expired:
+                metrics.count_rejected(operation, 'deadline')
+                attempts.append(('error', 'Tempo limite da requisição esgotado.'))
+                break
+            slots = _hedge_limiter()
+            if not (hedging and slots.acquire(blocking=False)):
+                # Sem vaga: não duplica, só espera a tentativa em andamento
+                hedging = False
+                continue
+            hedge = launch('hedge')
+            if hedge is None:
+                slots.release()
+            else:
+                # A vaga só é devolvida quando a perdedora também terminar
+                _release_when_done(slots, list(pending))
+                last = hedge
+            continue
+        for future in done:
+            pending.pop(future)
+            kind, payload = future.result()
+            if kind == 'ok':
+                return payload
+            attempts.append((kind, payload))
+        if not pending:
+            last = launch(attempts[-1][0]) or last
+    raise_for_attempts(attempts, operation)
+
+# --- Limite de concorrência ---
+# Chamadas simultâneas ao ExternalProvider por processo, com limite adaptativo
+# (resilience.AdaptiveLimiter) compartilhado pelos caminhos síncrono e
+# assíncrono: quando a latência do upstream sobe o limite cai, e o excesso
+# espera numa fila por prioridade ou recebe 503 na hora, em vez de se acumular
+# no servidor Suwayomi até estourar os timeouts.
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+PRIORITY_BACKGROUND = 2
+# Segundos sugeridos no Retry-After das recusas por sobrecarga
+OVERLOAD_RETRY_AFTER = 1
+OVERLOAD_MESSAGES = {
+    QUEUE_FULL: "Gateway sobrecarregado: fila de chamadas ao ExternalProvider cheia.",
+    QUEUE_TIMEOUT: "Gateway sobrecarregado: limite de requisições simultâneas ao ExternalProvider atingido.",
+    SHED: "Gateway sobrecarregado: chamada descartada em favor de outra de maior prioridade.",
+}
+
+_limiter: Optional[AdaptiveLimiter] = None
+_priority: contextvars.ContextVar = contextvars.ContextVar('upstream_priority', default=None)
+
+def bulkhead_limit() -> int:
+    """Teto do limite de concorrência (0 desativa o limite e a fila)."""
+    return getattr(settings, 'UPSTREAM_MAX_CONCURRENCY', 32)
+
+def bulkhead_wait(deadline: Deadline) -> float:
+    """Tempo máximo de espera na fila, limitado ao orçamento da requisição."""
+    return min(getattr(settings, 'UPSTREAM_BULKHEAD_TIMEOUT', 2.0), deadline.remaining())
+
+def upstream_limiter() -> Optional[AdaptiveLimiter]:
+    global _limiter
+    if _limiter is None and bulkhead_limit() > 0:
+        with _upstreams_lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter(
+                    bulkhead_limit(),
+                    min_limit=getattr(settings, 'UPSTREAM_MIN_CONCURRENCY', 4),
+                    queue_size=getattr(settings, 'UPSTREAM_QUEUE_SIZE', 64),
+                    tolerance=getattr(settings, 'UPSTREAM_LATENCY_TOLERANCE', 2.0),
+                    adaptive=getattr(settings, 'UPSTREAM_ADAPTIVE_CONCURRENCY', True),
+                )
+    return _limiter
+
+@contextmanager
+def priority(level: int):
+    """Prioridade na fila das chamadas feitas dentro do bloco (ex.: PRIORITY_BACKGROUND no aquecimento)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def call_priority(operation: str) -> int:
+    """Prioridade do bloco priority(), ou PRIORITY_LOW para as operações caras de UPSTREAM_LOW_PRIORITY_OPERATIONS."""
+    level = _priority.get()
+    if level is not None:
+        return level
+    if operation in getattr(settings, 'UPSTREAM_LOW_PRIORITY_OPERATIONS', ('FetchChapterPages',)):
+        return PRIORITY_LOW
+    return PRIORITY_HIGH
+
+def overload_error(outcome: str, operation: str) -> UpstreamError:
+    metrics.count_rejected(operation, outcome)
+    return UpstreamError(OVERLOAD_MESSAGES[outcome], None, 503, retry_after=OVERLOAD_RETRY_AFTER)
+
+def finish_call(limiter: AdaptiveLimiter, started: float, operation: str, error: Optional[BaseException] = None) -> None:
+    """
+    Devolve o slot e alimenta o limite: a latência das chamadas bem-sucedidas
+    ou, para falhas com 503 (timeout, conexão, circuit breaker), sobrecarga.
+    """
+    if error is None:
+        limiter.release(started, latency=time.monotonic() - started, key=operation)
+    elif isinstance(error, UpstreamError):
+        limiter.release(started, overloaded=error.status_code == 503)
+    else:
+        limiter.release(started)
+
+def _execute(body: bytes, timeout: float, partial: bool = False, operation: str = 'anonymous') -> Dict[str, Any]:
+    deadline = Deadline(timeout)
+    limiter = upstream_limiter()
+    if limiter is not None:
+        outcome = limiter.acquire(call_priority(operation), bulkhead_wait(deadline))
+        if outcome != ACQUIRED:
+            raise overload_error(outcome, operation)
+    started = time.monotonic()
+    error = None
+    try:
+        upstreams = get_upstreams()
+        if hedging_enabled() and len(upstreams) > 1:
+            return _execute_hedged(upstreams, body, deadline, partial, operation)
+        return _execute_sequential(upstreams, body, deadline, partial, operation)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if limiter is not None:
+            finish_call(limiter, started, operation, error)
+
+# Chamadas idênticas simultâneas (mesma query e variáveis) compartilham uma só requisição
+_inflight = SingleFlight()
+
+def coalescing_enabled() -> bool:
+    return getattr(settings, 'UPSTREAM_COALESCING', True)
+
+def execute_graphql(query: str, variables: Optional[Dict[str, Any]] = None, timeout: float = 30, partial: bool = False) -> Dict[str, Any]:
+    """
+    Executa a operação no ExternalProvider e levanta UpstreamError em caso de falha.
+
+    `timeout` é o orçamento total da requisição, repartido entre as tentativas.
+    URLs com circuit breaker aberto são puladas; se a principal falhar ou
+    responder com erros GraphQL, tenta a EXTERNAL_PROVIDER_API_URL_2. Com
+    UPSTREAM_HEDGING a segunda URL é disparada também quando a principal
+    demora mais que o seu p95. Chamadas idênticas em andamento são coalescidas
+    (UPSTREAM_COALESCING). Com partial=True respostas parciais (erros GraphQL
+    em parte dos campos) são devolvidas em vez de levantar UpstreamError.
+    """
+    body = encode_graphql_payload(query, variables)
+    operation = graphql_operation_name(query)
+    with timing.phase('upstream', exclude=('decode',)):
+        if coalescing_enabled():
+            return _inflight.do((body, partial), _execute, body, timeout, partial, operation)
+        return _execute(body, timeout, partial, operation)
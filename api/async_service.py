@@ -0,0 +1,158 @@
+# gateway_service/api/async_service.py
+"""
+Cliente assíncrono do ExternalProvider, usado pelas views de api/async_views.py
+quando o serviço roda sob ASGI (backend/asgi.py).
+"""
+
+import asyncio
+import time
+import weakref
+from typing import Dict, Any, Optional
+
+import httpx
+from django.conf import settings
+
+from .api_service import (
+    GRAPHQL_HEADERS, bulkhead_wait, call_priority, coalescing_enabled, encode_graphql_payload, finish_call,
+    get_upstreams, graphql_operation_name, hedging_enabled, overload_error, raise_for_attempts, record_attempt,
+    upstream_limiter,
+)
+from . import metrics, timing
+from .resilience import ACQUIRED, Deadline
+from .singleflight import AsyncSingleFlight
+
+# Um AsyncClient por event loop: o pool de conexões do httpx não pode ser
+# compartilhado entre loops.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _build_client() -> httpx.AsyncClient:
+    pool_size = getattr(settings, 'EXTERNAL_PROVIDER_POOL_SIZE', 20)
+    keep_alive = getattr(settings, 'EXTERNAL_PROVIDER_KEEPALIVE', True)
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size if keep_alive else 0,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=getattr(settings, 'EXTERNAL_PROVIDER_TIMEOUT', 10))
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Retorna o AsyncClient do event loop atual, criando-o na primeira chamada.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = _build_client()
+    return client
+
+async def apost_graphql(url: str, body: bytes, timeout: float) -> Dict[str, Any]:
+    response = await get_async_client().post(url, content=body, headers=GRAPHQL_HEADERS, timeout=timeout)
+    response.raise_for_status()
+    with timing.phase('decode'):
+        return response.json()
+
+async def _aattempt(upstream, body, timeout, partial=False, operation='anonymous'):
+    started = time.monotonic()
+    try:
+        data = await apost_graphql(upstream.url, body, timeout)
+    except (httpx.HTTPError, ValueError) as e:
+        return record_attempt(upstream, started, error=e, operation=operation)
+    except asyncio.CancelledError:
+        upstream.breaker.release()
+        raise
+    return record_attempt(upstream, started, data=data, partial=partial, operation=operation)
+
+async def _aexecute_sequential(upstreams, body, deadline, partial=False, operation='anonymous'):
+    attempts = []
+    for index, upstream in enumerate(upstreams):
+        if deadline.expired:
+            metrics.count_rejected(operation, 'deadline')
+            attempts.append(('error', 'Tempo limite da requisição esgotado.'))
+            break
+        if not upstream.breaker.allow():
+            continue
+        if index > 0:
+            metrics.count_failover(operation, attempts[-1][0] if attempts else 'circuit_open')
+        kind, payload = await _aattempt(upstream, body, deadline.remaining(), partial, operation)
+        if kind == 'ok':
+            return payload
+        attempts.append((kind, payload))
+    raise_for_attempts(attempts, operation)
+
+async def _aexecute_hedged(upstreams, body, deadline, partial=False, operation='anonymous'):
+    pending = set()
+    attempts = []
+    remaining_upstreams = list(upstreams)
+
+    def launch(reason=None):
+        while remaining_upstreams:
+            upstream = remaining_upstreams.pop(0)
+            if upstream.breaker.allow():
+                if reason:
+                    metrics.count_failover(operation, reason)
+                pending.add(asyncio.ensure_future(_aattempt(upstream, body, deadline.remaining(), partial, operation)))
+                return upstream
+            reason = 'circuit_open'
+        return None
+
+    last = launch()
+    try:
+        while pending:
+            wait_for = deadline.remaining()
+            if remaining_upstreams:
+                wait_for = min(wait_for, last.hedge_delay())
+            done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if deadline.expired:
+                    metrics.count_rejected(operation, 'deadline')
+                    attempts.append(('error', 'Tempo limite da requisição esgotado.'))
+                    break
+                last = launch('hedge') or last
+                continue
+            for task in done:
+                pending.discard(task)
+                kind, payload = task.result()
+                if kind == 'ok':
+                    return payload
+                attempts.append((kind, payload))
+            if not pending:
+                last = launch(attempts[-1][0]) or last
+    finally:
+        # A tentativa perdedora é cancelada; não conta como falha do upstream
+        for task in pending:
+            task.cancel()
+    raise_for_attempts(attempts, operation)
+
+async def _aexecute(body: bytes, timeout: float, partial: bool = False, operation: str = 'anonymous') -> Dict[str, Any]:
+    deadline = Deadline(timeout)
+    limiter = upstream_limiter()
+    if limiter is not None:
+        outcome = await limiter.aacquire(call_priority(operation), bulkhead_wait(deadline))
+        if outcome != ACQUIRED:
+            raise overload_error(outcome, operation)
+    started = time.monotonic()
+    error = None
+    try:
+        upstreams = get_upstreams()
+        if hedging_enabled() and len(upstreams) > 1:
+            return await _aexecute_hedged(upstreams, body, deadline, partial, operation)
+        return await _aexecute_sequential(upstreams, body, deadline, partial, operation)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if limiter is not None:
+            finish_call(limiter, started, operation, error)
+
+_inflight = AsyncSingleFlight()
+
+async def aexecute_graphql(query: str, variables: Optional[Dict[str, Any]] = None, timeout: float = 30, partial: bool = False) -> Dict[str, Any]:
+    """
+    Versão assíncrona de api_service.execute_graphql, com o mesmo orçamento de
+    tempo, circuit breaker, hedging e coalescência. Levanta UpstreamError.
+    """
+    body = encode_graphql_payload(query, variables)
+    operation = graphql_operation_name(query)
+    with timing.phase('upstream', exclude=('decode',)):
+        if coalescing_enabled():
+            return await _inflight.do((body, partial), _aexecute, body, timeout, partial, operation)
+        return await _aexecute(body, timeout, partial, operation)
@@ -0,0 +1,241 @@
+# gateway_service/api/async_views.py
+"""
+Versões assíncronas das views de api/views.py, servidas via backend/asgi.py.
+Chamadas independentes ao ExternalProvider são feitas em paralelo e o worker
+não fica bloqueado enquanto espera o upstream.
+"""
+
+import asyncio
+import logging
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.views import View
+from django.views.decorators.http import require_GET
+
+from . import autocomplete, catalog, feeds, metrics
+from .api_service import UpstreamError
+from .async_service import aexecute_graphql
+from .cache import aget_or_fetch
+from .fields import DETAILS_FIELDS, manga_selection, wants_chapters
+from .formatters import format_chapter_pages, format_manga_details, format_providers, format_search_results
+from .renderers import FastJsonResponse
+from .queries import (
+    FETCH_CHAPTER_PAGES_MUTATION, GET_SOURCE_BROWSE_QUERY, GET_SOURCES_LIST_QUERY,
+    manga_chapters_operation, manga_details_batch_operation, manga_details_operation, source_manga_operation,
+)
+from .image_transform import parse_variant
+from .chapter_archive import ChapterArchive, archive_response
+from .image_proxy import OriginBusy, _aiter_sync, aproxy_image, resolve_image_url
+from .search_fanout import NDJSON_CONTENT_TYPE, aiter_search
+from .views import (
+    _archive_error_response, _archive_page_urls, _autocomplete_response, _batch_results, _chapters_from_response,
+    _collect_batch, _fanout_providers, _origin_busy_response, _parse_archive_request, _parse_batch_ids,
+    _parse_chapter_paging, _parse_fanout_params, _parse_fields, _parse_search_params, _prefetch_pages,
+    _upstream_error_response,
+)
+
+logger = logging.getLogger(__name__)
+
+def _error(body, status):
+    return FastJsonResponse(body, status=status, safe=False)
+
+async def _make_graphql_request(query, variables=None, timeout=30, cached=False, partial=False):
+    try:
+        if cached:
+            return await aget_or_fetch(query, variables, lambda: aexecute_graphql(query, variables, timeout=timeout)), None
+        return await aexecute_graphql(query, variables, timeout=timeout, partial=partial), None
+    except UpstreamError as e:
+        return None, _upstream_error_response(e)
+
+@require_GET
+async def list_content_providers(request):
+    data, error_response = await _make_graphql_request(GET_SOURCES_LIST_QUERY, cached=True)
+    if error_response: return error_response
+    providers_list = data.get("data", {}).get("sources", {}).get("nodes", [])
+    catalog.record_providers(providers_list)
+    return FastJsonResponse(format_providers(providers_list), safe=False)
+
+@require_GET
+async def search_content(request):
+    search, error_body = _parse_search_params(request.GET)
+    if error_body:
+        return _error(error_body, 400)
+    body = await feeds.alookup(search)
+    if body is not None:
+        return FastJsonResponse(body)
+    graphql_mutation, variables = source_manga_operation(
+        search["search_type"], search["provider_id"], search["page"], search["query_term"], search["filters"],
+        selection=manga_selection(search["fields"]),
+    )
+    data, error_response = await _make_graphql_request(graphql_mutation, variables, timeout=60)
+    if error_response: return error_response
+    results_data = data.get("data", {}).get("fetchSourceManga", {})
+    mangas_list = results_data.get("mangas", [])
+    has_more = results_data.get("hasNextPage", False)
+    catalog.record_search(mangas_list)
+    autocomplete.add_mangas(mangas_list)
+    await feeds.arecord(search, mangas_list, has_more)
+    return FastJsonResponse({"results": format_search_results(mangas_list, search["fields"]), "has_more": has_more})
+
+@require_GET
+async def autocomplete_titles(request):
+    return _autocomplete_response(request.GET)
+
+@require_GET
+async def search_content_multi(request):
+    search, error_body = _parse_fanout_params(request.GET)
+    if error_body:
+        return _error(error_body, 400)
+    providers_list = []
+    if not search["provider_ids"]:
+        data, error_response = await _make_graphql_request(GET_SOURCES_LIST_QUERY, cached=True)
+        if error_response: return error_response
+        providers_list = data.get("data", {}).get("sources", {}).get("nodes", [])
+    provider_ids, error_body = _fanout_providers(search, providers_list)
+    if error_body:
+        return _error(error_body, 400)
+    return StreamingHttpResponse(
+        aiter_search(provider_ids, search["query_term"], search["page"], search["fields"]), content_type=NDJSON_CONTENT_TYPE
+    )
+
+@require_GET
+async def get_manga_details(request, provider_id, content_id):
+    """
+    Busca detalhes e capítulos do mangá em paralelo.
+    """
+    try:
+        manga_id_as_int = int(content_id)
+    except ValueError:
+        return _error({"error": "O content_id deve ser um número válido."}, 400)
+    paging, error_body = _parse_chapter_paging(request.GET)
+    if not error_body:
+        fields, error_body = _parse_fields(request.GET, DETAILS_FIELDS)
+    if error_body:
+        return _error(error_body, 400)
+    limit, cursor = paging
+
+    mirrored = await catalog.aread_details(manga_id_as_int, fields) if limit is None else None
+    if mirrored:
+        return FastJsonResponse(format_manga_details(*mirrored, None, fields))
+
+    calls = [_make_graphql_request(*manga_details_operation(manga_id_as_int, manga_selection(fields)))]
+    if wants_chapters(fields):
+        calls.append(_make_graphql_request(*manga_chapters_operation(manga_id_as_int, limit, cursor)))
+    responses = await asyncio.gather(*calls)
+    details_data, error_response = responses[0]
+    if error_response: return error_response
+
+    manga_details = details_data.get("data", {}).get("manga")
+    if not manga_details:
+        return _error({"error": f"Conteúdo com id '{content_id}' não encontrado ou dados de mangá ausentes na resposta."}, 404)
+
+    chapters_list, chapters_page = [], None
+    full_chapters = None
+    if wants_chapters(fields):
+        chapters_data, chapters_error = responses[1]
+        # Se a busca de capítulos falhar, a resposta é enviada com capítulos vazios
+        chapters_list, chapters_page = _chapters_from_response(None if chapters_error else chapters_data, limit)
+        if not chapters_error and limit is None:
+            full_chapters = chapters_list
+    catalog.record_details(manga_details, full_chapters, complete=fields is None)
+    autocomplete.add_mangas([manga_details])
+    return FastJsonResponse(format_manga_details(manga_details, chapters_list, chapters_page, fields))
+
+@require_GET
+async def get_manga_details_batch(request):
+    items, error_body = _parse_batch_ids(request.GET.get('ids'))
+    if not error_body:
+        fields, error_body = _parse_fields(request.GET, DETAILS_FIELDS)
+    if error_body:
+        return _error(error_body, 400)
+
+    fetched, failed = {}, {}
+    pending = list(dict.fromkeys(item["manga_id"] for item in items if item["manga_id"] is not None))
+    while pending:
+        query, variables = manga_details_batch_operation(pending, manga_selection(fields), wants_chapters(fields))
+        data, error_response = await _make_graphql_request(query, variables, partial=True)
+        if error_response: return error_response
+        pending = _collect_batch(pending, data, fetched, failed)
+    return FastJsonResponse(_batch_results(items, fetched, failed, fields))
+
+@require_GET
+async def get_chapter_pages(request, provider_id, content_id, chapter_id):
+    try:
+        chapter_id_as_int = int(chapter_id)
+    except ValueError:
+        return _error({"error": "O chapter_id fornecido não é um número válido."}, 400)
+
+    variables = {"input": {"chapterId": chapter_id_as_int}}
+    data, error_response = await _make_graphql_request(FETCH_CHAPTER_PAGES_MUTATION, variables, timeout=90)
+    if error_response: return error_response
+
+    pages_data = data.get("data", {}).get("fetchChapterPages", {})
+    if not isinstance(pages_data, dict) or pages_data.get("pages") is None:
+        return _error({"error": f"Páginas para o capítulo '{chapter_id}' não encontradas ou resposta inválida do ExternalProvider."}, 404)
+    # Só agenda downloads no pool de pré-carregamento, não bloqueia o event loop
+    _prefetch_pages(pages_data["pages"], request.GET.get('prefetch'))
+    return FastJsonResponse(format_chapter_pages(provider_id, content_id, chapter_id, pages_data["pages"]))
+
+@require_GET
+async def download_chapter(request, provider_id, content_id, chapter_id):
+    variables, archive_format, error_body = _parse_archive_request(chapter_id, request.GET)
+    if error_body:
+        return _error(error_body, 400)
+    data, error_response = await _make_graphql_request(FETCH_CHAPTER_PAGES_MUTATION, variables, timeout=90)
+    if error_response: return error_response
+    page_urls, error = _archive_page_urls(data, chapter_id)
+    if error:
+        return _error(*error)
+    archive = ChapterArchive(page_urls)
+    try:
+        # Espera a primeira página numa thread, sem bloquear o event loop
+        await sync_to_async(archive.prepare, thread_sensitive=False)()
+    except (OriginBusy, requests.exceptions.RequestException, OSError) as e:
+        return _archive_error_response(e, chapter_id)
+    response = archive_response(archive, f"{provider_id}-{content_id}-{chapter_id}", archive_format)
+    response.streaming_content = _aiter_sync(archive)
+    return response
+
+@require_GET
+async def image_proxy(request):
+    original_url = request.GET.get('url')
+    if not original_url:
+        return _error({"error": "Parâmetro 'url' não fornecido."}, 400)
+    full_image_url = resolve_image_url(original_url)
+    if full_image_url is None:
+        return _error({"error": "EXTERNAL_PROVIDER_BASE_URL não está configurada."}, 500)
+    try:
+        variant = parse_variant(request.GET, request.headers.get('Accept'))
+    except ValueError as e:
+        return _error({"error": "Parâmetros de imagem inválidos ('w'/'q').", "details": str(e)}, 400)
+    started = time.monotonic()
+    try:
+        return metrics.track_image_response(await aproxy_image(full_image_url, request.headers.get('Range'), variant), started)
+    except OriginBusy as e:
+        return _origin_busy_response(e)
+    except requests.exceptions.RequestException as e:
+        metrics.count_image_error(e)
+        logger.warning("Falha na requisição da imagem externa (%s): %s", full_image_url, e)
+        return _error({"error": f"Falha na requisição da imagem externa ({original_url}): {e}"}, 502)
+
+class SourceFiltersView(View):
+    """
+    Versão assíncrona de views.SourceFiltersView.
+    """
+    async def get(self, request, *args, **kwargs):
+        provider_id = request.GET.get('provider_id')
+        if not provider_id:
+            return FastJsonResponse({'error': 'O parâmetro provider_id é obrigatório.'}, status=400)
+        try:
+            variables = {'id': provider_id}
+            external_provider_data = await aget_or_fetch(
+                GET_SOURCE_BROWSE_QUERY, variables, lambda: aexecute_graphql(GET_SOURCE_BROWSE_QUERY, variables, timeout=settings.EXTERNAL_PROVIDER_TIMEOUT)
+            )
+        except UpstreamError as e:
+            return _upstream_error_response(e, body={'error': 'Erro retornado pela API ExternalProvider', 'details': e.details or e.message})
+        source_data = external_provider_data.get('data', {}).get('source', {})
+        return FastJsonResponse(source_data)
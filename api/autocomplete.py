@@ -0,0 +1,227 @@
+# gateway_service/api/autocomplete.py
+"""
+Índice invertido de títulos em memória para o autocomplete
+(content-discovery/autocomplete/), sem chamadas ao ExternalProvider.
+
+O índice é alimentado pelos títulos que passam pelo gateway (buscas SEARCH,
+POPULAR e LATEST, busca multi-provedor e detalhes) e, na primeira consulta,
+pelos mais recentes do espelho do catálogo (api/catalog.py). De cada palavra
+do título normalizado (sem acentos, minúsculo) são indexados os trigramas do
+início, com a palavra precedida de dois espaços: "  n", " na", "nar", "aru".
+Prefixos de 1 ou 2 letras também acham candidatos, e o que passa de 4 letras é
+conferido no título. Guarda no máximo AUTOCOMPLETE_MAX_TITLES títulos por
+processo; os vistos há mais tempo saem primeiro.
+"""
+
+import itertools
+import logging
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from . import catalog
+from .formatters import proxy_image_url
+from .models import Manga
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r'[^0-9a-z]+')
+# Candidatos verificados por consulta; com mais que isso (prefixos de 1 ou 2 letras)
+# ficam os vistos mais recentemente. O índice serve sugestões, não uma busca completa.
+MAX_CANDIDATES = 1000
+
+
+def normalize(text):
+    """Minúsculas, sem acentos e só letras e números separados por um espaço."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+# Trigramas indexados por palavra: cobrem prefixos de até 4 letras
+PREFIX_GRAMS = 4
+
+def _word_grams(word):
+    padded = '  ' + word
+    return {padded[i:i + 3] for i in range(min(len(word), PREFIX_GRAMS))}
+
+def _title_grams(words):
+    grams = set()
+    for word in words:
+        grams |= _word_grams(word)
+    return grams
+
+
+class _Entry:
+    __slots__ = ('provider_id', 'content_id', 'title', 'words', 'thumbnail_url', 'seen')
+
+    def __init__(self, provider_id, content_id, title, words, thumbnail_url, seen):
+        self.provider_id = provider_id
+        self.content_id = content_id
+        self.title = title
+        # Palavras repetem muito entre títulos: intern evita uma cópia por título
+        self.words = tuple(sys.intern(word) for word in words)
+        self.thumbnail_url = thumbnail_url
+        self.seen = seen
+
+
+class TitleIndex:
+    """Trigrama -> chaves (fonte, id) dos títulos, com despejo do visto há mais tempo."""
+
+    def __init__(self, max_titles):
+        self.max_titles = max_titles
+        self._entries = OrderedDict()  # (provider_id, content_id) -> _Entry, do mais antigo ao mais recente
+        self._grams = {}
+        self._clock = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, provider_id, content_id, title, thumbnail_url=None, refresh=True):
+        """Insere ou atualiza um título. refresh=False não mexe em títulos já presentes."""
+        words = normalize(title).split()
+        if not words:
+            return
+        key = (sys.intern(str(provider_id)), str(content_id))
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None:
+                if not refresh:
+                    return
+                self._entries.move_to_end(key)
+                if list(current.words) == words:
+                    current.title = title
+                    current.thumbnail_url = thumbnail_url or current.thumbnail_url
+                    current.seen = next(self._clock)
+                    return
+                self._unindex(key, current)
+            entry = _Entry(key[0], key[1], title, words, thumbnail_url, next(self._clock))
+            self._entries[key] = entry
+            for gram in _title_grams(words):
+                self._grams.setdefault(gram, set()).add(key)
+            while len(self._entries) > self.max_titles:
+                old_key, old = self._entries.popitem(last=False)
+                self._unindex(old_key, old)
+
+    def _unindex(self, key, entry):
+        for gram in _title_grams(entry.words):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def search(self, query, limit=10, provider_id=None):
+        """
+        Títulos em que cada palavra da consulta é início de uma palavra do
+        título (a última pode estar incompleta). Ordem: título começando pela
+        consulta, depois títulos mais curtos, depois os vistos mais recentemente.
+        """
+        normalized = normalize(query)
+        tokens = normalized.split()
+        if not tokens:
+            return []
+        grams = set()
+        for token in tokens:
+            grams |= _word_grams(token)
+        with self._lock:
+            postings = [self._grams.get(gram) for gram in grams]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            candidates = postings[0]
+            for keys in postings[1:]:
+                candidates = candidates & keys
+                if not candidates:
+                    return []
+            if len(candidates) > MAX_CANDIDATES:
+                # Muitos candidatos: percorre do mais recente e para ao juntar o bastante
+                keys = (key for key in reversed(self._entries) if key in candidates)
+            else:
+                keys = iter(candidates)
+            entries = [self._entries[key] for key in itertools.islice(keys, MAX_CANDIDATES)]
+        # Trigramas com espaço só existem no início de palavras: tokens de até 2 letras não precisam de conferência
+        check = [token for token in tokens if len(token) > 2]
+        matches = []
+        for entry in entries:
+            if provider_id is not None and entry.provider_id != str(provider_id):
+                continue
+            if all(any(word.startswith(token) for word in entry.words) for token in check):
+                text = ' '.join(entry.words)
+                matches.append((not text.startswith(normalized), len(text), -entry.seen, entry))
+        matches.sort(key=lambda match: match[:3])
+        return [match[3] for match in matches[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+_seeded = False
+
+
+def enabled():
+    return getattr(settings, 'AUTOCOMPLETE_ENABLED', True)
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TitleIndex(getattr(settings, 'AUTOCOMPLETE_MAX_TITLES', 20_000))
+    return _index
+
+def add_mangas(nodes):
+    """Indexa os MangaType de uma resposta do ExternalProvider (os sem título ou sem fonte são ignorados)."""
+    if not enabled() or not nodes:
+        return
+    index = get_index()
+    for node in nodes:
+        if node and node.get("title") and node.get("id") is not None and node.get("sourceId") is not None:
+            index.add(node["sourceId"], node["id"], node["title"], node.get("thumbnailUrl"))
+
+def _seed_from_catalog():
+    """Carrega os títulos mais recentes do espelho do catálogo sem sobrescrever os já vistos."""
+    if not catalog.enabled():
+        return
+    index = get_index()
+    close_old_connections()
+    try:
+        rows = list(
+            Manga.objects.exclude(title=None).exclude(provider=None)
+            .order_by('-updated_at').values_list('provider_id', 'id', 'title', 'thumbnail_url')[:index.max_titles]
+        )
+    except DatabaseError as e:
+        logger.warning("Autocomplete sem o espelho do catálogo: %s", e)
+        return
+    finally:
+        close_old_connections()
+    # Do mais antigo ao mais recente, para que os recentes fiquem no fim do LRU
+    for provider_id, content_id, title, thumbnail_url in reversed(rows):
+        index.add(provider_id, content_id, title, thumbnail_url, refresh=False)
+
+def ensure_seeded():
+    """Na primeira chamada, carrega o espelho do catálogo numa thread, sem atrasar a consulta."""
+    global _seeded
+    if _seeded:
+        return
+    with _index_lock:
+        if _seeded:
+            return
+        _seeded = True
+    threading.Thread(target=_seed_from_catalog, name='autocomplete-seed', daemon=True).start()
+
+def suggest(query, limit=10, provider_id=None):
+    ensure_seeded()
+    return [
+        {
+            "provider_id": entry.provider_id,
+            "content_id": entry.content_id,
+            "title": entry.title,
+            "thumbnail_url_proxy": proxy_image_url(entry.thumbnail_url),
+        }
+        for entry in get_index().search(query, limit, provider_id)
+    ]
@@ -0,0 +1,126 @@
+# gateway_service/api/cache.py
+"""
+Cache de respostas do ExternalProvider com TTL e stale-while-revalidate.
+
+As entradas ficam no cache do Django configurado em RESPONSE_CACHE_ALIAS
+(LocMemCache ou Redis, conforme REDIS_URL). Depois do TTL a entrada continua
+sendo servida por até RESPONSE_CACHE_STALE_TTL segundos enquanto uma única
+atualização roda em segundo plano.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .api_service import graphql_operation_name
+
+REFRESH_LOCK_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+_refresh_tasks = set()
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+def _enabled():
+    return getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+
+def _ttls(ttl):
+    if ttl is None:
+        ttl = getattr(settings, 'RESPONSE_CACHE_TTL', 300)
+    return ttl, getattr(settings, 'RESPONSE_CACHE_STALE_TTL', 3600)
+
+def cache_key(query, variables=None):
+    """Chave no formato gw:resp:<operação>:<hash da query e das variáveis>."""
+    digest = hashlib.sha1(query.encode('utf-8'))
+    digest.update(json.dumps(variables or {}, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    return f"gw:resp:{graphql_operation_name(query)}:{digest.hexdigest()}"
+
+def _entry(value, ttl):
+    return {"value": value, "fresh_until": time.time() + ttl}
+
+def _cacheable(value):
+    # Respostas com erros GraphQL não são armazenadas.
+    return isinstance(value, dict) and not value.get('errors')
+
+def _refresh(key, fetch, ttl, stale_ttl):
+    cache = _cache()
+    try:
+        value = fetch()
+        if _cacheable(value):
+            cache.set(key, _entry(value, ttl), ttl + stale_ttl)
+    except Exception:
+        logger.exception("Falha ao atualizar o cache (%s)", key)
+    finally:
+        cache.delete(f"{key}:refresh")
+
+def get_or_fetch(query, variables, fetch, ttl=None):
+    """
+    Retorna a resposta em cache para (query, variables) ou chama fetch().
+    Exceções de fetch() são propagadas e nada é armazenado.
+    """
+    if not _enabled():
+        return fetch()
+    ttl, stale_ttl = _ttls(ttl)
+    cache = _cache()
+    key = cache_key(query, variables)
+
+    entry = cache.get(key)
+    if entry is not None:
+        stale = entry["fresh_until"] < time.time()
+        metrics.count_cache('response', 'stale' if stale else 'hit')
+        if stale and cache.add(f"{key}:refresh", 1, REFRESH_LOCK_TIMEOUT):
+            _refresh_executor.submit(_refresh, key, fetch, ttl, stale_ttl)
+        return entry["value"]
+
+    metrics.count_cache('response', 'miss')
+    value = fetch()
+    if _cacheable(value):
+        cache.set(key, _entry(value, ttl), ttl + stale_ttl)
+    return value
+
+async def _arefresh(key, afetch, ttl, stale_ttl):
+    cache = _cache()
+    try:
+        value = await afetch()
+        if _cacheable(value):
+            await cache.aset(key, _entry(value, ttl), ttl + stale_ttl)
+    except Exception:
+        logger.exception("Falha ao atualizar o cache (%s)", key)
+    finally:
+        await cache.adelete(f"{key}:refresh")
+
+async def aget_or_fetch(query, variables, afetch, ttl=None):
+    """
+    Versão assíncrona de get_or_fetch; afetch é uma função que retorna uma coroutine.
+    """
+    if not _enabled():
+        return await afetch()
+    ttl, stale_ttl = _ttls(ttl)
+    cache = _cache()
+    key = cache_key(query, variables)
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        stale = entry["fresh_until"] < time.time()
+        metrics.count_cache('response', 'stale' if stale else 'hit')
+        if stale and await cache.aadd(f"{key}:refresh", 1, REFRESH_LOCK_TIMEOUT):
+            task = asyncio.create_task(_arefresh(key, afetch, ttl, stale_ttl))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return entry["value"]
+
+    metrics.count_cache('response', 'miss')
+    value = await afetch()
+    if _cacheable(value):
+        await cache.aset(key, _entry(value, ttl), ttl + stale_ttl)
+    return value
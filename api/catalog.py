@@ -0,0 +1,244 @@
+# gateway_service/api/catalog.py
+"""
+Espelho local do catálogo do ExternalProvider no banco (api/models.py).
+
+As views entregam aqui o que recebem do upstream: fontes (list_content_providers),
+mangás vistos em buscas (search_content) e detalhes com a lista completa de
+capítulos (get_manga_details). A gravação é um upsert em lote feito em segundo
+plano por uma única thread, fora do tempo da requisição e sem disputar locks
+do banco entre si.
+
+get_manga_details responde pelo espelho, sem chamar o upstream, quando os
+detalhes (e os capítulos, se pedidos) foram sincronizados há menos de
+CATALOG_MIRROR_MAX_AGE segundos. Listas paginadas de capítulos (?limit=/?cursor=)
+sempre vão ao upstream, pois os cursores são do ExternalProvider. Se o banco
+falhar (ex.: fora do ar ou migrações não aplicadas) as views seguem como se o
+espelho não existisse, e leituras e gravações deixam de tocar o banco por
+CATALOG_DB_RETRY segundos antes de tentar de novo.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import metrics, timing
+from .fields import wants_chapters
+from .models import Chapter, Manga, Provider
+from .resilience import CLOSED, CircuitBreaker
+
+# Campo do MangaType -> coluna de Manga
+MANGA_COLUMNS = {
+    "sourceId": "provider_id",
+    "title": "title",
+    "author": "author",
+    "artist": "artist",
+    "description": "description",
+    "status": "status",
+    "genre": "genres",
+    "thumbnailUrl": "thumbnail_url",
+}
+CHAPTER_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "chapterNumber": "chapter_number",
+    "scanlator": "scanlator",
+    "uploadDate": "uploaded_at",
+}
+BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-sync')
+_pending = 0
+_pending_lock = threading.Lock()
+_last_providers = None
+# Abre na primeira falha do banco; fechado de novo pela primeira operação que der certo
+_db_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=getattr(settings, 'CATALOG_DB_RETRY', 60.0))
+_db_state_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'CATALOG_MIRROR_ENABLED', True)
+
+def _max_age():
+    return getattr(settings, 'CATALOG_MIRROR_MAX_AGE', 600)
+
+def _db_failed(error):
+    """Registra a falha do banco; só o início da indisponibilidade vai para o log."""
+    global _last_providers
+    with _db_state_lock:
+        was_up = _db_breaker.state == CLOSED
+        _db_breaker.record_failure()
+    # A lista de fontes descartada precisa ser gravada quando o banco voltar
+    _last_providers = None
+    if was_up:
+        logger.warning("Espelho do catálogo indisponível (nova tentativa a cada %s s): %s", _db_breaker.reset_timeout, error)
+
+def _db_succeeded():
+    with _db_state_lock:
+        was_down = _db_breaker.state != CLOSED
+        _db_breaker.record_success()
+    if was_down:
+        logger.info("Espelho do catálogo disponível novamente.")
+
+def _run(job, *args):
+    global _pending, _last_providers
+    try:
+        if not _db_breaker.allow():
+            # Banco fora: a gravação é descartada sem tentar conectar
+            if job is _save_providers:
+                _last_providers = None
+            return
+        close_old_connections()
+        try:
+            job(*args)
+        except DatabaseError as e:
+            _db_failed(e)
+        except Exception:
+            _db_breaker.release()
+            logger.exception("Falha ao sincronizar o catálogo (%s)", job.__name__)
+        else:
+            _db_succeeded()
+        finally:
+            close_old_connections()
+    finally:
+        close_old_connections()
+        with _pending_lock:
+            _pending -= 1
+
+def _submit(job, *args):
+    """Agenda a gravação; descarta se já houver CATALOG_SYNC_QUEUE gravações pendentes."""
+    global _pending
+    with _pending_lock:
+        if _pending >= getattr(settings, 'CATALOG_SYNC_QUEUE', 256):
+            return False
+        _pending += 1
+    _executor.submit(_run, job, *args)
+    return True
+
+# --- Leitura ---
+
+def _manga_node(row):
+    """Linha de Manga no formato do MangaType, para os formatters."""
+    node = {key: row[column] for key, column in MANGA_COLUMNS.items()}
+    node["id"] = row["id"]
+    return node
+
+def read_details(manga_id, fields=None):
+    """
+    (manga, capítulos) no formato do ExternalProvider se o espelho estiver
+    dentro da janela de frescor, ou None para buscar no upstream.
+    """
+    max_age = _max_age()
+    if not enabled() or max_age <= 0 or not _db_breaker.allow():
+        return None
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    with_chapters = wants_chapters(fields)
+    try:
+        with timing.phase('catalog'):
+            row = (
+                Manga.objects.filter(pk=manga_id, details_synced_at__gte=cutoff)
+                .values("id", "chapters_synced_at", *MANGA_COLUMNS.values())
+                .first()
+            )
+            stale = row is None or (with_chapters and (row["chapters_synced_at"] is None or row["chapters_synced_at"] < cutoff))
+            chapters = []
+            if with_chapters and not stale:
+                # Uma consulta pelo índice (manga, position), sem instanciar os modelos
+                rows = Chapter.objects.filter(manga_id=manga_id).order_by("position").values_list(*CHAPTER_COLUMNS.values())
+                chapters = [dict(zip(CHAPTER_COLUMNS, values)) for values in rows]
+    except DatabaseError as e:
+        _db_failed(e)
+        return None
+    except BaseException:
+        _db_breaker.release()
+        raise
+    _db_succeeded()
+    if stale:
+        metrics.count_cache('catalog', 'miss')
+        return None
+    metrics.count_cache('catalog', 'hit')
+    return _manga_node(row), chapters
+
+aread_details = sync_to_async(read_details)
+
+# --- Gravação ---
+
+def _ensure_providers(provider_ids):
+    if provider_ids:
+        Provider.objects.bulk_create([Provider(id=str(p)) for p in provider_ids], ignore_conflicts=True)
+
+def _save_mangas(nodes, synced_at=None):
+    """Upsert das colunas presentes nos nodes (a seleção GraphQL pode ter sido reduzida por ?fields=)."""
+    nodes = [node for node in nodes if node.get("id") is not None]
+    if not nodes:
+        return
+    present = [column for key, column in MANGA_COLUMNS.items() if key in nodes[0]]
+    _ensure_providers({node["sourceId"] for node in nodes if node.get("sourceId") is not None})
+    rows = []
+    for node in nodes:
+        values = {column: node.get(key) for key, column in MANGA_COLUMNS.items() if key in node}
+        if values.get("provider_id") is not None:
+            values["provider_id"] = str(values["provider_id"])
+        if "genres" in values and values["genres"] is None:
+            values["genres"] = []
+        rows.append(Manga(id=int(node["id"]), details_synced_at=synced_at, **values))
+    update_fields = present + (["details_synced_at"] if synced_at else []) + ["updated_at"]
+    Manga.objects.bulk_create(rows, update_conflicts=True, unique_fields=["id"], update_fields=update_fields, batch_size=BATCH_SIZE)
+
+def _save_details(node, chapters, complete):
+    now = timezone.now()
+    manga_id = int(node["id"])
+    with transaction.atomic():
+        _save_mangas([node], now if complete else None)
+        if chapters is None:
+            return
+        rows = [
+            Chapter(manga_id=manga_id, position=position, **{column: chapter.get(key) for key, column in CHAPTER_COLUMNS.items()})
+            for position, chapter in enumerate(chapters)
+        ]
+        Chapter.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["id"],
+            update_fields=["manga", "position", *(c for c in CHAPTER_COLUMNS.values() if c != "id")], batch_size=BATCH_SIZE,
+        )
+        # Capítulos removidos na fonte
+        Chapter.objects.filter(manga_id=manga_id).exclude(id__in=[row.id for row in rows]).delete()
+        Manga.objects.filter(pk=manga_id).update(chapters_synced_at=now)
+
+def _save_providers(nodes):
+    rows = [
+        Provider(id=str(node["id"]), name=node.get("name"), lang=node.get("lang"), icon_url=node.get("iconUrl"), is_nsfw=node.get("isNsfw"))
+        for node in nodes if node.get("id") is not None
+    ]
+    Provider.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=["id"], update_fields=["name", "lang", "icon_url", "is_nsfw", "updated_at"],
+        batch_size=BATCH_SIZE,
+    )
+
+def record_details(manga, chapters=None, complete=True):
+    """
+    Detalhes vindos de get_manga_details. chapters é a lista completa de
+    capítulos (None se não foi buscada ou veio paginada); complete indica que
+    a seleção trouxe todos os campos do mangá.
+    """
+    if enabled() and manga and manga.get("id") is not None:
+        _submit(_save_details, manga, chapters, complete)
+
+def record_search(mangas):
+    """Mangás vistos numa busca: só as colunas presentes são atualizadas."""
+    if enabled() and mangas:
+        _submit(_save_mangas, list(mangas))
+
+def record_providers(nodes):
+    """Lista de fontes; como ela costuma vir do cache de respostas, só grava quando muda."""
+    global _last_providers
+    if not enabled() or not nodes or nodes == _last_providers:
+        return
+    if _submit(_save_providers, nodes):
+        _last_providers = nodes
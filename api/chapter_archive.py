@@ -0,0 +1,204 @@
+# gateway_service/api/chapter_archive.py
+"""
+Download de um capítulo inteiro como CBZ (ZIP com as páginas em ordem).
+
+As páginas são buscadas num pool compartilhado, até CHAPTER_ARCHIVE_WINDOW
+por download à frente da página que está sendo escrita, e ficam no cache de
+imagens (ou num arquivo temporário, se a origem proibir cache). Cada página é
+lida inteira para a memória e gravada sem compressão, já que as imagens são
+comprimidas, com o CRC e os tamanhos reais no cabeçalho local: alguns leitores
+de CBZ recusam entradas com data descriptor. A memória por download é a de uma
+página, não cresce com o número de páginas.
+"""
+
+import io
+import logging
+import posixpath
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .image_proxy import open_original
+
+ARCHIVE_FORMATS = {
+    'cbz': 'application/vnd.comicbook+zip',
+    'zip': 'application/zip',
+}
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/avif': '.avif',
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CHAPTER_ARCHIVE_WORKERS', 16),
+                    thread_name_prefix='chapter-archive',
+                )
+    return _executor
+
+def _window():
+    return max(1, getattr(settings, 'CHAPTER_ARCHIVE_WINDOW', 4))
+
+def _fetch_page(url):
+    # Downloads de capítulo esperam mais pela origem que o image_proxy: um 503
+    # no meio do arquivo custaria o capítulo inteiro
+    return open_original(url, queue_timeout=getattr(settings, 'CHAPTER_ARCHIVE_QUEUE_TIMEOUT', 30.0))
+
+def _discard(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+def entry_name(index, total, url, content_type):
+    """Nome da página no ZIP: número com zeros à esquerda (ordem lexicográfica = ordem de leitura) e extensão."""
+    extension = EXTENSIONS.get((content_type or '').split(';')[0].strip().lower())
+    if extension is None:
+        extension = posixpath.splitext(urlsplit(url).path)[1].lower() or '.jpg'
+    return f"{index + 1:0{max(3, len(str(total)))}d}{extension}"
+
+
+class _Sink:
+    """
+    Destino do ZipFile: guarda o que foi escrito até o próximo drain(). Aceita
+    seek dentro do que ainda não foi drenado, o suficiente para o ZipFile
+    regravar o cabeçalho local da entrada depois de escrevê-la.
+    """
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._drained = 0
+
+    def write(self, data):
+        return self._buffer.write(data)
+
+    def tell(self):
+        return self._drained + self._buffer.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence != io.SEEK_SET or offset < self._drained:
+            raise OSError("Seek para trecho já enviado do arquivo.")
+        return self._drained + self._buffer.seek(offset - self._drained)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self._buffer.getvalue()
+        self._buffer = io.BytesIO()
+        self._drained += len(data)
+        return data
+
+
+class ChapterArchive:
+    """
+    Iterador com os bytes do arquivo. prepare() espera a primeira página, para
+    que uma origem fora do ar vire um erro HTTP em vez de um arquivo vazio;
+    close() cancela os downloads que ainda não começaram.
+
+    Sob ASGI, next() roda numa thread e close() pode chegar do event loop no
+    meio dele: close() só marca o fechamento e, se next() estiver em andamento,
+    a limpeza fica com ele.
+    """
+
+    def __init__(self, page_urls):
+        self.page_urls = list(page_urls)
+        self._futures = deque()
+        self._scheduled = 0
+        self._sink = _Sink()
+        self._chunks = self._generate()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _fill(self):
+        while self._scheduled < len(self.page_urls) and len(self._futures) < _window():
+            self._futures.append(_pool().submit(_fetch_page, self.page_urls[self._scheduled]))
+            self._scheduled += 1
+
+    def prepare(self):
+        """Agenda a primeira janela e espera a primeira página; levanta o erro dela."""
+        self._fill()
+        if self._futures:
+            error = self._futures[0].exception()
+            if error is not None:
+                self.close()
+                raise error
+
+    def _generate(self):
+        archive = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_STORED)
+        total = len(self.page_urls)
+        for index, url in enumerate(self.page_urls):
+            self._fill()
+            body, content_type = self._futures.popleft().result()
+            try:
+                data = body.read()
+            finally:
+                body.close()
+            info = zipfile.ZipInfo(entry_name(index, total, url, content_type), time.localtime()[:6])
+            archive.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+            yield self._sink.drain()
+        archive.close()
+        yield self._sink.drain()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            with self._lock:
+                if self._closed:
+                    raise StopIteration
+                try:
+                    return next(self._chunks)
+                except StopIteration:
+                    raise
+                except Exception:
+                    # Cabeçalhos já enviados: só resta interromper o arquivo
+                    logger.exception("Falha ao gerar o arquivo do capítulo")
+                    self._closed = True
+                    raise
+        finally:
+            if self._closed:
+                self._release()
+
+    def close(self):
+        self._closed = True
+        self._release()
+
+    def _release(self):
+        # Sem o lock, um next() está em andamento e chama _release() ao terminar
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._chunks.close()
+            while self._futures:
+                future = self._futures.popleft()
+                if not future.cancel():
+                    future.add_done_callback(_discard)
+        finally:
+            self._lock.release()
+
+
+def archive_response(archive, filename, archive_format='cbz'):
+    response = StreamingHttpResponse(archive, content_type=ARCHIVE_FORMATS[archive_format])
+    filename = re.sub(r'[^\w.-]', '_', filename)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{archive_format}"'
+    return response
@@ -0,0 +1,226 @@
+# gateway_service/api/feeds.py
+"""
+Feeds POPULAR e LATEST pré-calculados.
+
+Essas buscas são as mais pedidas e iguais para todos os usuários. O aquecimento
+busca as primeiras FEED_WARM_PAGES páginas de cada feed de cada fonte e grava a
+resposta já formatada de search_content no cache RESPONSE_CACHE_ALIAS por
+FEED_CACHE_TTL segundos. search_content responde por essas entradas sem chamar
+o upstream (?fields= é aplicado sobre elas); numa falta, a resposta completa
+que veio do upstream também é gravada. Essa leitura e gravação valem mesmo sem
+aquecimento (FEED_CACHE_ENABLED as desativa).
+
+O aquecimento roda pelo comando `python manage.py warm_feeds` (uma rodada, ou
+--loop) ou, com FEED_WARM_IN_PROCESS, numa thread em cada worker do gunicorn.
+As rodadas se repetem a cada FEED_WARM_INTERVAL segundos ±FEED_WARM_JITTER,
+para que processos não entrem em sincronia, e um lock no cache faz com que
+processos que compartilham o cache (Redis) façam uma só rodada por intervalo.
+Para não disputar o upstream com o tráfego, uma rodada faz no máximo
+FEED_WARM_CONCURRENCY chamadas simultâneas, com a prioridade mais baixa na fila
+do limite de concorrência, espera enquanto as chamadas do processo passam de
+FEED_WARM_MAX_LOAD do limite e abandona o feed no primeiro erro (circuit
+breaker aberto, fila cheia, timeout).
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import autocomplete, catalog, metrics
+from .api_service import PRIORITY_BACKGROUND, UpstreamError, execute_graphql, priority, upstream_limiter
+from .cache import get_or_fetch
+from .fields import project
+from .formatters import format_search_results
+from .queries import GET_SOURCES_LIST_QUERY, source_manga_operation
+
+FEED_TYPES = ('POPULAR', 'LATEST')
+ROUND_LOCK_KEY = 'gw:feed:round'
+# Espera máxima por folga no upstream antes de desistir da página
+MAX_LOAD_WAIT = 30.0
+LOAD_POLL_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+_stop = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+_warming = 0
+_warming_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'FEED_CACHE_ENABLED', True)
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+def _pages():
+    return getattr(settings, 'FEED_WARM_PAGES', 2)
+
+def _interval():
+    return getattr(settings, 'FEED_WARM_INTERVAL', 300)
+
+def _jitter():
+    return min(max(getattr(settings, 'FEED_WARM_JITTER', 0.2), 0.0), 1.0)
+
+def _ttl():
+    return getattr(settings, 'FEED_CACHE_TTL', 600)
+
+def feed_key(search_type, provider_id, page):
+    return f"gw:feed:{search_type.lower()}:{provider_id}:{page}"
+
+def _servable(search):
+    return (
+        enabled() and search["search_type"] in FEED_TYPES and not search["filters"]
+        and 1 <= search["page"] <= _pages()
+    )
+
+def _body(mangas, has_more):
+    return {"results": format_search_results(mangas), "has_more": has_more}
+
+def _project(body, fields):
+    if fields is None:
+        return body
+    return {"results": [project(item, fields) for item in body["results"]], "has_more": body["has_more"]}
+
+# --- Leitura pelas views ---
+
+def lookup(search):
+    """Resposta pré-calculada de search_content para a busca, ou None."""
+    if not _servable(search):
+        return None
+    body = _cache().get(feed_key(search["search_type"], search["provider_id"], search["page"]))
+    metrics.count_cache('feed', 'miss' if body is None else 'hit')
+    return None if body is None else _project(body, search["fields"])
+
+async def alookup(search):
+    if not _servable(search):
+        return None
+    body = await _cache().aget(feed_key(search["search_type"], search["provider_id"], search["page"]))
+    metrics.count_cache('feed', 'miss' if body is None else 'hit')
+    return None if body is None else _project(body, search["fields"])
+
+def record(search, mangas, has_more):
+    """Grava a resposta do upstream numa falta; só seleções completas (sem ?fields=) servem a todos."""
+    if _servable(search) and search["fields"] is None:
+        _cache().set(feed_key(search["search_type"], search["provider_id"], search["page"]), _body(mangas, has_more), _ttl())
+
+async def arecord(search, mangas, has_more):
+    if _servable(search) and search["fields"] is None:
+        await _cache().aset(feed_key(search["search_type"], search["provider_id"], search["page"]), _body(mangas, has_more), _ttl())
+
+# --- Aquecimento ---
+
+def _provider_ids(only=None):
+    data = get_or_fetch(GET_SOURCES_LIST_QUERY, None, lambda: execute_graphql(GET_SOURCES_LIST_QUERY))
+    nodes = data.get("data", {}).get("sources", {}).get("nodes", [])
+    catalog.record_providers(nodes)
+    ids = [str(node["id"]) for node in nodes if node.get("id") is not None]
+    only = only or getattr(settings, 'FEED_WARM_PROVIDERS', ())
+    return [provider_id for provider_id in ids if provider_id in only] if only else ids
+
+def _track_warming(delta):
+    global _warming
+    with _warming_lock:
+        _warming += delta
+
+def _wait_for_capacity():
+    """Espera enquanto o tráfego ocupa mais que FEED_WARM_MAX_LOAD do limite de concorrência. False se desistiu."""
+    limiter = upstream_limiter()
+    if limiter is None:
+        return True
+    max_load = getattr(settings, 'FEED_WARM_MAX_LOAD', 0.5)
+    give_up = time.monotonic() + MAX_LOAD_WAIT
+    while limiter.in_flight - _warming > limiter.limit * max_load:
+        if _stop.wait(LOAD_POLL_INTERVAL) or time.monotonic() > give_up:
+            return False
+    return True
+
+def warm_feed(provider_id, search_type):
+    """Aquece as páginas de um feed em ordem; retorna (páginas gravadas, falhou)."""
+    warmed = 0
+    for page in range(1, _pages() + 1):
+        if not _wait_for_capacity():
+            return warmed, True
+        query, variables = source_manga_operation(search_type, provider_id, page)
+        _track_warming(1)
+        try:
+            with priority(PRIORITY_BACKGROUND):
+                data = execute_graphql(query, variables, timeout=60)
+        except UpstreamError as e:
+            logger.warning("Falha ao aquecer %s da fonte %s (página %s): %s", search_type, provider_id, page, e)
+            return warmed, True
+        finally:
+            _track_warming(-1)
+        results = data.get("data", {}).get("fetchSourceManga") or {}
+        mangas = results.get("mangas", [])
+        has_more = results.get("hasNextPage", False)
+        _cache().set(feed_key(search_type, provider_id, page), _body(mangas, has_more), _ttl())
+        catalog.record_search(mangas)
+        autocomplete.add_mangas(mangas)
+        warmed += 1
+        if not has_more:
+            break
+    return warmed, False
+
+def warm(concurrency=None, providers=None):
+    """Uma rodada de aquecimento de todas as fontes. Retorna um resumo da rodada."""
+    started = time.monotonic()
+    provider_ids = _provider_ids(providers)
+    jobs = [(provider_id, search_type) for provider_id in provider_ids for search_type in FEED_TYPES]
+    workers = max(1, concurrency or getattr(settings, 'FEED_WARM_CONCURRENCY', 2))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feed-warm') as pool:
+        results = list(pool.map(lambda job: warm_feed(*job), jobs))
+    summary = {
+        "providers": len(provider_ids),
+        "pages": sum(warmed for warmed, _ in results),
+        "failed_feeds": sum(1 for _, failed in results if failed),
+        "seconds": round(time.monotonic() - started, 1),
+    }
+    logger.info(
+        "Feeds aquecidos: %s páginas de %s fontes em %ss (%s feeds com falha)",
+        summary['pages'], summary['providers'], summary['seconds'], summary['failed_feeds'],
+    )
+    return summary
+
+def next_delay():
+    """Intervalo até a próxima rodada, com jitter."""
+    jitter = _jitter()
+    return _interval() * random.uniform(1 - jitter, 1 + jitter)
+
+def _claim_round():
+    # Com cache compartilhado, o primeiro processo do intervalo faz a rodada
+    timeout = max(1, int(_interval() * (1 - _jitter())))
+    return _cache().add(ROUND_LOCK_KEY, 1, timeout)
+
+def run(**options):
+    """Repete warm() a cada next_delay() segundos até stop(); a primeira rodada também tem jitter."""
+    _stop.clear()
+    if _stop.wait(random.uniform(0, _interval() * _jitter())):
+        return
+    while True:
+        if _claim_round():
+            try:
+                warm(**options)
+            except Exception:
+                logger.exception("Falha no aquecimento dos feeds")
+        if _stop.wait(next_delay()):
+            return
+
+def stop():
+    _stop.set()
+
+def start_worker():
+    """Inicia o aquecimento numa thread do processo, se FEED_WARM_IN_PROCESS estiver ativo."""
+    global _worker
+    if not getattr(settings, 'FEED_WARM_IN_PROCESS', False):
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run, name='feed-warm', daemon=True)
+            _worker.start()
@@ -0,0 +1,61 @@
+# gateway_service/api/fields.py
+"""
+Projeção de campos escolhida pelo cliente (?fields=title,thumbnail_url_proxy).
+
+Cada endpoint aceita uma lista fixa de campos da resposta. A partir deles
+monta-se a seleção GraphQL enviada ao ExternalProvider, então campos não
+pedidos nem são buscados no upstream.
+"""
+
+# Campo da resposta -> campos do MangaType usados para montá-lo
+MANGA_FIELD_SOURCES = {
+    "provider_id": ("sourceId",),
+    "content_id": ("id",),
+    "title": ("title",),
+    "author": ("author",),
+    "artist": ("artist",),
+    "description": ("description",),
+    "status": ("status",),
+    "genres": ("genre",),
+    "thumbnail_url_proxy": ("thumbnailUrl",),
+}
+
+SEARCH_FIELDS = ("provider_id", "content_id", "title", "thumbnail_url_proxy")
+
+# "chapters" (e chapters_page) dependem de uma segunda consulta, feita só se pedidos
+DETAILS_FIELDS = tuple(MANGA_FIELD_SOURCES) + ("chapters",)
+
+def parse_fields(raw, allowed):
+    """
+    Interpreta o parâmetro fields. Retorna None (resposta completa) se ausente,
+    ou o frozenset dos campos. Levanta ValueError com os nomes fora da lista.
+    """
+    if raw is None or not raw.strip():
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    invalid = [name for name in fields if name not in allowed]
+    if invalid:
+        raise ValueError(", ".join(invalid))
+    return frozenset(fields)
+
+def manga_selection(fields):
+    """
+    Seleção GraphQL do MangaType para os campos pedidos (sempre inclui o id),
+    ou None para usar o documento completo.
+    """
+    if fields is None:
+        return None
+    selection = ["id"]
+    for name, sources in MANGA_FIELD_SOURCES.items():
+        if name in fields:
+            selection.extend(source for source in sources if source not in selection)
+    return ", ".join(selection)
+
+def wants_chapters(fields):
+    return fields is None or "chapters" in fields
+
+def project(item, fields):
+    """Mantém só os campos pedidos; fields None devolve o item inteiro."""
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
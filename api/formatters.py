@@ -0,0 +1,73 @@
+# gateway_service/api/formatters.py
+"""
+Conversão das respostas do ExternalProvider para o formato público da API.
+"""
+
+from .fields import project
+from .timing import timed
+
+def proxy_image_url(url):
+    return f"/api/v1/image-proxy/?url={url}" if url else None
+
+@timed('format')
+def format_providers(providers_list):
+    return [{"id": p.get("id"),"name": p.get("name"),"language": p.get("lang"),"icon_url_proxy": proxy_image_url(p.get("iconUrl")),"is_nsfw": p.get("isNsfw")} for p in providers_list]
+
+@timed('format')
+def format_search_results(mangas_list, fields=None):
+    return [project({"provider_id": item.get("sourceId"),"content_id": str(item.get("id")),"title": item.get("title"),"thumbnail_url_proxy": proxy_image_url(item.get("thumbnailUrl"))}, fields) for item in mangas_list]
+
+def format_chapter(c):
+    return {
+        "id": str(c.get("id")),
+        "name": c.get("name"),
+        "chapter_number": c.get("chapterNumber"),
+        "scanlator": c.get("scanlator"),
+        "uploaded_at": c.get("uploadDate")
+    }
+
+@timed('format')
+def format_chapters_page(limit, chapters_connection):
+    page_info = chapters_connection.get("pageInfo") or {}
+    has_more = bool(page_info.get("hasNextPage"))
+    return {
+        "limit": limit,
+        "next_cursor": page_info.get("endCursor") if has_more else None,
+        "has_more": has_more,
+        "total": chapters_connection.get("totalCount")
+    }
+
+@timed('format')
+def format_manga_details(manga_details, chapters_list, chapters_page=None, fields=None):
+    details = {
+        "provider_id": manga_details.get("sourceId"),
+        "content_id": str(manga_details.get("id")),
+        "title": manga_details.get("title"),
+        "author": manga_details.get("author"),
+        "artist": manga_details.get("artist"),
+        "description": manga_details.get("description"),
+        "status": manga_details.get("status"),
+        "genres": manga_details.get("genre", []),
+        "thumbnail_url_proxy": proxy_image_url(manga_details.get("thumbnailUrl")),
+        "chapters": [format_chapter(c) for c in chapters_list]
+    }
+    details = project(details, fields)
+    if chapters_page is not None:
+        details["chapters_page"] = chapters_page
+    return details
+
+@timed('format')
+def format_chapter_pages(provider_id, content_id, chapter_id, page_urls):
+    formatted_pages = [
+        {
+            "page_index": i,
+            "proxy_image_url": proxy_image_url(url),
+            "original_url": url
+        } for i, url in enumerate(page_urls)
+    ]
+    return {
+        "provider_id": provider_id,
+        "content_id": content_id,
+        "chapter_id": chapter_id,
+        "pages": formatted_pages
+    }
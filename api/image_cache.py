@@ -0,0 +1,366 @@
+# gateway_service/api/image_cache.py
+"""
+Cache em disco das imagens servidas pelo image_proxy.
+
+Layout em IMAGE_CACHE_DIR:
+    blobs/<aa>/<sha256 do conteúdo>   corpo da imagem (content-addressed)
+    index/<aa>/<sha256 da url>.json    metadados da URL (blob, ETag, Last-Modified, validade)
+
+O LRU usa o mtime dos blobs, atualizado a cada hit. Quando o total (blobs,
+índices e temporários) passa de IMAGE_CACHE_MAX_BYTES os blobs menos usados,
+e os índices que apontam para eles, são removidos em segundo plano. O uso
+inicial é contado numa thread (start_accounting), que também apaga temporários
+com mais de TMP_MAX_AGE segundos deixados por processos interrompidos.
+Escritas usam arquivo temporário + os.replace, então vários workers podem
+compartilhar o mesmo diretório.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+
+TOUCH_INTERVAL = 60
+LOW_WATERMARK = 0.9
+# Temporários mais antigos que isso não pertencem a uma escrita em andamento
+TMP_MAX_AGE = 3600
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+logger = logging.getLogger(__name__)
+
+def _root():
+    return str(getattr(settings, 'IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gateway-image-cache')))
+
+def _max_bytes():
+    return getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 1024 ** 3)
+
+def enabled():
+    return getattr(settings, 'IMAGE_CACHE_ENABLED', True)
+
+def _sharded(kind, digest, suffix=''):
+    return os.path.join(_root(), kind, digest[:2], digest + suffix)
+
+def url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def freshness_lifetime(headers):
+    """
+    Segundos em que a resposta da origem pode ser servida sem revalidar.
+    Retorna None se a origem proibir armazenamento (no-store/private).
+    """
+    cache_control = (headers.get('Cache-Control') or '').lower()
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return max(0, int(parsedate_to_datetime(expires).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return 0
+    return getattr(settings, 'IMAGE_CACHE_DEFAULT_TTL', 3600)
+
+
+class CachedImage:
+    """Entrada do índice: metadados da URL e caminho do blob."""
+
+    def __init__(self, url, meta):
+        self.url = url
+        self.meta = meta
+        self.path = _sharded('blobs', meta['blob'])
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def content_type(self):
+        return self.meta.get('content_type') or 'application/octet-stream'
+
+    @property
+    def etag(self):
+        # O hash do conteúdo é um validador forte para os clientes do proxy.
+        return f'"{self.meta["blob"]}"'
+
+    def is_fresh(self):
+        return self.meta.get('fresh_until', 0) > time.time()
+
+    def validators(self):
+        """Cabeçalhos para a GET condicional à origem."""
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+    def touch(self):
+        try:
+            if time.time() - os.stat(self.path).st_mtime > TOUCH_INTERVAL:
+                os.utime(self.path)
+        except OSError:
+            pass
+
+    def revalidated(self, headers):
+        """Atualiza a validade após um 304 da origem."""
+        lifetime = freshness_lifetime(headers)
+        self.meta['fresh_until'] = time.time() + (lifetime or 0)
+        if headers.get('ETag'):
+            self.meta['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            self.meta['last_modified'] = headers['Last-Modified']
+        _write_json(_sharded('index', url_key(self.url), '.json'), self.meta)
+        self.touch()
+
+
+def _write_json(path, data):
+    """Grava o JSON de forma atômica; retorna o tamanho em bytes."""
+    payload = json.dumps(data).encode()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return len(payload)
+
+def lookup(url):
+    """Retorna a CachedImage da URL ou None se não houver entrada válida."""
+    index_path = _sharded('index', url_key(url), '.json')
+    try:
+        with open(index_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    entry = CachedImage(url, meta)
+    if not os.path.exists(entry.path):
+        # Blob removido pelo LRU
+        _unlink(index_path)
+        return None
+    return entry
+
+
+class ImageWriter:
+    """
+    Grava o corpo vindo da origem enquanto ele é repassado ao cliente.
+    commit() move o arquivo para blobs/ (nome = sha256 do conteúdo) e grava o índice;
+    abort() descarta a escrita parcial.
+    """
+
+    def __init__(self, url, headers, lifetime):
+        self.url = url
+        self.headers = headers
+        self.lifetime = lifetime
+        self.size = 0
+        self._hash = hashlib.sha256()
+        tmp_dir = os.path.join(_root(), 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def flush(self):
+        """Torna o que já foi escrito visível para open_reader()."""
+        self._file.flush()
+
+    def open_reader(self):
+        """Abre o arquivo em gravação para leitura; o descritor segue válido após commit() ou abort()."""
+        return open(self._tmp_path, 'rb')
+
+    def abort(self):
+        self._file.close()
+        _unlink(self._tmp_path)
+
+    def commit(self):
+        self._file.close()
+        blob = self._hash.hexdigest()
+        blob_path = _sharded('blobs', blob)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        added = 0
+        if os.path.exists(blob_path):
+            # Mesmo conteúdo já armazenado por outra URL
+            _unlink(self._tmp_path)
+            os.utime(blob_path)
+        else:
+            os.replace(self._tmp_path, blob_path)
+            added += self.size
+        meta = {
+            'url': self.url,
+            'blob': blob,
+            'size': self.size,
+            'content_type': self.headers.get('Content-Type'),
+            'etag': self.headers.get('ETag'),
+            'last_modified': self.headers.get('Last-Modified'),
+            'fresh_until': time.time() + self.lifetime,
+            'stored_at': time.time(),
+        }
+        index_path = _sharded('index', url_key(self.url), '.json')
+        new_index = not os.path.exists(index_path)
+        index_size = _write_json(index_path, meta)
+        # Um índice regravado ocupa praticamente o mesmo espaço
+        _account(added + (index_size if new_index else 0))
+        return CachedImage(self.url, meta)
+
+def open_writer(url, headers):
+    """Retorna um ImageWriter, ou None se a resposta não puder ser armazenada."""
+    if not enabled():
+        return None
+    lifetime = freshness_lifetime(headers)
+    if lifetime is None:
+        return None
+    try:
+        return ImageWriter(url, headers, lifetime)
+    except OSError as e:
+        logger.warning("Cache de imagens indisponível (%s): %s", _root(), e)
+        return None
+
+def store_bytes(key, data, content_type, lifetime):
+    """Armazena um corpo já em memória (ex.: variante convertida) sob a chave informada."""
+    writer = ImageWriter(key, {'Content-Type': content_type}, lifetime)
+    try:
+        writer.write(data)
+    except OSError:
+        writer.abort()
+        raise
+    return writer.commit()
+
+# --- LRU ---
+_usage_lock = threading.Lock()
+_usage_bytes = None
+# Bytes gravados enquanto a contagem inicial não terminou
+_pending_bytes = 0
+_scanning = False
+_evicting = False
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+def _scan():
+    """
+    Percorre o diretório do cache. Retorna ([(mtime, tamanho, caminho)] dos blobs,
+    bytes dos demais arquivos), apagando os temporários mais velhos que TMP_MAX_AGE.
+    """
+    root = _root()
+    blobs_dir = os.path.join(root, 'blobs')
+    tmp_dir = os.path.join(root, 'tmp')
+    stale_before = time.time() - TMP_MAX_AGE
+    blobs = []
+    sidecars = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (dirpath == tmp_dir or name.endswith('.tmp')) and st.st_mtime < stale_before:
+                _unlink(path)
+            elif os.path.dirname(dirpath) == blobs_dir:
+                blobs.append((st.st_mtime, st.st_size, path))
+            else:
+                sidecars += st.st_size
+    return blobs, sidecars
+
+def start_accounting():
+    """Conta o uso do disco numa thread, uma vez por processo, sem bloquear as requisições."""
+    global _scanning
+    with _usage_lock:
+        if _usage_bytes is not None or _scanning:
+            return
+        _scanning = True
+    threading.Thread(target=_count_usage, name='image-cache-scan', daemon=True).start()
+
+def _count_usage():
+    global _usage_bytes, _pending_bytes, _scanning
+    try:
+        blobs, sidecars = _scan()
+        with _usage_lock:
+            # Gravações durante a varredura podem ser contadas duas vezes; evict() corrige pelo disco
+            _usage_bytes = sum(size for _, size, _ in blobs) + sidecars + _pending_bytes
+            _pending_bytes = 0
+    finally:
+        _scanning = False
+    _maybe_evict()
+
+def _account(size):
+    """Soma os bytes gravados e dispara a remoção LRU se o orçamento estourar."""
+    global _usage_bytes, _pending_bytes
+    with _usage_lock:
+        counted = _usage_bytes is not None
+        if counted:
+            _usage_bytes += size
+        else:
+            _pending_bytes += size
+    if counted:
+        _maybe_evict()
+    else:
+        start_accounting()
+
+def _maybe_evict():
+    global _evicting
+    with _usage_lock:
+        if _usage_bytes is None or _usage_bytes <= _max_bytes() or _evicting:
+            return
+        _evicting = True
+    threading.Thread(target=evict, name='image-cache-evict', daemon=True).start()
+
+def _drop_index(removed):
+    """Apaga os índices que apontam para os blobs removidos; retorna os bytes liberados."""
+    freed = 0
+    for dirpath, _, filenames in os.walk(os.path.join(_root(), 'index')):
+        for name in filenames:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                with open(path) as f:
+                    blob = json.load(f).get('blob')
+                size = os.path.getsize(path)
+            except (OSError, ValueError):
+                continue
+            if blob in removed:
+                _unlink(path)
+                freed += size
+    return freed
+
+def evict():
+    """
+    Remove os blobs menos usados até o cache ficar abaixo de LOW_WATERMARK do orçamento.
+    Como outros workers também gravam no diretório, o uso é recalculado a partir do disco.
+    """
+    global _usage_bytes, _evicting
+    try:
+        blobs, sidecars = _scan()
+        total = sum(size for _, size, _ in blobs) + sidecars
+        target = _max_bytes() * LOW_WATERMARK
+        removed = set()
+        for _, size, path in sorted(blobs):
+            if total <= target:
+                break
+            _unlink(path)
+            total -= size
+            removed.add(os.path.basename(path))
+        if removed:
+            total -= _drop_index(removed)
+        with _usage_lock:
+            _usage_bytes = total
+    finally:
+        _evicting = False
@@ -0,0 +1,542 @@
+# gateway_service/api/image_proxy.py
+"""
+Núcleo do image_proxy: busca na origem com cache em disco (api/image_cache.py),
+revalidação condicional (ETag/Last-Modified), suporte a Range a partir do cache
+e variantes redimensionadas (api/image_transform.py).
+Usado pelas views síncronas e assíncronas.
+
+Num miss o corpo vindo da origem é gravado no cache em disco (ou, se a origem
+proibir armazenamento, num arquivo temporário) por uma thread no ritmo da
+origem, e o cliente lê o mesmo arquivo à medida que ele cresce: o primeiro
+byte sai sem esperar o download inteiro e um cliente lento não prende a
+conexão com a origem. Cada host de origem tem no máximo IMAGE_ORIGIN_MAX_CONCURRENCY
+downloads simultâneos por processo; quem não consegue um slot em
+IMAGE_ORIGIN_QUEUE_TIMEOUT segundos recebe a cópia em cache (se houver) ou
+OriginBusy, que as views transformam num 503 imediato. O pré-carregamento usa
+no máximo IMAGE_PREFETCH_ORIGIN_CONCURRENCY desses slots e nunca espera por um.
+"""
+
+import logging
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from . import image_cache, image_transform, prefetch, timing
+from .api_service import get_session
+from .resilience import KeyedLimiter
+
+IMAGE_PROXY_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+# Chunk usado quando o tamanho do corpo é desconhecido
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+logger = logging.getLogger(__name__)
+
+_origin_slots = KeyedLimiter()
+
+
+class OriginBusy(Exception):
+    """O host de origem atingiu o limite de downloads simultâneos."""
+
+    def __init__(self, host):
+        super().__init__(f"Origem {host} ocupada: limite de downloads simultâneos atingido.")
+        self.host = host
+
+
+def chunk_size_for(length):
+    """
+    Tamanho dos chunks para um corpo de `length` bytes: cerca de 1/4 do corpo,
+    entre IMAGE_PROXY_CHUNK_MIN e IMAGE_PROXY_CHUNK_MAX. Chunks maiores reduzem
+    as trocas de contexto por imagem; o limite superior mantém a memória por
+    download previsível.
+    """
+    minimum = getattr(settings, 'IMAGE_PROXY_CHUNK_MIN', 16 * 1024)
+    maximum = max(minimum, getattr(settings, 'IMAGE_PROXY_CHUNK_MAX', 256 * 1024))
+    if not length:
+        return max(minimum, min(maximum, DEFAULT_CHUNK_SIZE))
+    return max(minimum, min(maximum, length // 4))
+
+def resolve_image_url(original_url):
+    """Resolve URLs relativas do ExternalProvider. Retorna None se a base não estiver configurada."""
+    if original_url.startswith('/'):
+        external_provider_base_url = settings.EXTERNAL_PROVIDER_BASE_URL
+        if not external_provider_base_url:
+            return None
+        return urljoin(external_provider_base_url, original_url)
+    return original_url
+
+def parse_range(range_header, size):
+    """
+    Interpreta um cabeçalho Range de intervalo único.
+    Retorna (início, fim) inclusivo, None para ignorar o Range, ou False se for insatisfazível.
+    """
+    if not range_header:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        # Múltiplos intervalos ou unidade desconhecida: responde com o corpo inteiro
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def _read_range(f, start, length):
+    chunk_size = chunk_size_for(length)
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def serve_cached(entry, range_header=None, cache_status='HIT'):
+    """
+    Resposta a partir do blob em cache. O arquivo é aberto aqui, então um blob
+    removido pelo LRU depois do lookup() levanta FileNotFoundError antes de a
+    resposta começar.
+    """
+    byte_range = parse_range(range_header, entry.size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{entry.size}'
+    elif byte_range:
+        start, end = byte_range
+        body = open(entry.path, 'rb')
+        response = StreamingHttpResponse(_read_range(body, start, end - start + 1), status=206, content_type=entry.content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{entry.size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(open(entry.path, 'rb'), content_type=entry.content_type)
+        response.block_size = chunk_size_for(entry.size)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = entry.etag
+    if entry.meta.get('last_modified'):
+        response['Last-Modified'] = entry.meta['last_modified']
+    response['X-Cache'] = cache_status
+    return response
+
+def _content_length(headers):
+    """Content-Length da origem, se for o tamanho do corpo que será repassado."""
+    if headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        # requests descomprime o corpo: o tamanho repassado é outro
+        return None
+    try:
+        length = int(headers.get('Content-Length', ''))
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def _get(full_image_url, headers):
+    logger.debug("Buscando imagem na origem: %s", full_image_url)
+    response = get_session().get(full_image_url, stream=True, timeout=20, headers=headers)
+    if response.status_code != 304:
+        try:
+            response.raise_for_status()
+        except BaseException:
+            response.close()
+            raise
+    return response
+
+def _download(response, writer, spool_bytes):
+    """
+    Lê o corpo inteiro da origem para o cache (writer) ou, se a origem proibir
+    armazenamento, para um arquivo temporário (em memória até spool_bytes).
+    Retorna (CachedImage, None) ou (None, arquivo posicionado no início); se a
+    gravação no cache falhar, retorna (None, None).
+    """
+    chunks = response.iter_content(chunk_size=chunk_size_for(_content_length(response.headers)))
+    if writer is not None:
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+            return writer.commit(), None
+        except requests.exceptions.RequestException:
+            writer.abort()
+            raise
+        except OSError as e:
+            logger.warning("Falha ao gravar no cache de imagens: %s", e)
+            writer.abort()
+            return None, None
+        except BaseException:
+            writer.abort()
+            raise
+    body = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    try:
+        for chunk in chunks:
+            body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return None, body
+
+class _OriginTee:
+    """
+    Repassa ao cliente o corpo da origem enquanto uma thread o grava no cache
+    (writer) ou, se a origem proibir armazenamento, num arquivo temporário (em
+    memória até spool_bytes). O cliente lê o arquivo até onde a thread já
+    gravou. O slot do host é liberado quando o download termina, mesmo que o
+    cliente ainda esteja lendo; se o cliente desistir antes, o download segue
+    até o fim quando vai para o cache e é interrompido quando não vai.
+    """
+
+    def __init__(self, response, writer, release, spool_bytes):
+        self.length = _content_length(response.headers)
+        self.content_type = response.headers.get('Content-Type') or 'application/octet-stream'
+        self.cache_control = _forbidden_cache_control(response.headers)
+        self._response = response
+        self._writer = writer
+        self._release = release
+        self._chunk_size = chunk_size_for(self.length)
+        self._spool_bytes = spool_bytes
+        # O writer grava pelo seu próprio descritor; sem writer o arquivo é um só
+        self._file = writer.open_reader() if writer is not None else tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self._file_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._written = 0
+        self._read = 0
+        self._done = False
+        self._closed = False
+        self._error = None
+        threading.Thread(target=self._download, name='image-origin', daemon=True).start()
+
+    def _append(self, chunk):
+        with self._file_lock:
+            if self._writer is not None:
+                try:
+                    self._writer.write(chunk)
+                    self._writer.flush()
+                except OSError as e:
+                    logger.warning("Falha ao gravar no cache de imagens: %s", e)
+                    self._spill()
+            if self._writer is None:
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(chunk)
+        with self._cond:
+            self._written += len(chunk)
+            self._cond.notify_all()
+
+    def _spill(self):
+        """O cache não aceitou a gravação: segue num arquivo temporário só para este cliente."""
+        spool = tempfile.SpooledTemporaryFile(max_size=self._spool_bytes)
+        self._file.seek(0)
+        spool.write(self._file.read(self._written))
+        self._file.close()
+        self._writer.abort()
+        self._writer = None
+        self._file = spool
+
+    def _download(self):
+        try:
+            for chunk in self._response.iter_content(chunk_size=self._chunk_size):
+                if self._closed and self._writer is None:
+                    # Cliente foi embora e nada vai para o cache
+                    break
+                self._append(chunk)
+            if self._writer is not None:
+                try:
+                    self._writer.commit()
+                except OSError as e:
+                    # O corpo já está inteiro no arquivo que o cliente lê
+                    logger.warning("Falha ao gravar no cache de imagens: %s", e)
+                    self._writer.abort()
+        except Exception as e:
+            if self._writer is not None:
+                self._writer.abort()
+            logger.warning("Falha no download da imagem (%s): %s", self._response.url, e)
+            self._error = e
+        finally:
+            self._response.close()
+            self._release()
+            with self._cond:
+                self._done = True
+                close_file = self._closed
+                self._cond.notify_all()
+            if close_file:
+                self._file.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._cond:
+            while self._read >= self._written and not self._done:
+                self._cond.wait()
+            available = self._written - self._read
+        if available <= 0:
+            if self._error is not None:
+                # Cabeçalhos já enviados: só resta interromper o corpo
+                raise self._error
+            raise StopIteration
+        with self._file_lock:
+            self._file.seek(self._read)
+            chunk = self._file.read(min(available, self._chunk_size))
+        self._read += len(chunk)
+        return chunk
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            close_file = self._done
+        if close_file:
+            self._file.close()
+
+def _tee_response(tee):
+    response = StreamingHttpResponse(tee, content_type=tee.content_type)
+    if tee.length is not None:
+        response['Content-Length'] = str(tee.length)
+    response['X-Cache'] = 'MISS'
+    if tee.cache_control:
+        # Definido pela view, prevalece sobre o API_CACHE_CONTROL da rota
+        response['Cache-Control'] = tee.cache_control
+    return response
+
+def _fetch_origin(full_image_url, queue_timeout=None, max_slots=None, spool_bytes=None, stream=False):
+    """
+    Consulta o cache e, se preciso, a origem (com GET condicional).
+    Retorna (entry, spooled, cache_status): spooled é (arquivo, content type,
+    Cache-Control a repassar ou None) quando a resposta não foi para o cache;
+    senão serve-se a entry do cache. Com stream=True um download da origem
+    devolve um _OriginTee no lugar de spooled, sem esperar o corpo.
+    O slot do host só fica ocupado durante o download, nunca enquanto o
+    cliente lê a resposta. Levanta OriginBusy se o host não liberar um slot a
+    tempo e não houver cópia em cache.
+    """
+    entry = image_cache.lookup(full_image_url) if image_cache.enabled() else None
+    if entry and entry.is_fresh():
+        entry.touch()
+        return entry, None, 'HIT'
+
+    release = _acquire_origin(full_image_url, queue_timeout, max_slots)
+    if release is None:
+        if entry:
+            # Origem sobrecarregada: a cópia antiga é melhor que esperar na fila
+            return entry, None, 'STALE'
+        raise OriginBusy(urlsplit(full_image_url).netloc)
+
+    if spool_bytes is None:
+        spool_bytes = getattr(settings, 'IMAGE_PROXY_SPOOL_BYTES', 1024 ** 2)
+    headers = dict(IMAGE_PROXY_HEADERS)
+    if entry:
+        headers.update(entry.validators())
+    try:
+        with timing.phase('origin'):
+            response = _get(full_image_url, headers)
+            if entry and response.status_code == 304:
+                response.close()
+                entry.revalidated(response.headers)
+                return entry, None, 'REVALIDATED'
+            if stream:
+                try:
+                    tee = _OriginTee(response, image_cache.open_writer(full_image_url, response.headers), release, spool_bytes)
+                except BaseException:
+                    response.close()
+                    raise
+                # O slot agora é do tee, que o libera ao fim do download
+                release = None
+                return None, tee, 'MISS'
+            try:
+                stored, body = _download(response, image_cache.open_writer(full_image_url, response.headers), spool_bytes)
+            finally:
+                response.close()
+            if stored is None and body is None:
+                # O cache não aceitou a gravação: baixa de novo só para esta resposta
+                response = _get(full_image_url, IMAGE_PROXY_HEADERS)
+                try:
+                    _, body = _download(response, None, spool_bytes)
+                finally:
+                    response.close()
+    except requests.exceptions.RequestException:
+        if entry:
+            # stale-if-error: a cópia antiga é melhor que um 502
+            return entry, None, 'STALE'
+        raise
+    finally:
+        if release is not None:
+            release()
+    if stored is not None:
+        return stored, None, 'MISS'
+    return None, (body, response.headers.get('Content-Type'), _forbidden_cache_control(response.headers)), 'MISS'
+
+def _forbidden_cache_control(headers):
+    """
+    Cache-Control da origem quando ela proíbe armazenamento (no-store/private),
+    para que a política pública da rota não valha para essa imagem; senão None.
+    """
+    if image_cache.freshness_lifetime(headers) is not None:
+        return None
+    return headers.get('Cache-Control')
+
+def _acquire_origin(full_image_url, queue_timeout=None, max_slots=None):
+    """
+    Ocupa um slot do host da URL. Retorna a função que o libera, ou None se o
+    host continuar no limite depois de queue_timeout segundos (padrão:
+    IMAGE_ORIGIN_QUEUE_TIMEOUT). Com max_slots, só consegue o slot enquanto o
+    host tiver menos que max_slots downloads em andamento, deixando o restante
+    do limite para as outras chamadas.
+    """
+    limit = getattr(settings, 'IMAGE_ORIGIN_MAX_CONCURRENCY', 8)
+    if max_slots is not None and max_slots > 0:
+        limit = min(limit, max_slots) if limit > 0 else max_slots
+    if limit <= 0:
+        return lambda: None
+    if queue_timeout is None:
+        queue_timeout = getattr(settings, 'IMAGE_ORIGIN_QUEUE_TIMEOUT', 1.0)
+    host = urlsplit(full_image_url).netloc
+    if not _origin_slots.acquire(host, limit, queue_timeout):
+        return None
+    return lambda: _origin_slots.release(host)
+
+def ensure_cached(full_image_url, queue_timeout=None, max_slots=None):
+    """
+    Garante o original no cache de disco (baixando ou revalidando se preciso)
+    e retorna a CachedImage, ou None se a origem proibir armazenamento.
+    """
+    entry, spooled, _ = _fetch_origin(full_image_url, queue_timeout, max_slots)
+    if spooled is not None:
+        spooled[0].close()
+    return entry
+
+def prefetch_original(full_image_url):
+    """
+    ensure_cached para o pré-carregamento: não espera na fila e ocupa no máximo
+    IMAGE_PREFETCH_ORIGIN_CONCURRENCY slots do host, para não tirar vagas do
+    tráfego interativo. Com o host ocupado a página é pulada (o cliente a busca
+    pelo image_proxy).
+    """
+    try:
+        return ensure_cached(full_image_url, queue_timeout=0, max_slots=getattr(settings, 'IMAGE_PREFETCH_ORIGIN_CONCURRENCY', 2))
+    except OriginBusy:
+        return None
+
+def open_original(full_image_url, queue_timeout=None):
+    """
+    Abre o original para leitura: do cache de disco ou, se a origem proibir
+    armazenamento, de um arquivo temporário (em memória até
+    CHAPTER_ARCHIVE_SPOOL_BYTES). Retorna (arquivo, content type); quem chama
+    fecha o arquivo.
+    """
+    prefetch.join(full_image_url)
+    spool_bytes = getattr(settings, 'CHAPTER_ARCHIVE_SPOOL_BYTES', 1024 ** 2)
+    entry, spooled, _ = _fetch_origin(full_image_url, queue_timeout, spool_bytes=spool_bytes)
+    if spooled is not None:
+        return spooled[:2]
+    try:
+        # O descritor aberto mantém o arquivo legível mesmo se o LRU o remover
+        return open(entry.path, 'rb'), entry.content_type
+    except FileNotFoundError:
+        # Removido pelo LRU depois do lookup(): baixa de novo como miss
+        entry, spooled, _ = _fetch_origin(full_image_url, queue_timeout, spool_bytes=spool_bytes)
+        return spooled[:2] if spooled else (open(entry.path, 'rb'), entry.content_type)
+
+def _proxy_variant(full_image_url, range_header, variant):
+    original = ensure_cached(full_image_url)
+    if original is None:
+        return None
+    key = variant.key(original.meta['blob'])
+    cached = image_cache.lookup(key)
+    if cached:
+        cached.touch()
+        try:
+            return serve_cached(cached, range_header)
+        except FileNotFoundError:
+            # Variante removida pelo LRU depois do lookup(): converte de novo
+            pass
+
+    result = image_transform.transcode(key, original.path, variant)
+    if result is None:
+        # Fila de conversão cheia ou imagem não convertível: serve o original
+        return serve_cached(original, range_header)
+    data, content_type = result
+    try:
+        # A chave inclui o hash do original, então a variante nunca fica desatualizada
+        converted = image_cache.store_bytes(key, data, content_type, getattr(settings, 'IMAGE_VARIANT_TTL', 30 * 86400))
+    except OSError as e:
+        logger.warning("Falha ao gravar no cache de imagens: %s", e)
+        return HttpResponse(data, content_type=content_type)
+    return serve_cached(converted, range_header, cache_status='MISS')
+
+def proxy_image(full_image_url, range_header=None, variant=None):
+    """
+    Retorna a resposta do proxy para a imagem. Levanta RequestException se a
+    origem falhar, ou OriginBusy se estiver sobrecarregada, e não houver cópia
+    em cache para servir.
+    """
+    # Se a imagem está sendo pré-carregada, aguarda o download em vez de repeti-lo
+    prefetch.join(full_image_url)
+    if variant and image_cache.enabled():
+        try:
+            response = _proxy_variant(full_image_url, range_header, variant)
+        except FileNotFoundError:
+            # O original sumiu do cache no meio da conversão: segue sem variante
+            response = None
+        if response is not None:
+            # A variante depende do Accept (AVIF/WebP)
+            response['Vary'] = 'Accept'
+            return response
+
+    # Com Range, o miss é baixado inteiro para servir o trecho pedido do disco
+    stream = not range_header
+    entry, spooled, cache_status = _fetch_origin(full_image_url, stream=stream)
+    if spooled is None:
+        try:
+            return serve_cached(entry, range_header, cache_status=cache_status)
+        except FileNotFoundError:
+            # O LRU removeu o blob entre o lookup() e a abertura: segue como miss
+            entry, spooled, cache_status = _fetch_origin(full_image_url, stream=stream)
+            if spooled is None:
+                return serve_cached(entry, range_header, cache_status=cache_status)
+    if isinstance(spooled, _OriginTee):
+        return _tee_response(spooled)
+
+    body, content_type, cache_control = spooled
+    response = FileResponse(body, content_type=content_type)
+    response.block_size = chunk_size_for(int(response.get('Content-Length', 0)))
+    response['X-Cache'] = 'MISS'
+    if cache_control:
+        # Definido pela view, prevalece sobre o API_CACHE_CONTROL da rota
+        response['Cache-Control'] = cache_control
+    return response
+
+async def _aiter_sync(iterator):
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    sentinel = object()
+    while True:
+        chunk = await next_chunk(iterator, sentinel)
+        if chunk is sentinel:
+            break
+        yield chunk
+
+async def aproxy_image(full_image_url, range_header=None, variant=None):
+    """
+    Versão para as views assíncronas: o acesso ao disco e à origem roda em
+    threads e o corpo é consumido de forma assíncrona, sem bloquear o event loop.
+    """
+    response = await sync_to_async(proxy_image, thread_sensitive=False)(full_image_url, range_header, variant)
+    if response.streaming:
+        response.streaming_content = _aiter_sync(response.streaming_content)
+    return response
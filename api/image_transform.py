@@ -0,0 +1,177 @@
+# gateway_service/api/image_transform.py
+"""
+Redimensionamento e conversão de formato das imagens do image_proxy.
+
+Os parâmetros w (largura) e q (qualidade) são arredondados para valores fixos
+para limitar o número de variantes. O formato de saída (AVIF/WebP) é negociado
+pelo cabeçalho Accept. A conversão roda num pool limitado de threads e cada
+variante fica no cache de disco, indexada pelo hash do original.
+"""
+
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Import condicional do Pillow
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_WIDTHS = (96, 150, 200, 300, 450, 600, 900, 1200)
+CONTENT_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.RLock()
+
+
+def available():
+    return Image is not None and getattr(settings, 'IMAGE_TRANSFORM_ENABLED', True)
+
+def _supports(fmt):
+    Image.init()
+    return f'.{fmt.lower()}' in Image.registered_extensions()
+
+
+class ImageVariant:
+    """Variante pedida pelo cliente: largura máxima, qualidade e formato de saída."""
+
+    def __init__(self, width=None, quality=None, fmt=None):
+        self.width = width
+        self.quality = quality
+        self.format = fmt
+
+    def key(self, original_blob):
+        return f"variant:{original_blob}:w={self.width}:q={self.quality}:f={self.format}"
+
+
+def _snap_width(width):
+    widths = sorted(getattr(settings, 'IMAGE_RESIZE_WIDTHS', DEFAULT_WIDTHS))
+    for allowed in widths:
+        if width <= allowed:
+            return allowed
+    return widths[-1]
+
+def _accept_qualities(header):
+    """Mapeia cada tipo do Accept para o seu q."""
+    qualities = {}
+    for part in header.split(','):
+        media_type, *params = part.split(';')
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[media_type] = q
+    return qualities
+
+def negotiate_format(accept_header):
+    """
+    Retorna 'AVIF', 'WEBP' ou None (mantém o formato do original). Só conta o
+    tipo citado explicitamente com q > 0; no empate o AVIF tem preferência.
+    """
+    qualities = _accept_qualities(accept_header or '')
+    best, best_q = None, 0.0
+    for fmt in ('AVIF', 'WEBP'):
+        q = qualities.get(f'image/{fmt.lower()}', 0.0)
+        if q > best_q and _supports(fmt.lower()):
+            best, best_q = fmt, q
+    return best
+
+def parse_variant(params, accept_header):
+    """
+    Lê w/q da query string. Retorna None se nenhuma transformação foi pedida
+    (ou se o Pillow não estiver instalado) e levanta ValueError para valores inválidos.
+    """
+    width, quality = params.get('w'), params.get('q')
+    if not (width or quality) or not available():
+        return None
+    width = int(width) if width else None
+    if width is not None and width <= 0:
+        raise ValueError("O parâmetro 'w' deve ser positivo.")
+    if quality:
+        quality = int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError("O parâmetro 'q' deve estar entre 1 e 100.")
+        quality = max(5, round(quality / 5) * 5)
+    else:
+        quality = getattr(settings, 'IMAGE_DEFAULT_QUALITY', 80)
+    return ImageVariant(_snap_width(width) if width else None, quality, negotiate_format(accept_header))
+
+def _transcode(path, variant):
+    """Retorna (bytes, content_type) ou None se a imagem não deve ser convertida (ex.: GIF animado)."""
+    with Image.open(path) as im:
+        if getattr(im, 'is_animated', False):
+            return None
+        fmt = variant.format or (im.format if im.format in CONTENT_TYPES else 'JPEG')
+        if variant.width and im.width > variant.width:
+            height = max(1, round(im.height * variant.width / im.width))
+            # Para JPEG o draft decodifica já em escala reduzida
+            im.draft('RGB', (variant.width, height))
+            im = im.resize((variant.width, height), Image.LANCZOS)
+        if fmt == 'JPEG' and im.mode not in ('RGB', 'L'):
+            im = im.convert('RGB')
+        elif im.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            im = im.convert('RGBA')
+        out = io.BytesIO()
+        options = {'quality': variant.quality}
+        if fmt == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif fmt == 'PNG':
+            options = {'optimize': True}
+        im.save(out, fmt, **options)
+        return out.getvalue(), CONTENT_TYPES[fmt]
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'IMAGE_TRANSFORM_WORKERS', 2)
+                _slots = threading.BoundedSemaphore(workers + getattr(settings, 'IMAGE_TRANSFORM_QUEUE', 8))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-transform')
+    return _executor, _slots
+
+def _run(path, variant, slots):
+    try:
+        return _transcode(path, variant)
+    finally:
+        slots.release()
+
+def transcode(key, path, variant):
+    """
+    Converte a imagem no pool limitado. Pedidos simultâneos da mesma variante
+    aguardam a mesma conversão. Retorna None se a fila estiver cheia, se a
+    conversão falhar ou se a imagem não deve ser convertida: o chamador serve o original.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            executor, slots = _pool()
+            if not slots.acquire(blocking=False):
+                return None
+            future = _inflight[key] = executor.submit(_run, path, variant, slots)
+            future.add_done_callback(lambda _: _pop_inflight(key))
+    try:
+        return future.result(timeout=getattr(settings, 'IMAGE_TRANSFORM_TIMEOUT', 15))
+    except Exception as e:
+        logger.warning("Falha ao converter imagem (%s): %s", key, e)
+        return None
+
+def _pop_inflight(key):
+    with _inflight_lock:
+        _inflight.pop(key, None)
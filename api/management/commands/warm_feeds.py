@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import feeds
+
+
+class Command(BaseCommand):
+    help = "Aquece os feeds POPULAR e LATEST de cada fonte no cache de respostas (ver api/feeds.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Repete a cada FEED_WARM_INTERVAL segundos (com jitter) em vez de fazer uma só rodada.",
+        )
+        parser.add_argument('--concurrency', type=int, help="Chamadas simultâneas ao upstream (padrão: FEED_WARM_CONCURRENCY).")
+        parser.add_argument(
+            '--provider', action='append', dest='providers', metavar='ID',
+            help="Aquece só esta fonte (pode ser repetido; padrão: FEED_WARM_PROVIDERS ou todas).",
+        )
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+        if 'locmem' in settings.CACHES[alias]['BACKEND']:
+            self.stderr.write(self.style.WARNING(
+                "O cache de respostas é local deste processo: os feeds aquecidos aqui não chegam aos workers. "
+                "Defina REDIS_URL ou use FEED_WARM_IN_PROCESS."
+            ))
+        if not options['loop']:
+            feeds.warm(concurrency=options['concurrency'], providers=options['providers'])
+            return
+        try:
+            feeds.run(concurrency=options['concurrency'], providers=options['providers'])
+        except KeyboardInterrupt:
+            feeds.stop()
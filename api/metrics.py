@@ -0,0 +1,165 @@
+# gateway_service/api/metrics.py
+"""
+Métricas no formato de texto do Prometheus, expostas em /api/v1/metrics/.
+
+* duração das chamadas ao ExternalProvider por operação GraphQL e URL
+  (primary = EXTERNAL_PROVIDER_API_URL, secondary = _URL_2);
+* erros por classe, failover para a URL seguinte e chamadas recusadas
+  (circuit breaker aberto, fila do limite de concorrência cheia ou esgotada,
+  orçamento de tempo esgotado);
+* bytes e duração do image-proxy por status do cache;
+* acertos e falhas dos caches de respostas e de imagens.
+
+Com vários workers do gunicorn, defina PROMETHEUS_MULTIPROC_DIR: cada processo
+grava os seus valores em arquivos mmap nesse diretório e o endpoint soma todos
+(ver gunicorn.conf.py). Sem o prometheus_client instalado as funções de
+registro não fazem nada.
+"""
+
+import os
+import time
+
+from django.conf import settings
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - dependência opcional
+    Counter = None
+
+UPSTREAM_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+IMAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+if Counter is not None:
+    UPSTREAM_DURATION = Histogram(
+        'gateway_upstream_request_duration_seconds', 'Duração de cada tentativa ao ExternalProvider.',
+        ['operation', 'upstream', 'outcome'], buckets=UPSTREAM_BUCKETS,
+    )
+    UPSTREAM_ERRORS = Counter(
+        'gateway_upstream_errors', 'Tentativas ao ExternalProvider que falharam, por classe de erro.',
+        ['operation', 'upstream', 'error'],
+    )
+    UPSTREAM_FAILOVERS = Counter(
+        'gateway_upstream_failovers', 'Tentativas disparadas na URL seguinte e o motivo.',
+        ['operation', 'reason'],
+    )
+    UPSTREAM_REJECTED = Counter(
+        'gateway_upstream_rejected', 'Chamadas que não chegaram (ou não terminaram) no ExternalProvider.',
+        ['operation', 'reason'],
+    )
+    IMAGE_BYTES = Counter('gateway_image_proxy_bytes', 'Bytes enviados pelo image-proxy.', ['cache'])
+    IMAGE_DURATION = Histogram(
+        'gateway_image_proxy_duration_seconds', 'Duração das respostas do image-proxy até o último byte.',
+        ['cache'], buckets=IMAGE_BUCKETS,
+    )
+    IMAGE_ERRORS = Counter('gateway_image_proxy_errors', 'Falhas do image-proxy ao buscar a origem.', ['error'])
+    CACHE_REQUESTS = Counter('gateway_cache_requests', 'Consultas aos caches do gateway.', ['cache', 'result'])
+
+def enabled():
+    return Counter is not None and getattr(settings, 'METRICS_ENABLED', True)
+
+# Filhos (métrica + labels) já resolvidos. labels() trava a métrica a cada chamada;
+# o dicionário evita isso no caminho comum (get/set de dict são atômicos no CPython).
+_children = {}
+
+def _child(metric, *labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+def error_class(error):
+    """Classe do erro para o label `error`: http_4xx/http_5xx, timeout, connection, invalid_response ou transport."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status and status >= 400:
+        return f'http_{status // 100}xx'
+    names = [cls.__name__ for cls in type(error).__mro__]
+    if any('Timeout' in name for name in names):
+        return 'timeout'
+    if 'ConnectionError' in names or 'ConnectError' in names:
+        return 'connection'
+    if isinstance(error, ValueError):
+        return 'invalid_response'
+    return 'transport'
+
+def observe_upstream(operation, upstream, started, error=None, graphql_errors=False):
+    """Registra uma tentativa; started é o time.monotonic() do início."""
+    if not enabled():
+        return
+    if error is not None:
+        outcome = 'error'
+        _child(UPSTREAM_ERRORS, operation, upstream, error_class(error)).inc()
+    elif graphql_errors:
+        outcome = 'graphql_error'
+        _child(UPSTREAM_ERRORS, operation, upstream, 'graphql').inc()
+    else:
+        outcome = 'ok'
+    _child(UPSTREAM_DURATION, operation, upstream, outcome).observe(time.monotonic() - started)
+
+def count_failover(operation, reason):
+    if enabled():
+        _child(UPSTREAM_FAILOVERS, operation, reason).inc()
+
+def count_rejected(operation, reason):
+    if enabled():
+        _child(UPSTREAM_REJECTED, operation, reason).inc()
+
+def count_cache(cache, result):
+    if enabled():
+        _child(CACHE_REQUESTS, cache, result).inc()
+
+def count_image_error(error):
+    """error: a exceção da requisição à origem, ou já a classe (ex.: 'origin_busy')."""
+    if enabled():
+        _child(IMAGE_ERRORS, error if isinstance(error, str) else error_class(error)).inc()
+
+def _observe_image(cache, started, size):
+    _child(IMAGE_BYTES, cache).inc(size)
+    _child(IMAGE_DURATION, cache).observe(time.monotonic() - started)
+
+def _count_stream(chunks, cache, started):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _observe_image(cache, started, size)
+
+async def _acount_stream(chunks, cache, started):
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _observe_image(cache, started, size)
+
+def track_image_response(response, started):
+    """
+    Contabiliza a resposta do image-proxy: status do cache (X-Cache), bytes e
+    duração. Em respostas em streaming a medida é feita quando o corpo termina.
+    """
+    if not enabled():
+        return response
+    cache = response.get('X-Cache', 'NONE')
+    if cache != 'NONE':
+        count_cache('image', cache.lower())
+    if not response.streaming:
+        _observe_image(cache, started, len(response.content))
+    elif response.is_async:
+        response.streaming_content = _acount_stream(response.streaming_content, cache, started)
+    else:
+        response.streaming_content = _count_stream(response.streaming_content, cache, started)
+    return response
+
+def render():
+    """Retorna (corpo, content type) da exposição, somando os workers no modo multiprocesso."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,292 @@
+# gateway_service/api/middleware.py
+"""
+Middlewares HTTP da API: compressão gzip/brotli, cache HTTP (ETag/304 e
+Cache-Control por rota), rate limiting por custo de rota, Server-Timing e
+profiling amostrado.
+
+Compressão: codificação escolhida pelo Accept-Encoding.
+Só comprime os tipos em COMPRESSION_CONTENT_TYPES (JSON/NDJSON por padrão;
+imagens já vêm comprimidas) e corpos a partir de COMPRESSION_MIN_SIZE bytes.
+Respostas em streaming (NDJSON) são comprimidas pedaço a pedaço, com flush a
+cada pedaço para que o cliente receba cada linha assim que ela é gerada.
+"""
+
+import hashlib
+import time
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import profiling, ratelimit, timing
+from .renderers import FastJsonResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+DEFAULT_CONTENT_TYPES = ('application/json', 'application/x-ndjson')
+
+def _encoding_qualities(header):
+    """Mapeia cada codificação do Accept-Encoding para o seu q."""
+    qualities = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+    return qualities
+
+def negotiate_encoding(header):
+    """Retorna 'br', 'gzip' ou None para o Accept-Encoding do cliente."""
+    qualities = _encoding_qualities(header or '')
+    wildcard = qualities.get('*', 0.0)
+    if brotli is not None and qualities.get('br', wildcard) > 0:
+        return 'br'
+    if qualities.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """Compressor incremental com a mesma interface para gzip e brotli."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+        else:
+            # wbits=31: formato gzip
+            self._compressor = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+def compress_bytes(data, encoding):
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+def _compress_stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+async def _acompress_stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Variante do GZipMiddleware do Django com brotli, filtro por tipo e tamanho mínimo."""
+
+    def _compressible(self, response):
+        if response.has_header('Content-Encoding') or response.status_code == 206:
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return content_type in getattr(settings, 'COMPRESSION_CONTENT_TYPES', DEFAULT_CONTENT_TYPES)
+
+    def process_response(self, request, response):
+        if not self._compressible(response):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = _compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            compressed = compress_bytes(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # O ETag forte deixa de valer para o corpo comprimido (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class HttpCachingMiddleware(MiddlewareMixin):
+    """
+    Validadores e política de cache HTTP por rota (API_CACHE_CONTROL, chave =
+    nome da URL). Para respostas 200 de GET/HEAD dessas rotas:
+
+    * ETag forte a partir do corpo serializado, se a view não definiu um
+      (respostas em streaming só usam o ETag da própria view, ex.: image-proxy);
+    * 304 quando o If-None-Match do cliente confere;
+    * Cache-Control da rota, salvo se a view já definiu o seu.
+
+    Fica abaixo do CompressionMiddleware, então o ETag é calculado sobre o
+    corpo sem compressão e não depende do Accept-Encoding.
+    """
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        policy = getattr(settings, 'API_CACHE_CONTROL', {}).get(match.url_name) if match else None
+        if policy is None:
+            return response
+
+        if not response.has_header('Cache-Control'):
+            response.headers['Cache-Control'] = policy
+        if 'no-store' in response['Cache-Control']:
+            return response
+        if not response.streaming and not response.has_header('ETag'):
+            response.headers['ETag'] = f'"{hashlib.sha1(response.content).hexdigest()}"'
+        if not response.has_header('ETag'):
+            return response
+        conditional = get_conditional_response(request, etag=response['ETag'], response=response)
+        if conditional is not response:
+            # Libera o corpo descartado (ex.: arquivo aberto pelo FileResponse do image-proxy)
+            response.close()
+        return conditional
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Token bucket por cliente (api/ratelimit.py) nas rotas de RATE_LIMIT_COSTS.
+    Responde 429 com Retry-After quando o balde não tem fichas para o custo da rota.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not ratelimit.enabled():
+            return None
+        cost = ratelimit.route_cost(request.resolver_match.url_name)
+        if cost is None:
+            return None
+        result = ratelimit.take(ratelimit.client_key(request), cost, request.resolver_match.url_name)
+        request.rate_limit = result
+        if result.allowed:
+            return None
+        response = FastJsonResponse(
+            {"error": f"Limite de requisições excedido. Tente novamente em {result.retry_after} s."}, status=429
+        )
+        response.headers['Retry-After'] = str(result.retry_after)
+        return response
+
+    def process_response(self, request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response.headers['X-RateLimit-Remaining'] = str(result.remaining)
+        return response
+
+
+class _WrappingMiddleware:
+    """Base dos middlewares que envolvem a requisição inteira, sob WSGI ou ASGI."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class ServerTimingMiddleware(_WrappingMiddleware):
+    """
+    Cabeçalho Server-Timing com o tempo por fase (api/timing.py). Fica no topo
+    da lista para que `total` cubra os demais middlewares. Em respostas em
+    streaming os tempos vão até o envio dos cabeçalhos.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not timing.enabled():
+            return self.get_response(request)
+        timings, token = timing.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        timing.annotate(response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not timing.enabled():
+            return await self.get_response(request)
+        timings, token = timing.start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        timing.annotate(response, timings, time.perf_counter() - started)
+        return response
+
+
+class ProfilingMiddleware(_WrappingMiddleware):
+    """Roda as requisições sorteadas (ou marcadas com X-Profile) sob o cProfile (api/profiling.py)."""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiler = profiling.start() if profiling.should_profile(request) else None
+        if profiler is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile_id = profiling.stop(profiler, request, time.perf_counter() - started)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    async def __acall__(self, request):
+        profiler = profiling.start() if profiling.should_profile(request) else None
+        if profiler is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile_id = profiling.stop(profiler, request, time.perf_counter() - started)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
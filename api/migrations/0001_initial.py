@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Provider',
+            fields=[
+                ('id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, null=True)),
+                ('lang', models.CharField(max_length=16, null=True)),
+                ('icon_url', models.TextField(null=True)),
+                ('is_nsfw', models.BooleanField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Manga',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.TextField(null=True)),
+                ('author', models.TextField(null=True)),
+                ('artist', models.TextField(null=True)),
+                ('description', models.TextField(null=True)),
+                ('status', models.CharField(max_length=32, null=True)),
+                ('genres', models.JSONField(default=list)),
+                ('thumbnail_url', models.TextField(null=True)),
+                ('details_synced_at', models.DateTimeField(null=True)),
+                ('chapters_synced_at', models.DateTimeField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mangas', to='api.provider')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Chapter',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('position', models.PositiveIntegerField()),
+                ('name', models.TextField(null=True)),
+                ('chapter_number', models.FloatField(null=True)),
+                ('scanlator', models.TextField(null=True)),
+                ('uploaded_at', models.CharField(max_length=32, null=True)),
+                ('manga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chapters', to='api.manga')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['manga', 'position'], name='api_chapter_manga_position')],
+            },
+        ),
+    ]
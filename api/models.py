@@ -1,3 +1,53 @@
 from django.db import models
 
-# Create your models here.
+
+# Espelho do catálogo do ExternalProvider (ver api/catalog.py). As chaves
+# primárias são os ids do próprio ExternalProvider.
+
+class Provider(models.Model):
+    id = models.CharField(primary_key=True, max_length=64)
+    name = models.CharField(max_length=255, null=True)
+    lang = models.CharField(max_length=16, null=True)
+    icon_url = models.TextField(null=True)
+    is_nsfw = models.BooleanField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name or self.id
+
+
+class Manga(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, null=True, related_name='mangas')
+    title = models.TextField(null=True)
+    author = models.TextField(null=True)
+    artist = models.TextField(null=True)
+    description = models.TextField(null=True)
+    status = models.CharField(max_length=32, null=True)
+    genres = models.JSONField(default=list)
+    thumbnail_url = models.TextField(null=True)
+    # Última gravação dos detalhes completos e da lista completa de capítulos;
+    # None enquanto o mangá só foi visto em buscas
+    details_synced_at = models.DateTimeField(null=True)
+    chapters_synced_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title or str(self.id)
+
+
+class Chapter(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='chapters')
+    # Posição na lista do ExternalProvider (ordem da fonte, mais recente primeiro)
+    position = models.PositiveIntegerField()
+    name = models.TextField(null=True)
+    chapter_number = models.FloatField(null=True)
+    scanlator = models.TextField(null=True)
+    uploaded_at = models.CharField(max_length=32, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['manga', 'position'], name='api_chapter_manga_position')]
+
+    def __str__(self):
+        return self.name or str(self.id)
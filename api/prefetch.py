@@ -0,0 +1,97 @@
+# gateway_service/api/prefetch.py
+"""
+Pré-carregamento em segundo plano das páginas de capítulo no cache de imagens.
+
+get_chapter_pages agenda as primeiras N páginas num pool limitado. Quando o
+cliente pede a mesma URL ao image_proxy enquanto o download ainda está em
+andamento, join() espera por ele em vez de abrir outra conexão com a origem.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from . import image_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.RLock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_PREFETCH_WORKERS', 4),
+                    thread_name_prefix='image-prefetch',
+                )
+    return _executor
+
+def pages_to_prefetch(requested):
+    """
+    Quantidade de páginas a pré-carregar: o parâmetro ?prefetch= do cliente
+    (limitado a IMAGE_PREFETCH_MAX_PAGES) ou IMAGE_PREFETCH_PAGES.
+    """
+    if requested in (None, ''):
+        return getattr(settings, 'IMAGE_PREFETCH_PAGES', 0)
+    try:
+        requested = int(requested)
+    except ValueError:
+        return 0
+    return max(0, min(requested, getattr(settings, 'IMAGE_PREFETCH_MAX_PAGES', 20)))
+
+def _run(url, fetch):
+    try:
+        fetch(url)
+    except Exception as e:
+        logger.warning("Falha no pré-carregamento da imagem (%s): %s", url, e)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(url, None)
+
+def schedule(urls, fetch):
+    """
+    Agenda fetch(url) para cada URL ainda fora do cache, na ordem recebida.
+    URLs além de IMAGE_PREFETCH_QUEUE downloads pendentes são ignoradas.
+    Retorna quantas foram agendadas.
+    """
+    if not image_cache.enabled():
+        return 0
+    max_pending = getattr(settings, 'IMAGE_PREFETCH_QUEUE', 64)
+    scheduled = 0
+    for url in urls:
+        if not url:
+            continue
+        entry = image_cache.lookup(url)
+        if entry and entry.is_fresh():
+            continue
+        with _inflight_lock:
+            if url in _inflight:
+                continue
+            if len(_inflight) >= max_pending:
+                break
+            _inflight[url] = _pool().submit(_run, url, fetch)
+        scheduled += 1
+    return scheduled
+
+def join(url, timeout=None):
+    """
+    Espera o pré-carregamento em andamento da URL, se houver.
+    Retorna True se havia um download para aguardar.
+    """
+    with _inflight_lock:
+        future = _inflight.get(url)
+    if future is None:
+        return False
+    try:
+        future.result(timeout=timeout if timeout is not None else getattr(settings, 'IMAGE_PREFETCH_JOIN_TIMEOUT', 20))
+    except FutureTimeoutError:
+        pass
+    return True
@@ -0,0 +1,80 @@
+# gateway_service/api/profiling.py
+"""
+Profiling amostrado de requisições com o cProfile.
+
+Uma fração PROFILING_SAMPLE_RATE das requisições, ou qualquer requisição com o
+cabeçalho X-Profile igual a PROFILING_TOKEN, roda sob o cProfile. O resultado
+é gravado em PROFILING_DIR como <data>-<pid>-<rota>-<ms>.prof, mantendo os
+PROFILING_MAX_FILES mais recentes, e o nome volta no cabeçalho X-Profile-Id.
+Inspeção: python -m pstats <arquivo> (ou snakeviz).
+
+Só um profile roda por vez em cada processo: requisições sorteadas enquanto
+outro está em andamento passam sem profiling. Sob ASGI o cProfile observa o
+event loop inteiro durante a requisição, inclusive outras requisições.
+"""
+
+import cProfile
+import glob
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+def profiles_dir():
+    return getattr(settings, 'PROFILING_DIR', None) or os.path.join(tempfile.gettempdir(), 'gateway-profiles')
+
+def should_profile(request):
+    token = getattr(settings, 'PROFILING_TOKEN', None)
+    if token and request.headers.get('X-Profile') == token:
+        return True
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+def start():
+    """Retorna um cProfile.Profile já ativo, ou None se outro profile está em andamento."""
+    if not _lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Outra ferramenta de profiling ativa no interpretador
+        _lock.release()
+        return None
+    return profiler
+
+def stop(profiler, request, elapsed):
+    """Encerra o profile e grava o arquivo. Retorna o nome do arquivo ou None."""
+    try:
+        profiler.disable()
+    finally:
+        _lock.release()
+    match = getattr(request, 'resolver_match', None)
+    route = match.url_name if match else 'unresolved'
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{route}-{elapsed * 1000:.0f}ms.prof"
+    directory = profiles_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, name))
+        _prune(directory)
+    except OSError as e:
+        logger.warning("Falha ao gravar o profile %s: %s", name, e)
+        return None
+    return name
+
+def _prune(directory):
+    paths = sorted(glob.glob(os.path.join(directory, '*.prof')), key=os.path.getmtime)
+    keep = getattr(settings, 'PROFILING_MAX_FILES', 200)
+    for path in paths[:max(0, len(paths) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,164 @@
+# gateway_service/api/queries.py
+"""
+Documentos GraphQL enviados ao ExternalProvider (Suwayomi).
+Compartilhados entre as views síncronas e assíncronas.
+"""
+
+from functools import lru_cache
+
+GET_SOURCES_LIST_QUERY = "query GetSourcesList { sources { nodes { id, name, lang, iconUrl, isNsfw } } }"
+
+SEARCH_SOURCE_MANGA_MUTATION = """
+fragment MANGA_BASE_FIELDS on MangaType {
+    id
+    title
+    thumbnailUrl
+    thumbnailUrlLastFetched
+    inLibrary
+    initialized
+    sourceId
+    __typename
+}
+mutation GET_SOURCE_MANGAS_FETCH($input: FetchSourceMangaInput!) {
+    fetchSourceManga(input: $input) {
+        hasNextPage
+        mangas {
+            ...MANGA_BASE_FIELDS
+            __typename
+        }
+        __typename
+    }
+}
+"""
+
+FETCH_SOURCE_MANGA_MUTATION = "mutation FetchSourceManga($input: FetchSourceMangaInput!) { fetchSourceManga(input: $input) { hasNextPage, mangas { id, title, thumbnailUrl, sourceId } } }"
+
+MANGA_DETAILS_FIELDS = "id, sourceId, title, author, artist, description, genre, status, thumbnailUrl"
+
+CHAPTER_FIELDS = "id, name, chapterNumber, scanlator, uploadDate"
+
+MANGA_DETAILS_QUERY = f"query GetMangaDetails($id: Int!) {{ manga(id: $id) {{ {MANGA_DETAILS_FIELDS} }} }}"
+
+MANGA_CHAPTERS_QUERY = f"query GetMangaChapters($condition: ChapterConditionInput, $order: [ChapterOrderInput!]) {{ chapters(condition: $condition, order: $order) {{ nodes {{ {CHAPTER_FIELDS} }} }} }}"
+
+MANGA_CHAPTERS_PAGE_QUERY = f"query GetMangaChaptersPage($condition: ChapterConditionInput, $order: [ChapterOrderInput!], $first: Int, $after: Cursor) {{ chapters(condition: $condition, order: $order, first: $first, after: $after) {{ nodes {{ {CHAPTER_FIELDS} }}, pageInfo {{ hasNextPage, endCursor }}, totalCount }} }}"
+
+FETCH_CHAPTER_PAGES_MUTATION = "mutation FetchChapterPages($input: FetchChapterPagesInput!) { fetchChapterPages(input: $input) { pages } }"
+
+GET_SOURCE_BROWSE_QUERY = """
+    query GET_SOURCE_BROWSE($id: LongString!) {
+      source(id: $id) {
+        id
+        name
+        filters {
+          ... on GroupFilter {
+            type: __typename
+            name
+            filters {
+              ... on CheckBoxFilter {
+                type: __typename
+                name
+              }
+              ... on SelectFilter {
+                 type: __typename
+                 name
+                 values
+              }
+              # Adicionar outros tipos de filtro conforme necessário
+            }
+          }
+          # Adicionar outros tipos de filtro de nível superior se existirem
+        }
+      }
+    }
+"""
+
+CHAPTERS_ORDER = [{
+    "by": "SOURCE_ORDER",
+    "byType": "DESC"
+}]
+
+def manga_chapters_variables(manga_id):
+    return {
+        "condition": {
+            "mangaId": manga_id
+        },
+        "order": CHAPTERS_ORDER
+    }
+
+@lru_cache(maxsize=64)
+def projected_manga_details_query(selection):
+    return f"query GetMangaDetails($id: Int!) {{ manga(id: $id) {{ {selection} }} }}"
+
+def manga_details_operation(manga_id, selection=None):
+    """Retorna (query, variables) dos detalhes do mangá, opcionalmente só com os campos em selection."""
+    query = projected_manga_details_query(selection) if selection else MANGA_DETAILS_QUERY
+    return query, {"id": manga_id}
+
+def manga_chapters_operation(manga_id, limit=None, cursor=None):
+    """
+    Retorna (query, variables) da lista de capítulos. Com limit, pede só uma
+    página ao ExternalProvider (first/after) junto com pageInfo e totalCount.
+    """
+    variables = manga_chapters_variables(manga_id)
+    if limit is None:
+        return MANGA_CHAPTERS_QUERY, variables
+    variables["first"] = limit
+    if cursor:
+        variables["after"] = cursor
+    return MANGA_CHAPTERS_PAGE_QUERY, variables
+
+@lru_cache(maxsize=64)
+def manga_details_batch_query(count, selection=MANGA_DETAILS_FIELDS, with_chapters=True):
+    """
+    Documento com aliases m<i>/c<i> (detalhes e capítulos) para `count` mangás.
+    Só depende da quantidade e da seleção, então o texto é reaproveitado entre lotes.
+    """
+    if with_chapters:
+        definitions = ", ".join(f"$m{i}: Int!, $c{i}: ChapterConditionInput" for i in range(count)) + ", $order: [ChapterOrderInput!]"
+        selections = " ".join(
+            f"m{i}: manga(id: $m{i}) {{ {selection} }} "
+            f"c{i}: chapters(condition: $c{i}, order: $order) {{ nodes {{ {CHAPTER_FIELDS} }} }}"
+            for i in range(count)
+        )
+    else:
+        definitions = ", ".join(f"$m{i}: Int!" for i in range(count))
+        selections = " ".join(f"m{i}: manga(id: $m{i}) {{ {selection} }}" for i in range(count))
+    return f"query GetMangaDetailsBatch({definitions}) {{ {selections} }}"
+
+def manga_details_batch_operation(manga_ids, selection=None, with_chapters=True):
+    """
+    Retorna (query, variables) que buscam detalhes e capítulos de todos os mangás
+    numa única requisição. O i-ésimo id responde nos aliases m<i> e c<i>.
+    """
+    variables = {"order": CHAPTERS_ORDER} if with_chapters else {}
+    for i, manga_id in enumerate(manga_ids):
+        variables[f"m{i}"] = manga_id
+        if with_chapters:
+            variables[f"c{i}"] = {"mangaId": manga_id}
+    return manga_details_batch_query(len(manga_ids), selection or MANGA_DETAILS_FIELDS, with_chapters), variables
+
+@lru_cache(maxsize=64)
+def projected_source_manga_mutation(selection):
+    return f"mutation FetchSourceManga($input: FetchSourceMangaInput!) {{ fetchSourceManga(input: $input) {{ hasNextPage, mangas {{ {selection} }} }} }}"
+
+def source_manga_operation(search_type, provider_id, page, query_term=None, filters=None, selection=None):
+    """
+    Retorna (query, variables) para o fetchSourceManga de acordo com o tipo de busca.
+    Com selection (campos do MangaType, ver api/fields.py) o documento pede só esses campos.
+    """
+    if search_type == 'SEARCH':
+        # Repassa os filtros customizados se existirem
+        input_payload = {
+            "type": "SEARCH",
+            "source": provider_id,
+            "page": page
+        }
+        if query_term:
+            input_payload["query"] = query_term
+        if filters:
+            input_payload["filters"] = filters
+        query = projected_source_manga_mutation(selection) if selection else SEARCH_SOURCE_MANGA_MUTATION
+        return query, {"input": input_payload}
+    query = projected_source_manga_mutation(selection) if selection else FETCH_SOURCE_MANGA_MUTATION
+    return query, {"input": {"type": search_type, "source": provider_id, "page": page}}
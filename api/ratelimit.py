@@ -0,0 +1,168 @@
+# gateway_service/api/ratelimit.py
+"""
+Rate limiting por cliente com token bucket.
+
+Cada cliente (IP) tem um balde de RATE_LIMIT_BURST fichas que se recarrega a
+RATE_LIMIT_PER_MINUTE fichas por minuto; cada rota consome o seu custo em
+RATE_LIMIT_COSTS. As rotas de RATE_LIMIT_IMAGE_ROUTES usam um segundo balde do
+cliente, de RATE_LIMIT_IMAGE_BURST fichas e RATE_LIMIT_IMAGE_PER_MINUTE por minuto. Com REDIS_URL o balde fica no Redis (script Lua atômico),
+compartilhado entre workers e máquinas. Sem Redis, ou se ele falhar, usa um
+balde em memória local do processo; depois de uma falha o Redis só é
+consultado de novo após RATE_LIMIT_REDIS_RETRY segundos (circuit breaker),
+então nenhuma requisição paga o timeout do socket enquanto ele estiver fora.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .resilience import CLOSED, CircuitBreaker
+
+KEY_PREFIX = 'gw:rl:'
+LOCAL_MAX_KEYS = 10000
+
+# Retorna {permitido, fichas restantes}. Usa o relógio do Redis para que
+# todos os nós concordem sobre o tempo decorrido.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult:
+    def __init__(self, allowed, remaining, retry_after):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+
+class LocalTokenBuckets:
+    """Baldes em memória do processo (LRU limitado a LOCAL_MAX_KEYS clientes)."""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > LOCAL_MAX_KEYS:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class RedisTokenBuckets:
+    def __init__(self, url):
+        # Import tardio: o cliente redis só é carregado quando REDIS_URL existe
+        import redis
+        self.error = redis.RedisError
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=getattr(settings, 'RATE_LIMIT_REDIS_TIMEOUT', 0.1),
+            socket_connect_timeout=getattr(settings, 'RATE_LIMIT_REDIS_TIMEOUT', 0.1),
+        )
+        self._script = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=getattr(settings, 'RATE_LIMIT_REDIS_RETRY', 5.0))
+        self._state_lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost):
+        """(permitido, fichas restantes), ou None se o Redis estiver fora e o balde local deve ser usado."""
+        if not self.breaker.allow():
+            return None
+        try:
+            allowed, tokens = self._script(keys=[KEY_PREFIX + key], args=[capacity, rate, cost])
+        except self.error as e:
+            with self._state_lock:
+                was_up = self.breaker.state == CLOSED
+                self.breaker.record_failure()
+            if was_up:
+                logger.warning("Rate limit no Redis indisponível, usando memória local (nova tentativa a cada %s s): %s", self.breaker.reset_timeout, e)
+            return None
+        with self._state_lock:
+            was_down = self.breaker.state != CLOSED
+            self.breaker.record_success()
+        if was_down:
+            logger.info("Rate limit no Redis disponível novamente.")
+        return bool(allowed), float(tokens)
+
+
+_local = LocalTokenBuckets()
+_redis = None
+_redis_lock = threading.Lock()
+
+def _shared_buckets():
+    """Baldes no Redis, ou None sem REDIS_URL ou sem o pacote redis instalado."""
+    global _redis
+    url = getattr(settings, 'REDIS_URL', None)
+    if not url:
+        return None
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                try:
+                    _redis = RedisTokenBuckets(url)
+                except ImportError:  # pragma: no cover - dependência opcional
+                    _redis = False
+    return _redis or None
+
+def enabled():
+    return getattr(settings, 'RATE_LIMIT_ENABLED', True)
+
+def route_cost(url_name):
+    """Custo da rota em fichas, ou None se a rota não é limitada."""
+    return getattr(settings, 'RATE_LIMIT_COSTS', {}).get(url_name)
+
+def client_key(request):
+    header = getattr(settings, 'RATE_LIMIT_CLIENT_IP_HEADER', None)
+    if header:
+        forwarded = request.META.get('HTTP_' + header.upper().replace('-', '_'))
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+def _bucket(url_name):
+    """(sufixo da chave, capacidade, fichas por segundo) do balde usado pela rota."""
+    if url_name in getattr(settings, 'RATE_LIMIT_IMAGE_ROUTES', ('image-proxy',)):
+        per_minute = getattr(settings, 'RATE_LIMIT_IMAGE_PER_MINUTE', 1200)
+        return ':img', getattr(settings, 'RATE_LIMIT_IMAGE_BURST', None) or per_minute, per_minute / 60
+    per_minute = getattr(settings, 'RATE_LIMIT_PER_MINUTE', 100)
+    return '', getattr(settings, 'RATE_LIMIT_BURST', None) or per_minute, per_minute / 60
+
+def take(key, cost, url_name=None):
+    """Consome `cost` fichas do balde do cliente para a rota e retorna um RateLimitResult."""
+    suffix, capacity, rate = _bucket(url_name)
+    key += suffix
+    # Uma rota mais cara que o balde inteiro nunca passaria
+    cost = min(cost, capacity)
+    shared = _shared_buckets()
+    result = shared.take(key, capacity, rate, cost) if shared is not None else None
+    allowed, tokens = result or _local.take(key, capacity, rate, cost)
+    retry_after = 0 if allowed else math.ceil((cost - tokens) / rate)
+    return RateLimitResult(allowed, int(tokens), retry_after)
@@ -0,0 +1,54 @@
+# gateway_service/api/renderers.py
+"""
+Serialização JSON rápida (orjson) para as respostas da API: renderer padrão do
+DRF e substituto do JsonResponse nas views Django. Sem o orjson instalado,
+cai no json da biblioteca padrão.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from .timing import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+@timed('render')
+def dumps(data, indent=False):
+    """Serializa para bytes UTF-8."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            # Tipos que o orjson não conhece (Decimal, strings lazy...): usa o encoder do Django
+            pass
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Renderer JSON do DRF baseado em dumps()."""
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # A API navegável pede 'application/json; indent=4'
+        return dumps(data, indent='indent=' in (accepted_media_type or ''))
+
+
+class FastJsonResponse(HttpResponse):
+    """Equivalente ao django.http.JsonResponse usando dumps()."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("Para serializar objetos que não são dict, use safe=False.")
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
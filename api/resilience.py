@@ -0,0 +1,315 @@
+# gateway_service/api/resilience.py
+"""
+Primitivas de resiliência para as chamadas ao ExternalProvider: circuit breaker,
+histórico de latência (para o atraso do hedging), orçamento de tempo por requisição,
+limite de concorrência por chave (ex.: host de origem das imagens) e limite
+adaptativo de concorrência com fila por prioridade.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas seguidas. Depois de `reset_timeout`
+    segundos deixa passar uma única requisição de teste (half-open): sucesso
+    fecha o circuito, falha o reabre.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Libera a sonda do half-open sem registrar resultado (tentativa cancelada)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Janela com as últimas latências de sucesso, para estimar percentis."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """Retorna o percentil p (0-100) ou None se ainda não houver amostras suficientes."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class Deadline:
+    """Orçamento de tempo único para todas as tentativas de uma requisição."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class KeyedLimiter:
+    """
+    No máximo `limit` operações simultâneas por chave. Só as chaves em uso
+    ocupam memória, então o número de chaves possíveis pode ser ilimitado.
+    """
+
+    def __init__(self):
+        self._active = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, key, limit, timeout):
+        """Espera até `timeout` segundos por um slot da chave; retorna False se não conseguir."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._active.get(key, 0) >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._active[key] = self._active.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self._cond:
+            count = self._active.get(key, 0) - 1
+            if count > 0:
+                self._active[key] = count
+            else:
+                self._active.pop(key, None)
+            self._cond.notify_all()
+
+    def active(self, key):
+        return self._active.get(key, 0)
+
+
+ACQUIRED = 'acquired'
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+SHED = 'shed'
+
+_WAITING = 'waiting'
+
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'state', 'wake')
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.state = _WAITING
+        self.wake = wake
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    Limite de concorrência AIMD guiado pela latência, com fila de espera por prioridade.
+
+    O limite começa em max_limit e fica entre min_limit e max_limit. Cada chamada
+    bem-sucedida soma 1/limite (um slot a mais a cada "limite" chamadas) enquanto
+    ao menos metade dos slots está em uso. Uma chamada mais lenta que `tolerance`
+    vezes a latência de referência da sua chave (percentil 10 das últimas), ou que
+    falhou por sobrecarga, multiplica o limite por `backoff`, no máximo uma vez por
+    janela: só chamadas iniciadas depois da última redução a reduzem de novo.
+
+    Sem slot livre, a chamada espera na fila, atendida por prioridade (menor
+    primeiro) e ordem de chegada. Com a fila cheia ela é recusada na hora, ou
+    toma o lugar da última chamada de prioridade pior, que é descartada (SHED).
+    """
+
+    def __init__(self, max_limit, min_limit=1, queue_size=64, tolerance=2.0, backoff=0.9, adaptive=True):
+        self.max_limit = max_limit
+        self.min_limit = max(1, min(min_limit, max_limit))
+        self.queue_size = queue_size
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self._limit = float(max_limit)
+        self._in_flight = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._baselines = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def _try_enter(self, priority, wake):
+        """Com o lock: ocupa um slot livre (None) ou enfileira (ticket); levanta o motivo da recusa."""
+        if self._in_flight < int(self._limit) and not self._queue:
+            self._in_flight += 1
+            return None, ACQUIRED
+        ticket = _Ticket(priority, next(self._seq), wake)
+        if len(self._queue) >= self.queue_size:
+            victim = max(self._queue, default=None)
+            if victim is None or not ticket < victim:
+                return None, QUEUE_FULL
+            self._remove(victim)
+            victim.state = SHED
+            victim.wake()
+        heapq.heappush(self._queue, ticket)
+        return ticket, None
+
+    def _remove(self, ticket):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+
+    def _leave(self, ticket):
+        """Com o lock, depois da espera: resultado do ticket (um ticket ainda na fila expirou)."""
+        if ticket.state == _WAITING:
+            self._remove(ticket)
+            ticket.state = QUEUE_TIMEOUT
+        return ticket.state
+
+    def _grant(self):
+        while self._queue and self._in_flight < int(self._limit):
+            ticket = heapq.heappop(self._queue)
+            ticket.state = ACQUIRED
+            self._in_flight += 1
+            ticket.wake()
+
+    def acquire(self, priority=0, timeout=None):
+        """Espera até `timeout` segundos por um slot. Retorna ACQUIRED, QUEUE_FULL, QUEUE_TIMEOUT ou SHED."""
+        event = threading.Event()
+        with self._lock:
+            ticket, outcome = self._try_enter(priority, event.set)
+            if ticket is None:
+                return outcome
+        event.wait(timeout)
+        with self._lock:
+            return self._leave(ticket)
+
+    async def aacquire(self, priority=0, timeout=None):
+        """Versão assíncrona de acquire(); pode ser usada junto com acquire() em outras threads."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Event loop já encerrado
+                pass
+
+        with self._lock:
+            ticket, outcome = self._try_enter(priority, wake)
+            if ticket is None:
+                return outcome
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if self._leave(ticket) == ACQUIRED:
+                    self._in_flight -= 1
+                    self._grant()
+            raise
+        with self._lock:
+            return self._leave(ticket)
+
+    def _congested(self, key, latency):
+        with self._lock:
+            tracker = self._baselines.get(key)
+            if tracker is None:
+                tracker = self._baselines[key] = LatencyTracker(size=500)
+        baseline = tracker.percentile(10)
+        tracker.observe(latency)
+        return baseline is not None and latency > baseline * self.tolerance
+
+    def release(self, started, latency=None, key=None, overloaded=False):
+        """
+        Devolve o slot de uma chamada iniciada em `started` (time.monotonic()).
+        latency: duração de uma chamada que o upstream respondeu; overloaded: a
+        chamada falhou por sobrecarga (timeout, conexão, 5xx). Sem nenhum dos
+        dois (ex.: cancelada) o limite não muda.
+        """
+        congested = overloaded or (latency is not None and self._congested(key, latency))
+        with self._lock:
+            self._in_flight -= 1
+            if self.adaptive:
+                if congested:
+                    if started >= self._last_decrease:
+                        self._limit = max(self.min_limit, self._limit * self.backoff)
+                        self._last_decrease = time.monotonic()
+                elif latency is not None and self._in_flight + 1 >= self._limit / 2:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._grant()
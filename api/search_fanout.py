@@ -0,0 +1,100 @@
+# gateway_service/api/search_fanout.py
+"""
+Busca simultânea em vários provedores (fetchSourceManga SEARCH) com timeout
+por provedor. Cada provedor vira uma linha NDJSON emitida assim que responde,
+então o mais lento não segura os resultados dos outros.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+from . import autocomplete
+from .api_service import UpstreamError, execute_graphql
+from .fields import manga_selection
+from .formatters import format_search_results
+from .queries import source_manga_operation
+from .renderers import dumps
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+def _timeout():
+    return getattr(settings, 'SEARCH_FANOUT_TIMEOUT', 15)
+
+def _concurrency():
+    return getattr(settings, 'SEARCH_FANOUT_CONCURRENCY', 8)
+
+def select_providers(providers_list, provider_ids=None, lang=None):
+    """
+    Ids dos provedores a consultar: os pedidos em provider_ids (na ordem dada)
+    ou todos os da lista, opcionalmente filtrados por idioma.
+    """
+    if provider_ids:
+        return list(dict.fromkeys(provider_ids))
+    return [p.get("id") for p in providers_list if not lang or p.get("lang") == lang]
+
+def ndjson_line(obj):
+    return dumps(obj) + b'\n'
+
+def _provider_result(provider_id, data, fields=None):
+    results_data = data.get("data", {}).get("fetchSourceManga") or {}
+    autocomplete.add_mangas(results_data.get("mangas", []))
+    return {
+        "provider_id": provider_id,
+        "results": format_search_results(results_data.get("mangas", []), fields),
+        "has_more": results_data.get("hasNextPage", False),
+    }
+
+def _provider_error(provider_id, error):
+    return {"provider_id": provider_id, "status": error.status_code, **error.as_dict()}
+
+def _summary(total, failed):
+    return {"done": True, "providers": total, "failed": failed}
+
+def _search_one(provider_id, query_term, page, fields):
+    query, variables = source_manga_operation('SEARCH', provider_id, page, query_term, selection=manga_selection(fields))
+    try:
+        return _provider_result(provider_id, execute_graphql(query, variables, timeout=_timeout()), fields)
+    except UpstreamError as e:
+        return _provider_error(provider_id, e)
+
+def iter_search(provider_ids, query_term, page=1, fields=None):
+    """Gerador de linhas NDJSON (bytes) na ordem em que os provedores respondem."""
+    failed = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, min(_concurrency(), len(provider_ids))), thread_name_prefix='search-fanout')
+    try:
+        futures = [executor.submit(_search_one, provider_id, query_term, page, fields) for provider_id in provider_ids]
+        for future in as_completed(futures):
+            line = future.result()
+            failed += 'error' in line
+            yield ndjson_line(line)
+        yield ndjson_line(_summary(len(provider_ids), failed))
+    finally:
+        # Cliente desconectou ou terminou: descarta as buscas que nem começaram
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def _asearch_one(semaphore, provider_id, query_term, page, fields):
+    # Import tardio: sob WSGI o httpx não precisa ser carregado
+    from .async_service import aexecute_graphql
+    query, variables = source_manga_operation('SEARCH', provider_id, page, query_term, selection=manga_selection(fields))
+    async with semaphore:
+        try:
+            return _provider_result(provider_id, await aexecute_graphql(query, variables, timeout=_timeout()), fields)
+        except UpstreamError as e:
+            return _provider_error(provider_id, e)
+
+async def aiter_search(provider_ids, query_term, page=1, fields=None):
+    """Versão assíncrona de iter_search."""
+    semaphore = asyncio.Semaphore(_concurrency())
+    tasks = [asyncio.ensure_future(_asearch_one(semaphore, provider_id, query_term, page, fields)) for provider_id in provider_ids]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            failed += 'error' in line
+            yield ndjson_line(line)
+        yield ndjson_line(_summary(len(provider_ids), failed))
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,69 @@
+# gateway_service/api/singleflight.py
+"""
+Coalescência de requisições idênticas em andamento ("single-flight").
+
+Chamadas simultâneas com a mesma chave compartilham uma única execução: a
+primeira executa a função e as demais esperam o mesmo resultado (ou a mesma
+exceção). Vale dentro de um processo; cada worker coalesce as suas chamadas.
+"""
+
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Versão para threads (views síncronas e pools)."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Executa fn(*args) ou espera a execução em andamento com a mesma chave."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """
+    Versão para asyncio. A execução roda numa task própria, então o
+    cancelamento de um dos chamadores (cliente desconectou) não afeta os outros.
+    """
+
+    def __init__(self):
+        # As tasks pertencem a um event loop; um dicionário por loop.
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn, *args):
+        """Aguarda fn(*args) ou a execução em andamento com a mesma chave."""
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is None:
+            task = calls[key] = asyncio.ensure_future(fn(*args))
+
+            def finished(task):
+                calls.pop(key, None)
+                # Evita "exception was never retrieved" se todos os chamadores desistiram
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(finished)
+        return await asyncio.shield(task)
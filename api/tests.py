@@ -1,3 +1,1265 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from unittest import mock, skipIf
+
+import requests
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import api_service, autocomplete, cache, catalog, chapter_archive, feeds, image_cache, image_proxy, image_transform, prefetch, ratelimit, resilience, search_fanout, timing, views
+from .fields import DETAILS_FIELDS, manga_selection
+from .image_proxy import parse_range
+from .middleware import CompressionMiddleware, brotli, negotiate_encoding
+from .models import Chapter, Manga, Provider
+from .resilience import (
+    ACQUIRED, CLOSED, HALF_OPEN, OPEN, QUEUE_FULL, QUEUE_TIMEOUT, SHED, AdaptiveLimiter, CircuitBreaker, Deadline,
+)
+from .singleflight import SingleFlight
+from .views import _collect_batch
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condição não atingida a tempo.")
+        time.sleep(0.005)
+
+
+class SessionTests(SimpleTestCase):
+    def test_same_process_reuses_the_session(self):
+        self.assertIs(api_service.get_session(), api_service.get_session())
+
+    def test_fork_builds_a_new_session(self):
+        parent = api_service.get_session()
+        with mock.patch.object(api_service.os, 'getpid', return_value=api_service._session_pid + 1):
+            child = api_service.get_session()
+            self.assertIsNot(child, parent)
+            self.assertIs(api_service.get_session(), child)
+
+    def test_concurrent_first_calls_share_one_session(self):
+        sessions = []
+        with mock.patch.object(api_service, '_session', None):
+            threads = [threading.Thread(target=lambda: sessions.append(api_service.get_session())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+
+
+class EncodeGraphqlPayloadTests(SimpleTestCase):
+    QUERY = 'query Q($id: LongString!) { manga(id: $id) { title } }'
+
+    def test_payload_is_the_json_body(self):
+        variables = {"id": "7", "title": "Ação \"entre aspas\""}
+        body = api_service.encode_graphql_payload(self.QUERY, variables)
+        self.assertEqual(json.loads(body), {"query": self.QUERY, "variables": variables})
+
+    def test_missing_variables_become_an_empty_object(self):
+        body = api_service.encode_graphql_payload(self.QUERY)
+        self.assertEqual(json.loads(body), {"query": self.QUERY, "variables": {}})
+
+    def test_query_prefix_is_cached(self):
+        api_service.encode_graphql_payload(self.QUERY, {"id": "1"})
+        hits = api_service._query_prefix.cache_info().hits
+        api_service.encode_graphql_payload(self.QUERY, {"id": "2"})
+        self.assertEqual(api_service._query_prefix.cache_info().hits, hits + 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RESPONSE_CACHE_ENABLED=True, RESPONSE_CACHE_TTL=10, RESPONSE_CACHE_STALE_TTL=100)
+class ResponseCacheTests(SimpleTestCase):
+    QUERY = 'query Fontes { sources { nodes { id } } }'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.now = 1_000_000.0
+        # O LocMemCache também usa time.time(), então a expiração segue o mesmo relógio
+        clock = mock.patch('time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        executor = mock.patch.object(cache, '_refresh_executor')
+        self.executor = executor.start()
+        self.addCleanup(executor.stop)
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return {"data": {"sources": {"nodes": [{"id": self.fetches}]}}}
+
+    def get(self):
+        return cache.get_or_fetch(self.QUERY, {}, self.fetch)
+
+    def test_fresh_entry_is_served_without_fetching(self):
+        first = self.get()
+        self.now += 5
+        self.assertEqual(self.get(), first)
+        self.assertEqual(self.fetches, 1)
+        self.executor.submit.assert_not_called()
+
+    def test_stale_entry_is_served_while_a_single_refresh_runs(self):
+        first = self.get()
+        self.now += 50
+        self.assertEqual(self.get(), first)
+        self.assertEqual(self.get(), first)
+        self.assertEqual(self.executor.submit.call_count, 1)
+        self.assertEqual(self.fetches, 1)
+
+        # Executa a atualização agendada: grava o valor novo e libera a trava
+        self.executor.submit.call_args.args[0](*self.executor.submit.call_args.args[1:])
+        self.assertEqual(self.get()["data"]["sources"]["nodes"], [{"id": 2}])
+        self.assertIsNone(caches['default'].get(cache.cache_key(self.QUERY, {}) + ':refresh'))
+
+    def test_expired_entry_is_fetched_again(self):
+        self.get()
+        self.now += 111
+        self.assertEqual(self.get()["data"]["sources"]["nodes"], [{"id": 2}])
+        self.assertEqual(self.fetches, 2)
+        self.executor.submit.assert_not_called()
+
+    def test_graphql_errors_are_not_stored(self):
+        def failing():
+            self.fetches += 1
+            return {"data": None, "errors": [{"message": "boom"}]}
+
+        cache.get_or_fetch(self.QUERY, {}, failing)
+        cache.get_or_fetch(self.QUERY, {}, failing)
+        self.assertEqual(self.fetches, 2)
+        self.assertIsNone(caches['default'].get(cache.cache_key(self.QUERY, {})))
+
+    def test_variables_are_part_of_the_key(self):
+        self.assertNotEqual(cache.cache_key(self.QUERY, {"a": 1, "b": 2}), cache.cache_key(self.QUERY, {"a": 2}))
+        self.assertEqual(cache.cache_key(self.QUERY, {"a": 1, "b": 2}), cache.cache_key(self.QUERY, {"b": 2, "a": 1}))
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_explicit_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+
+    def test_open_ended(self):
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_unsatisfiable(self):
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIs(parse_range('bytes=-0', 1000), False)
+        self.assertIs(parse_range('bytes=50-10', 1000), False)
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=-', 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+
+
+class EvictedBlobTests(SimpleTestCase):
+    URL = 'http://origem/pagina.png'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(IMAGE_CACHE_DIR=directory.name, IMAGE_CACHE_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.evicted = image_cache.store_bytes(self.URL, b'antigo', 'image/png', 3600)
+        os.unlink(self.evicted.path)
+        self.fresh = image_cache.store_bytes(self.URL, b'baixado de novo', 'image/png', 3600)
+
+    def _proxy(self, range_header=None):
+        results = [(self.evicted, None, 'HIT'), (self.fresh, None, 'MISS')]
+        with mock.patch.object(image_proxy, '_fetch_origin', side_effect=results) as fetch:
+            response = image_proxy.proxy_image(self.URL, range_header)
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return response
+
+    def test_evicted_blob_is_fetched_as_a_miss(self):
+        response = self._proxy()
+        self.assertEqual(b''.join(response.streaming_content), b'baixado de novo')
+
+    def test_evicted_blob_with_range_is_fetched_as_a_miss(self):
+        response = self._proxy('bytes=0-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'baixad')
+
+
+class _FakeOrigin:
+    """Resposta da origem que só entrega o resto do corpo depois de `gate`."""
+
+    def __init__(self, chunks, headers, gate):
+        self.status_code = 200
+        self.url = 'http://origem/x.png'
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.closed = False
+        self._chunks = chunks
+        self._gate = gate
+
+    def iter_content(self, chunk_size):
+        yield self._chunks[0]
+        self._gate.wait(2)
+        yield from self._chunks[1:]
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, RESPONSE_CACHE_ENABLED=False, CATALOG_MIRROR_ENABLED=False,
+                   IMAGE_TRANSFORM_ENABLED=False)
+class OriginStreamingTests(SimpleTestCase):
+    URL = 'http://origem/x.png'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(IMAGE_CACHE_DIR=directory.name, IMAGE_CACHE_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+
+    def _origin(self, headers):
+        origin = _FakeOrigin([b'abcde', b'fghij'], dict({'Content-Type': 'image/png', 'Content-Length': '10'}, **headers), self.gate)
+        get = mock.patch.object(image_proxy, '_get', return_value=origin)
+        get.start()
+        self.addCleanup(get.stop)
+        return origin
+
+    def test_first_chunk_reaches_the_client_before_the_download_ends(self):
+        origin = self._origin({'Cache-Control': 'max-age=60'})
+        response = image_proxy.proxy_image(self.URL)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response['Content-Length'], '10')
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'abcde')
+        self.assertIsNone(image_cache.lookup(self.URL))
+        self.assertEqual(image_proxy._origin_slots.active('origem'), 1)
+        self.gate.set()
+        self.assertEqual(b''.join(chunks), b'fghij')
+        response.close()
+        self.assertTrue(origin.closed)
+        self.assertEqual(image_proxy._origin_slots.active('origem'), 0)
+        entry = image_cache.lookup(self.URL)
+        self.assertTrue(entry.is_fresh())
+        with open(entry.path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdefghij')
+
+    def test_uncacheable_image_is_streamed_without_storing(self):
+        self._origin({'Cache-Control': 'no-store'})
+        self.gate.set()
+        response = image_proxy.proxy_image(self.URL)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertEqual(b''.join(response.streaming_content), b'abcdefghij')
+        response.close()
+        self.assertIsNone(image_cache.lookup(self.URL))
+        self.assertEqual(image_proxy._origin_slots.active('origem'), 0)
+
+    @override_settings(IMAGE_ORIGIN_MAX_CONCURRENCY=1, IMAGE_ORIGIN_QUEUE_TIMEOUT=0.05)
+    def test_saturated_host_returns_503_or_the_stale_copy(self):
+        get = mock.patch.object(image_proxy, '_get', side_effect=AssertionError("origem não deveria ser chamada"))
+        get.start()
+        self.addCleanup(get.stop)
+        self.assertTrue(image_proxy._origin_slots.acquire('origem', 1, 0))
+        self.addCleanup(image_proxy._origin_slots.release, 'origem')
+
+        busy = self.client.get('/api/v1/image-proxy/', {'url': self.URL})
+        self.assertEqual(busy.status_code, 503)
+        self.assertTrue(busy.has_header('Retry-After'))
+
+        image_cache.store_bytes(self.URL, b'antiga', 'image/png', 0)
+        stale = self.client.get('/api/v1/image-proxy/', {'url': self.URL})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale['X-Cache'], 'STALE')
+        self.assertEqual(b''.join(stale.streaming_content), b'antiga')
+
+
+class ChapterArchiveTests(SimpleTestCase):
+    PAGES = {
+        'http://origem/1.png': (b'\x89PNG' + b'a' * 5000, 'image/png'),
+        'http://origem/2': (b'\xff\xd8' + b'b' * 7000, 'image/jpeg'),
+        'http://origem/3.webp': (b'RIFF' + b'c' * 3000, None),
+    }
+
+    def _fetch_page(self, url):
+        body, content_type = self.PAGES[url]
+        return io.BytesIO(body), content_type
+
+    def test_archive_is_a_valid_zip_in_page_order(self):
+        with mock.patch.object(chapter_archive, '_fetch_page', self._fetch_page):
+            archive = chapter_archive.ChapterArchive(list(self.PAGES))
+            archive.prepare()
+            data = b''.join(archive)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive_file:
+            self.assertIsNone(archive_file.testzip())
+            self.assertEqual(archive_file.namelist(), ['001.png', '002.jpg', '003.webp'])
+            for info, (body, _) in zip(archive_file.infolist(), self.PAGES.values()):
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                # Sem data descriptor: CRC e tamanhos no cabeçalho local
+                self.assertFalse(info.flag_bits & 0x08)
+                self.assertEqual(archive_file.read(info), body)
+
+    def test_first_page_error_is_raised_by_prepare(self):
+        def fail(url):
+            raise OSError("origem fora do ar")
+
+        with mock.patch.object(chapter_archive, '_fetch_page', fail):
+            archive = chapter_archive.ChapterArchive(list(self.PAGES))
+            with self.assertRaises(OSError):
+                archive.prepare()
+            self.assertEqual(list(archive), [])
+
+    def test_closed_archive_stops(self):
+        with mock.patch.object(chapter_archive, '_fetch_page', self._fetch_page):
+            archive = chapter_archive.ChapterArchive(list(self.PAGES))
+            archive.prepare()
+            next(archive)
+            archive.close()
+            self.assertEqual(list(archive), [])
+
+
+@override_settings(IMAGE_TRANSFORM_ENABLED=True, IMAGE_RESIZE_WIDTHS=(150, 300, 600), IMAGE_DEFAULT_QUALITY=80)
+class ImageTransformTests(SimpleTestCase):
+    def test_width_snaps_up_to_the_allowed_sizes(self):
+        self.assertEqual(image_transform.parse_variant({'w': '100'}, None).width, 150)
+        self.assertEqual(image_transform.parse_variant({'w': '300'}, None).width, 300)
+        self.assertEqual(image_transform.parse_variant({'w': '301'}, None).width, 600)
+        self.assertEqual(image_transform.parse_variant({'w': '5000'}, None).width, 600)
+
+    def test_quality_rounds_to_multiples_of_five(self):
+        self.assertEqual(image_transform.parse_variant({'q': '83'}, None).quality, 85)
+        self.assertEqual(image_transform.parse_variant({'q': '2'}, None).quality, 5)
+        self.assertEqual(image_transform.parse_variant({'q': '100'}, None).quality, 100)
+        self.assertEqual(image_transform.parse_variant({'w': '150'}, None).quality, 80)
+
+    def test_invalid_or_missing_parameters(self):
+        self.assertIsNone(image_transform.parse_variant({}, 'image/avif'))
+        for params in ({'w': '0'}, {'w': 'x'}, {'q': '0'}, {'q': '101'}):
+            with self.assertRaises(ValueError):
+                image_transform.parse_variant(params, None)
+
+    def test_format_follows_accept_q_values(self):
+        self.assertEqual(image_transform.negotiate_format('image/avif,image/webp,*/*'), 'AVIF')
+        self.assertEqual(image_transform.negotiate_format('image/avif;q=0,image/webp'), 'WEBP')
+        self.assertEqual(image_transform.negotiate_format('image/avif;q=0.5, image/webp;q=0.9'), 'WEBP')
+        self.assertIsNone(image_transform.negotiate_format('image/avif;q=0, image/webp;q=0'))
+        self.assertIsNone(image_transform.negotiate_format('image/*,*/*;q=0.8'))
+        self.assertIsNone(image_transform.negotiate_format(None))
+
+    def test_full_queue_serves_the_original(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+        executor = mock.Mock()
+        with override_settings(IMAGE_CACHE_DIR=directory.name, IMAGE_CACHE_ENABLED=True):
+            original = image_cache.store_bytes('http://origem/p.png', b'original', 'image/png', 3600)
+            with mock.patch.object(image_proxy, 'ensure_cached', return_value=original), \
+                    mock.patch.object(image_transform, '_pool', return_value=(executor, full)):
+                response = image_proxy.proxy_image('http://origem/p.png', variant=image_transform.ImageVariant(150, 80, 'WEBP'))
+        executor.submit.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Vary'], 'Accept')
+        self.assertEqual(b''.join(response.streaming_content), b'original')
+
+
+class PrefetchTests(SimpleTestCase):
+    @override_settings(IMAGE_PREFETCH_PAGES=3, IMAGE_PREFETCH_MAX_PAGES=10)
+    def test_requested_pages_are_capped(self):
+        self.assertEqual(prefetch.pages_to_prefetch(None), 3)
+        self.assertEqual(prefetch.pages_to_prefetch(''), 3)
+        self.assertEqual(prefetch.pages_to_prefetch('5'), 5)
+        self.assertEqual(prefetch.pages_to_prefetch('50'), 10)
+        self.assertEqual(prefetch.pages_to_prefetch('-2'), 0)
+        self.assertEqual(prefetch.pages_to_prefetch('abc'), 0)
+
+    def test_proxy_waits_for_the_inflight_prefetch(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        url = 'http://origem/prefetch.png'
+        started, release = threading.Event(), threading.Event()
+        fetches = []
+
+        def fetch(url):
+            fetches.append(url)
+            started.set()
+            release.wait(2)
+            image_cache.store_bytes(url, b'pre-carregada', 'image/png', 3600)
+
+        with override_settings(IMAGE_CACHE_DIR=directory.name, IMAGE_CACHE_ENABLED=True), \
+                mock.patch.object(image_proxy, '_get', side_effect=AssertionError("a origem não deveria ser chamada")):
+            self.assertEqual(prefetch.schedule([url, url], fetch), 1)
+            self.assertTrue(started.wait(2))
+            threading.Timer(0.05, release.set).start()
+            response = image_proxy.proxy_image(url)
+            self.assertEqual(fetches, [url])
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertEqual(b''.join(response.streaming_content), b'pre-carregada')
+            self.assertFalse(prefetch.join(url))
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def _queue(self, limiter, priority, outcomes, timeout=2.0):
+        """Enfileira um acquire() numa thread; o resultado vai para outcomes[priority]."""
+        def run():
+            outcomes[priority] = limiter.acquire(priority, timeout)
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_queue_full_refuses_equal_priority(self):
+        limiter = AdaptiveLimiter(max_limit=1, queue_size=1)
+        self.assertEqual(limiter.acquire(), ACQUIRED)
+        outcomes = {}
+        waiter = self._queue(limiter, 0, outcomes)
+        _wait_until(lambda: limiter.queued == 1)
+        self.assertEqual(limiter.acquire(0, timeout=1.0), QUEUE_FULL)
+        limiter.release(time.monotonic())
+        waiter.join()
+        self.assertEqual(outcomes[0], ACQUIRED)
+
+    def test_better_priority_sheds_worst_waiter(self):
+        limiter = AdaptiveLimiter(max_limit=1, queue_size=1)
+        limiter.acquire()
+        outcomes = {}
+        waiter = self._queue(limiter, 2, outcomes)
+        _wait_until(lambda: limiter.queued == 1)
+        # Toma o lugar do waiter de prioridade pior e expira na fila, já que o slot segue ocupado
+        self.assertEqual(limiter.acquire(0, timeout=0.05), QUEUE_TIMEOUT)
+        waiter.join()
+        self.assertEqual(outcomes[2], SHED)
+        self.assertEqual(limiter.queued, 0)
+
+    def test_timeout_leaves_the_queue(self):
+        limiter = AdaptiveLimiter(max_limit=1, queue_size=4)
+        limiter.acquire()
+        self.assertEqual(limiter.acquire(0, timeout=0.05), QUEUE_TIMEOUT)
+        self.assertEqual(limiter.queued, 0)
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_released_slot_goes_to_best_priority(self):
+        limiter = AdaptiveLimiter(max_limit=1, queue_size=4)
+        limiter.acquire()
+        order = []
+
+        def run(priority):
+            if limiter.acquire(priority, timeout=2.0) == ACQUIRED:
+                order.append(priority)
+                limiter.release(time.monotonic())
+
+        low = threading.Thread(target=run, args=(1,))
+        low.start()
+        _wait_until(lambda: limiter.queued == 1)
+        high = threading.Thread(target=run, args=(0,))
+        high.start()
+        _wait_until(lambda: limiter.queued == 2)
+        limiter.release(time.monotonic())
+        low.join()
+        high.join()
+        self.assertEqual(order, [0, 1])
+
+    def test_overload_decreases_once_per_window(self):
+        limiter = AdaptiveLimiter(max_limit=10)
+        for _ in range(3):
+            limiter.acquire()
+        started = time.monotonic()
+        limiter.release(started, overloaded=True)
+        self.assertEqual(limiter.limit, 9)
+        # Iniciada antes da redução: não reduz de novo
+        limiter.release(started, overloaded=True)
+        self.assertEqual(limiter.limit, 9)
+        limiter.release(time.monotonic(), overloaded=True)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_slow_call_counts_as_congestion(self):
+        limiter = AdaptiveLimiter(max_limit=10, tolerance=2.0)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(time.monotonic(), latency=0.01, key='op')
+        self.assertEqual(limiter.limit, 10)
+        limiter.acquire()
+        limiter.release(time.monotonic(), latency=1.0, key='op')
+        self.assertEqual(limiter.limit, 9)
+
+    def test_success_under_load_increases_up_to_max(self):
+        limiter = AdaptiveLimiter(max_limit=10)
+        limiter.acquire()
+        limiter.release(time.monotonic(), overloaded=True)
+        self.assertEqual(limiter.limit, 9)
+        for _ in range(20):
+            for _ in range(5):
+                limiter.acquire()
+            for _ in range(5):
+                limiter.release(time.monotonic(), latency=0.01)
+        self.assertEqual(limiter.limit, 10)
+
+    def test_idle_success_does_not_increase(self):
+        limiter = AdaptiveLimiter(max_limit=10)
+        limiter.acquire()
+        limiter.release(time.monotonic(), overloaded=True)
+        for _ in range(50):
+            limiter.acquire()
+            limiter.release(time.monotonic(), latency=0.01)
+        self.assertEqual(limiter.limit, 9)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_allows_a_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        # Sonda cancelada: outra pode passar
+        breaker.release()
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_remaining_counts_down_to_zero(self):
+        deadline = Deadline(0.05)
+        self.assertFalse(deadline.expired)
+        self.assertLessEqual(deadline.remaining(), 0.05)
+        time.sleep(0.06)
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertTrue(deadline.expired)
+
+
+@override_settings(UPSTREAM_BREAKER_FAILURES=5, UPSTREAM_HEDGE_MIN_DELAY=0.05, UPSTREAM_HEDGE_MAX_INFLIGHT=4)
+class UpstreamFailoverTests(SimpleTestCase):
+    def setUp(self):
+        self.primary = api_service.Upstream('http://primaria/graphql', 'primary')
+        self.secondary = api_service.Upstream('http://secundaria/graphql', 'secondary')
+        for _ in range(20):
+            self.primary.latency.observe(0.05)
+        self.calls = []
+        # Vagas de hedge novas a cada teste (o limite vem do settings)
+        slots = mock.patch.object(api_service, '_hedge_slots', None)
+        slots.start()
+        self.addCleanup(slots.stop)
+
+    def _post(self, behaviour):
+        """behaviour: url -> (atraso em segundos, resposta ou exceção)."""
+        def post(url, body, timeout):
+            self.calls.append((url, timeout))
+            delay, result = behaviour[url]
+            time.sleep(delay)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return mock.patch.object(api_service, 'post_graphql', side_effect=post)
+
+    def test_hedge_fires_after_p95_and_first_success_wins(self):
+        behaviour = {
+            self.primary.url: (0.5, {"data": {"from": "primary"}}),
+            self.secondary.url: (0.0, {"data": {"from": "secondary"}}),
+        }
+        with self._post(behaviour):
+            started = time.monotonic()
+            data = api_service._execute_hedged([self.primary, self.secondary], b'{}', Deadline(2))
+            elapsed = time.monotonic() - started
+        self.assertEqual(data, {"data": {"from": "secondary"}})
+        self.assertEqual([url for url, _ in self.calls], [self.primary.url, self.secondary.url])
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.4)
+
+    def test_hedge_slot_is_held_until_the_loser_finishes(self):
+        behaviour = {
+            self.primary.url: (0.3, {"data": {"from": "primary"}}),
+            self.secondary.url: (0.0, {"data": {"from": "secondary"}}),
+        }
+        with override_settings(UPSTREAM_HEDGE_MAX_INFLIGHT=1), self._post(behaviour):
+            api_service._execute_hedged([self.primary, self.secondary], b'{}', Deadline(2))
+            # A primária ainda roda em segundo plano: a próxima chamada não duplica
+            self.calls.clear()
+            data = api_service._execute_hedged([self.primary, self.secondary], b'{}', Deadline(2))
+            self.assertEqual(data, {"data": {"from": "primary"}})
+            self.assertEqual([url for url, _ in self.calls], [self.primary.url])
+        # Terminada a perdedora, a vaga volta
+        slots = api_service._hedge_limiter()
+        _wait_until(lambda: slots.acquire(blocking=False))
+        slots.release()
+
+    def test_no_hedge_slots_waits_for_the_primary(self):
+        behaviour = {
+            self.primary.url: (0.15, {"data": {"from": "primary"}}),
+            self.secondary.url: (0.0, {"data": {"from": "secondary"}}),
+        }
+        with override_settings(UPSTREAM_HEDGE_MAX_INFLIGHT=0), self._post(behaviour):
+            data = api_service._execute_hedged([self.primary, self.secondary], b'{}', Deadline(2))
+        self.assertEqual(data, {"data": {"from": "primary"}})
+        self.assertEqual([url for url, _ in self.calls], [self.primary.url])
+
+    def test_failover_shares_one_deadline(self):
+        behaviour = {
+            self.primary.url: (0.2, requests.exceptions.ConnectionError("recusada")),
+            self.secondary.url: (0.0, {"data": {"from": "secondary"}}),
+        }
+        with self._post(behaviour):
+            data = api_service._execute_sequential([self.primary, self.secondary], b'{}', Deadline(1))
+        self.assertEqual(data, {"data": {"from": "secondary"}})
+        (_, first_timeout), (_, second_timeout) = self.calls
+        self.assertLessEqual(second_timeout, first_timeout - 0.2)
+
+    def test_expired_deadline_skips_the_failover(self):
+        behaviour = {
+            self.primary.url: (0.1, requests.exceptions.ConnectionError("recusada")),
+            self.secondary.url: (0.0, {"data": {"from": "secondary"}}),
+        }
+        with self._post(behaviour), self.assertRaises(api_service.UpstreamError) as raised:
+            api_service._execute_sequential([self.primary, self.secondary], b'{}', Deadline(0.05))
+        self.assertEqual([url for url, _ in self.calls], [self.primary.url])
+        self.assertEqual(raised.exception.status_code, 503)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _run_concurrently(self, fn, followers=3):
+        """Um líder bloqueado em fn e `followers` chamadas com a mesma chave; retorna os resultados."""
+        flight = SingleFlight()
+        release = threading.Event()
+        results = []
+
+        def call():
+            try:
+                results.append(('ok', flight.do('key', fn, release)))
+            except Exception as e:
+                results.append(('error', e))
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        _wait_until(lambda: 'key' in flight._calls)
+        for _ in range(followers):
+            thread = threading.Thread(target=call)
+            thread.start()
+            threads.append(thread)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(flight._calls, {})
+        return results
+
+    def test_followers_share_the_leader_result(self):
+        calls = []
+
+        def fn(release):
+            calls.append(1)
+            release.wait(2)
+            return object()
+
+        results = self._run_concurrently(fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual({kind for kind, _ in results}, {'ok'})
+        self.assertEqual(len({id(value) for _, value in results}), 1)
+
+    def test_exception_reaches_every_caller(self):
+        def fn(release):
+            release.wait(2)
+            raise ValueError("falhou")
+
+        results = self._run_concurrently(fn)
+        self.assertEqual(len(results), 4)
+        for kind, value in results:
+            self.assertEqual(kind, 'error')
+            self.assertIsInstance(value, ValueError)
+
+    def test_next_call_runs_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+
+
+class CollectBatchTests(SimpleTestCase):
+    def test_per_item_results(self):
+        data = {
+            "data": {"m0": {"id": 10}, "c0": {"nodes": [{"id": 1}]}, "m1": None, "m2": None},
+            "errors": [{"message": "boom", "path": ["m1", "title"]}],
+        }
+        fetched, failed = {}, {}
+        self.assertEqual(_collect_batch([10, 11, 12], data, fetched, failed), [])
+        self.assertEqual(fetched, {10: ({"id": 10}, [{"id": 1}])})
+        self.assertEqual(failed[11][0], 502)
+        self.assertEqual(failed[11][1]["details"], data["errors"])
+        self.assertEqual(failed[12][0], 404)
+
+    def test_missing_chapters_become_empty_list(self):
+        fetched, failed = {}, {}
+        _collect_batch([10], {"data": {"m0": {"id": 10}, "c0": None}}, fetched, failed)
+        self.assertEqual(fetched, {10: ({"id": 10}, [])})
+
+    def test_null_data_retries_the_others(self):
+        data = {"data": None, "errors": [{"message": "boom", "path": ["m1", "title"]}]}
+        fetched, failed = {}, {}
+        self.assertEqual(_collect_batch([10, 11, 12], data, fetched, failed), [10, 12])
+        self.assertEqual(list(failed), [11])
+        self.assertEqual(fetched, {})
+
+    def test_null_data_without_culprit_fails_everything(self):
+        data = {"data": None, "errors": [{"message": "boom"}]}
+        fetched, failed = {}, {}
+        self.assertEqual(_collect_batch([10, 11], data, fetched, failed), [])
+        self.assertEqual({manga_id: status for manga_id, (status, _) in failed.items()}, {10: 502, 11: 502})
+
+    def test_chapter_errors_belong_to_the_item(self):
+        data = {"data": None, "errors": [{"message": "boom", "path": ["c1", "nodes", 0, "name"]}]}
+        fetched, failed = {}, {}
+        self.assertEqual(_collect_batch([10, 11, 12], data, fetched, failed), [10, 12])
+        self.assertEqual(failed[11], (502, {"error": "Erro na resposta da API GraphQL do ExternalProvider.", "details": data["errors"]}))
+
+    def test_chapter_errors_with_data_keep_the_manga(self):
+        data = {
+            "data": {"m0": {"id": 10}, "c0": None, "m1": None, "c1": None},
+            "errors": [
+                {"message": "capítulos", "path": ["c0", "nodes"]},
+                {"message": "mangá", "path": ["m1"]},
+                {"message": "capítulos", "path": ["c1", "nodes"]},
+            ],
+        }
+        fetched, failed = {}, {}
+        self.assertEqual(_collect_batch([10, 11], data, fetched, failed), [])
+        self.assertEqual(fetched, {10: ({"id": 10}, [])})
+        self.assertEqual(failed[11][1]["details"], data["errors"][1:])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FEED_CACHE_ENABLED=True, FEED_WARM_PAGES=2, FEED_CACHE_TTL=600,
+                   FEED_WARM_INTERVAL=300, FEED_WARM_JITTER=0.2)
+class FeedCacheTests(SimpleTestCase):
+    MANGAS = [{"id": 7, "sourceId": "1", "title": "Título", "thumbnailUrl": None}]
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def _search(self, **overrides):
+        return dict({"search_type": "POPULAR", "provider_id": "1", "page": 1, "query_term": None, "filters": None, "fields": None}, **overrides)
+
+    def test_recorded_miss_is_served_with_the_requested_fields(self):
+        self.assertIsNone(feeds.lookup(self._search()))
+        feeds.record(self._search(), self.MANGAS, True)
+        body = feeds.lookup(self._search())
+        self.assertEqual(body["results"][0]["title"], "Título")
+        self.assertTrue(body["has_more"])
+        self.assertEqual(feeds.lookup(self._search(fields={"title"})), {"results": [{"title": "Título"}], "has_more": True})
+
+    def test_only_the_warmed_pages_of_unfiltered_feeds_are_stored(self):
+        for search in (
+            self._search(search_type="SEARCH", query_term="x"),
+            self._search(page=3),
+            self._search(filters=[{"position": 0}]),
+            self._search(fields={"title"}),
+        ):
+            feeds.record(search, self.MANGAS, False)
+        self.assertIsNone(feeds.lookup(self._search(page=3)))
+        self.assertIsNone(feeds.lookup(self._search()))
+        with override_settings(FEED_CACHE_ENABLED=False):
+            feeds.record(self._search(), self.MANGAS, False)
+        self.assertIsNone(feeds.lookup(self._search()))
+
+    def test_one_round_per_interval(self):
+        self.assertTrue(feeds._claim_round())
+        self.assertFalse(feeds._claim_round())
+        # O lock dura o menor intervalo possível entre rodadas (300 s - 20%)
+        with mock.patch.object(feeds, '_cache') as cache_backend:
+            feeds._claim_round()
+        cache_backend.return_value.add.assert_called_once_with(feeds.ROUND_LOCK_KEY, 1, 240)
+
+
+@override_settings(
+    CATALOG_MIRROR_ENABLED=False, RATE_LIMIT_ENABLED=False, RESPONSE_CACHE_ENABLED=False,
+    CHAPTERS_PAGE_DEFAULT_LIMIT=2, CHAPTERS_PAGE_MAX_LIMIT=3,
+)
+class ChapterPagingTests(SimpleTestCase):
+    URL = '/api/v1/content/item/1/7/detail/'
+    CHAPTERS = [{"id": chapter_id, "name": f"Capítulo {chapter_id}"} for chapter_id in (5, 4, 3, 2, 1)]
+
+    def setUp(self):
+        self.variables = []
+        upstream = mock.patch.object(views, 'execute_graphql', side_effect=self._execute_graphql)
+        upstream.start()
+        self.addCleanup(upstream.stop)
+
+    def _execute_graphql(self, query, variables=None, timeout=30, partial=False):
+        """Upstream paginado: o cursor é a posição do último capítulo devolvido."""
+        if "first" not in variables:
+            return {"data": {"manga": {"id": 7, "sourceId": "1", "title": "Título"}}}
+        self.variables.append(variables)
+        start = int(variables.get("after", 0))
+        nodes = self.CHAPTERS[start:start + variables["first"]]
+        end = start + len(nodes)
+        page_info = {"hasNextPage": end < len(self.CHAPTERS), "endCursor": str(end)}
+        return {"data": {"chapters": {"nodes": nodes, "pageInfo": page_info, "totalCount": len(self.CHAPTERS)}}}
+
+    def test_cursor_round_trip_walks_every_chapter(self):
+        seen, query = [], '?limit=2'
+        while True:
+            body = self.client.get(self.URL + query).json()
+            seen += [chapter["id"] for chapter in body["chapters"]]
+            page = body["chapters_page"]
+            self.assertEqual((page["limit"], page["total"]), (2, 5))
+            if not page["has_more"]:
+                self.assertIsNone(page["next_cursor"])
+                break
+            query = f'?cursor={page["next_cursor"]}'
+        self.assertEqual(seen, ["5", "4", "3", "2", "1"])
+        # O cursor devolvido volta ao upstream como after, com o limite padrão
+        self.assertEqual([v.get("after") for v in self.variables], [None, "2", "4"])
+        self.assertEqual({v["first"] for v in self.variables}, {2})
+
+    def test_limit_is_capped(self):
+        for query in ('?limit=4', '?limit=0', '?limit=abc'):
+            response = self.client.get(self.URL + query)
+            self.assertEqual(response.status_code, 400)
+        self.assertIn("entre 1 e 3", self.client.get(self.URL + '?limit=4').json()["error"])
+        self.assertEqual(self.variables, [])
+
+    def test_without_paging_the_full_list_is_returned(self):
+        self.assertEqual(views._parse_chapter_paging({}), ((None, None), None))
+        self.assertEqual(views._parse_chapter_paging({'cursor': 'abc'}), ((2, 'abc'), None))
+
+
+class SearchFanoutTests(SimpleTestCase):
+    def _execute_graphql(self, query, variables=None, timeout=30, partial=False):
+        source = variables["input"]["source"]
+        if source == "lento":
+            time.sleep(0.1)
+        elif source == "fora":
+            raise api_service.UpstreamError("Falha ao comunicar com o ExternalProvider-Server.", "Read timed out.", 503)
+        mangas = [{"id": 1, "sourceId": source, "title": f"Resultado de {source}"}]
+        return {"data": {"fetchSourceManga": {"mangas": mangas, "hasNextPage": source == "lento"}}}
+
+    def test_one_line_per_provider_then_the_summary(self):
+        with mock.patch.object(search_fanout, 'execute_graphql', side_effect=self._execute_graphql):
+            lines = [json.loads(line) for line in search_fanout.iter_search(["lento", "rapido", "fora"], "busca")]
+        self.assertEqual(len(lines), 4)
+        # O lento chega por último, sem segurar os outros
+        self.assertEqual(lines[2]["provider_id"], "lento")
+        self.assertTrue(lines[2]["has_more"])
+        by_provider = {line["provider_id"]: line for line in lines[:3]}
+        self.assertEqual(by_provider["rapido"]["results"][0]["title"], "Resultado de rapido")
+        self.assertEqual(by_provider["fora"], {
+            "provider_id": "fora", "status": 503,
+            "error": "Falha ao comunicar com o ExternalProvider-Server.", "details": "Read timed out.",
+        })
+        self.assertEqual(lines[3], {"done": True, "providers": 3, "failed": 1})
+
+    def test_lines_are_newline_terminated_json(self):
+        with mock.patch.object(search_fanout, 'execute_graphql', side_effect=self._execute_graphql):
+            lines = list(search_fanout.iter_search(["rapido"], "busca"))
+        self.assertTrue(all(line.endswith(b'\n') and line.count(b'\n') == 1 for line in lines))
+
+
+@override_settings(CATALOG_MIRROR_ENABLED=False, RATE_LIMIT_ENABLED=False)
+class FieldsProjectionTests(SimpleTestCase):
+    URL = '/api/v1/content/item/1/7/detail/'
+    MANGA = {"id": 7, "sourceId": "1", "title": "Título", "description": "Longa", "thumbnailUrl": "/thumb/7"}
+
+    def test_unknown_fields_list_the_allowed_names(self):
+        with mock.patch.object(views, 'execute_graphql') as upstream:
+            response = self.client.get(self.URL + '?fields=title,capitulos,nota')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            "error": "Campos inválidos em 'fields': capitulos, nota.",
+            "details": {"allowed": list(DETAILS_FIELDS)},
+        })
+        upstream.assert_not_called()
+
+    def test_selection_is_trimmed_to_the_requested_fields(self):
+        self.assertIsNone(manga_selection(None))
+        self.assertEqual(manga_selection(frozenset({"title", "genres"})), "id, title, genre")
+        self.assertEqual(manga_selection(frozenset({"content_id"})), "id")
+
+    def test_response_and_upstream_query_follow_fields(self):
+        with mock.patch.object(views, 'execute_graphql', return_value={"data": {"manga": self.MANGA}}) as upstream:
+            response = self.client.get(self.URL + '?fields=title,thumbnail_url_proxy')
+        self.assertEqual(response.json(), {"title": "Título", "thumbnail_url_proxy": "/api/v1/image-proxy/?url=/thumb/7"})
+        # Sem "chapters" a segunda chamada é omitida
+        self.assertEqual(upstream.call_count, 1)
+        query = upstream.call_args.args[0]
+        self.assertIn("{ id, title, thumbnailUrl }", query)
+        self.assertNotIn("description", query)
+
+
+class TitleIndexTests(SimpleTestCase):
+    def _titles(self, results):
+        return [entry.title for entry in results]
+
+    def test_normalization_ignores_accents_case_and_punctuation(self):
+        self.assertEqual(autocomplete.normalize("  Ação: O Início!! "), 'acao o inicio')
+
+    def test_every_query_word_must_start_a_title_word(self):
+        index = autocomplete.TitleIndex(100)
+        index.add(1, 1, "Naruto Shippuden")
+        index.add(1, 2, "Boruto: Naruto Next Generations")
+        index.add(1, 3, "One Piece")
+        self.assertEqual(self._titles(index.search("shipp nar")), ["Naruto Shippuden"])
+        # "aruto" é trigrama do meio da palavra, não início
+        self.assertEqual(index.search("aruto"), [])
+        self.assertEqual(self._titles(index.search("p")), ["One Piece"])
+
+    def test_prefix_of_the_title_ranks_first_then_shorter_then_recent(self):
+        index = autocomplete.TitleIndex(100)
+        index.add(1, 1, "Boruto: Naruto Next Generations")
+        index.add(1, 2, "Naruto Gaiden")
+        index.add(1, 3, "Naruto")
+        index.add(1, 4, "Naruto Shippuden")
+        index.add(2, 5, "Naruto Gaiden")
+        self.assertEqual(
+            [(entry.provider_id, entry.content_id) for entry in index.search("naru")],
+            [('1', '3'), ('2', '5'), ('1', '2'), ('1', '4'), ('1', '1')],
+        )
+        self.assertEqual(self._titles(index.search("naru", limit=2, provider_id=1)), ["Naruto", "Naruto Gaiden"])
+
+    def test_oldest_title_is_evicted(self):
+        index = autocomplete.TitleIndex(2)
+        index.add(1, 1, "Berserk")
+        index.add(1, 2, "Bleach")
+        index.add(1, 1, "Berserk")
+        index.add(1, 3, "Blue Lock")
+        self.assertEqual(len(index), 2)
+        self.assertEqual(self._titles(index.search("b")), ["Berserk", "Blue Lock"])
+        self.assertEqual(index.search("bleach"), [])
+        # Trigramas só do título despejado saem do índice
+        self.assertNotIn('lea', index._grams)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100, COMPRESSION_CONTENT_TYPES=('application/json',))
+class CompressionTests(SimpleTestCase):
+    BODY = json.dumps([{"title": f"Título {i}", "content_id": str(i)} for i in range(50)]).encode()
+
+    def _respond(self, accept_encoding, content_type='application/json', body=BODY):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body, content_type=content_type))
+        return middleware(request)
+
+    @skipIf(brotli is None, "brotli não instalado")
+    def test_encoding_follows_accept_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(negotiate_encoding('br;q=0, gzip'), 'gzip')
+        self.assertEqual(negotiate_encoding('*'), 'br')
+        self.assertEqual(negotiate_encoding('*;q=0, gzip'), 'gzip')
+        self.assertIsNone(negotiate_encoding('gzip;q=0'))
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding(None))
+
+    def test_gzip_body_round_trips(self):
+        response = self._respond('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(zlib.decompress(response.content, 31), self.BODY)
+
+    @skipIf(brotli is None, "brotli não instalado")
+    def test_brotli_body_round_trips(self):
+        response = self._respond('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.BODY)
+
+    def test_refused_encodings_leave_the_body_alone(self):
+        response = self._respond('br;q=0, gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.BODY)
+
+    def test_images_and_small_bodies_are_not_compressed(self):
+        self.assertFalse(self._respond('gzip, br', content_type='image/png').has_header('Content-Encoding'))
+        self.assertFalse(self._respond('gzip, br', body=b'{}').has_header('Content-Encoding'))
+
+
+@override_settings(CATALOG_MIRROR_ENABLED=False, RATE_LIMIT_ENABLED=False, RESPONSE_CACHE_ENABLED=False, COMPRESSION_MIN_SIZE=10)
+class HttpCachingTests(SimpleTestCase):
+    URL = '/api/v1/content-providers/list/'
+    SOURCES = {"data": {"sources": {"nodes": [{"id": str(i), "name": f"Fonte {i}", "lang": "pt"} for i in range(30)]}}}
+
+    def setUp(self):
+        upstream = mock.patch.object(views, 'execute_graphql', return_value=self.SOURCES)
+        upstream.start()
+        self.addCleanup(upstream.stop)
+
+    def test_etag_and_304(self):
+        first = self.client.get(self.URL)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], settings.API_CACHE_CONTROL['list_content_providers'])
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+        second = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH='"outro"').status_code, 200)
+
+    def test_weak_etag_after_compression_still_matches(self):
+        compressed = self.client.get(self.URL, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        plain_etag = self.client.get(self.URL)['ETag']
+        self.assertEqual(compressed['ETag'], 'W/' + plain_etag)
+        # O cliente devolve o ETag fraco que recebeu; a comparação do If-None-Match é fraca
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=compressed['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 304)
+
+    def test_view_cache_control_wins_over_the_route_policy(self):
+        body = tempfile.SpooledTemporaryFile()
+        body.write(b'imagem privada')
+        body.seek(0)
+        spooled = (body, 'image/png', 'private, no-store')
+        with mock.patch.object(image_proxy, '_fetch_origin', return_value=(None, spooled, 'MISS')):
+            response = self.client.get('/api/v1/image-proxy/?url=http://origem/privada.png')
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(b''.join(response.streaming_content), b'imagem privada')
+
+    def test_uncacheable_origin_header_is_forwarded(self):
+        self.assertEqual(image_proxy._forbidden_cache_control({'Cache-Control': 'no-store'}), 'no-store')
+        self.assertEqual(image_proxy._forbidden_cache_control({'Cache-Control': 'private, max-age=60'}), 'private, max-age=60')
+        self.assertIsNone(image_proxy._forbidden_cache_control({'Cache-Control': 'max-age=60'}))
+        self.assertIsNone(image_proxy._forbidden_cache_control({}))
+
+    def test_environment_overrides_the_route_policies(self):
+        code = (
+            "import django; django.setup(); from django.conf import settings; import json; "
+            "print(json.dumps(settings.API_CACHE_CONTROL))"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings',
+                   API_CACHE_CONTROL='{"search_content": "no-store", "nova_rota": "public, max-age=5"}')
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        policies = json.loads(output.strip().splitlines()[-1])
+        self.assertEqual(policies['search_content'], 'no-store')
+        self.assertEqual(policies['nova_rota'], 'public, max-age=5')
+        self.assertEqual(policies['image-proxy'], settings.API_CACHE_CONTROL['image-proxy'])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch.object(ratelimit.time, 'monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_capacity_and_refill(self):
+        buckets = ratelimit.LocalTokenBuckets()
+        self.assertEqual(buckets.take('ip', 10, 1.0, 4), (True, 6))
+        self.assertEqual(buckets.take('ip', 10, 1.0, 4), (True, 2))
+        self.assertEqual(buckets.take('ip', 10, 1.0, 4), (False, 2))
+        self.now += 2
+        self.assertEqual(buckets.take('ip', 10, 1.0, 4), (True, 0))
+        # A recarga não passa da capacidade
+        self.now += 100
+        self.assertEqual(buckets.take('ip', 10, 1.0, 0), (True, 10))
+        self.assertEqual(buckets.take('outro', 10, 1.0, 10), (True, 0))
+
+    @override_settings(REDIS_URL=None, RATE_LIMIT_PER_MINUTE=60, RATE_LIMIT_BURST=5)
+    def test_cost_is_clamped_and_retry_after_counts_the_refill(self):
+        with mock.patch.object(ratelimit, '_local', ratelimit.LocalTokenBuckets()):
+            first = ratelimit.take('ip', 20, 'search_content')
+            self.assertTrue(first.allowed)
+            self.assertEqual(first.remaining, 0)
+            second = ratelimit.take('ip', 20, 'search_content')
+            self.assertFalse(second.allowed)
+            self.assertEqual(second.retry_after, 5)
+            self.now += 2.5
+            self.assertEqual(ratelimit.take('ip', 1, 'search_content').remaining, 1)
+
+
+@override_settings(REDIS_URL='redis://127.0.0.1:1/0', RATE_LIMIT_REDIS_RETRY=60)
+class RedisBucketFallbackTests(SimpleTestCase):
+    def setUp(self):
+        import redis
+        self.shared = ratelimit.RedisTokenBuckets('redis://127.0.0.1:1/0')
+        self.script = mock.Mock(side_effect=redis.ConnectionError("recusada"))
+        self.shared._script = self.script
+        for target, value in (('_redis', self.shared), ('_local', ratelimit.LocalTokenBuckets())):
+            patcher = mock.patch.object(ratelimit, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_redis_down_falls_back_once_and_logs_once(self):
+        with self.assertLogs('api.ratelimit', 'WARNING') as logs:
+            for _ in range(5):
+                self.assertTrue(ratelimit.take('ip', 1, 'status_check').allowed)
+        self.assertEqual(self.script.call_count, 1)
+        self.assertEqual(len(logs.records), 1)
+
+    def test_recovery_is_logged(self):
+        with self.assertLogs('api.ratelimit', 'WARNING'):
+            ratelimit.take('ip', 1, 'status_check')
+        self.shared.breaker.reset_timeout = 0
+        self.script.side_effect = None
+        self.script.return_value = [1, b'9']
+        with self.assertLogs('api.ratelimit', 'INFO') as logs:
+            self.assertEqual(ratelimit.take('ip', 1, 'status_check').remaining, 9)
+            ratelimit.take('ip', 1, 'status_check')
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True, REDIS_URL=None, RATE_LIMIT_PER_MINUTE=60, RATE_LIMIT_BURST=2,
+    RATE_LIMIT_COSTS={'status_check': 1},
+)
+class RateLimitMiddlewareTests(SimpleTestCase):
+    def test_empty_bucket_answers_429_with_retry_after(self):
+        with mock.patch.object(ratelimit, '_local', ratelimit.LocalTokenBuckets()):
+            for remaining in ('1', '0'):
+                response = self.client.get('/api/v1/status/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['X-RateLimit-Remaining'], remaining)
+            response = self.client.get('/api/v1/status/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class ServerTimingTests(SimpleTestCase):
+    def test_header_format(self):
+        timings = timing.Timings()
+        timings.add('upstream', 0.0123)
+        timings.add('upstream', 0.001)
+        timings.add('outra', 0.5)
+        self.assertEqual(
+            timings.header(0.05),
+            'upstream;dur=13.3;desc="ExternalProvider", outra;dur=500.0;desc="outra", total;dur=50.0',
+        )
+
+    def test_nested_phase_is_excluded(self):
+        timings, token = timing.start()
+        try:
+            with timing.phase('upstream', exclude=('decode',)):
+                time.sleep(0.02)
+                with timing.phase('decode'):
+                    time.sleep(0.03)
+        finally:
+            timing.stop(token)
+        self.assertGreaterEqual(timings.get('decode'), 0.03)
+        self.assertLess(timings.get('upstream'), 0.03)
+        self.assertIsNone(timing.current())
+
+    @override_settings(
+        SERVER_TIMING_ENABLED=True, CATALOG_MIRROR_ENABLED=False, RATE_LIMIT_ENABLED=False,
+        RESPONSE_CACHE_ENABLED=False, UPSTREAM_COALESCING=False,
+    )
+    def test_response_carries_the_phases(self):
+        sources = {"data": {"sources": {"nodes": [{"id": "1", "name": "Fonte"}]}}}
+        with mock.patch.object(api_service, 'post_graphql', return_value=sources):
+            response = self.client.get('/api/v1/content-providers/list/')
+        entries = [entry.strip() for entry in response['Server-Timing'].split(',')]
+        self.assertRegex(entries[-1], r'^total;dur=\d+\.\d$')
+        names = [entry.split(';')[0] for entry in entries]
+        self.assertIn('upstream', names)
+        self.assertIn('format', names)
+        for entry in entries[:-1]:
+            self.assertRegex(entry, r'^[a-z]+;dur=\d+\.\d;desc="[^"]+"$')
+
+
+class CatalogUpsertTests(TestCase):
+    MANGA = {
+        "id": 7, "sourceId": "src", "title": "Título", "author": "Autor", "artist": "Artista",
+        "description": "Descrição", "status": "ONGOING", "genre": ["Ação"], "thumbnailUrl": "/thumb/7",
+    }
+
+    def _chapters(self, *ids):
+        return [
+            {"id": chapter_id, "name": f"Capítulo {chapter_id}", "chapterNumber": float(chapter_id), "scanlator": None, "uploadDate": "0"}
+            for chapter_id in ids
+        ]
+
+    def test_details_upsert_is_idempotent(self):
+        catalog._save_details(self.MANGA, self._chapters(3, 2, 1), complete=True)
+        catalog._save_details(self.MANGA, self._chapters(3, 2, 1), complete=True)
+        self.assertEqual(Manga.objects.count(), 1)
+        self.assertEqual(Provider.objects.count(), 1)
+        self.assertEqual(list(Chapter.objects.filter(manga_id=7).order_by('position').values_list('id', flat=True)), [3, 2, 1])
+        manga = Manga.objects.get(pk=7)
+        self.assertIsNotNone(manga.details_synced_at)
+        self.assertIsNotNone(manga.chapters_synced_at)
+
+    def test_details_upsert_applies_source_changes(self):
+        catalog._save_details(self.MANGA, self._chapters(3, 2, 1), complete=True)
+        catalog._save_details(dict(self.MANGA, title="Novo título"), self._chapters(4, 3, 1), complete=True)
+        self.assertEqual(Manga.objects.get(pk=7).title, "Novo título")
+        self.assertEqual(list(Chapter.objects.filter(manga_id=7).order_by('position').values_list('id', flat=True)), [4, 3, 1])
+
+    def test_search_upsert_keeps_columns_it_did_not_select(self):
+        catalog._save_details(self.MANGA, None, complete=True)
+        catalog._save_mangas([{"id": 7, "title": "Da busca"}])
+        catalog._save_mangas([{"id": 7, "title": "Da busca"}])
+        manga = Manga.objects.get(pk=7)
+        self.assertEqual(manga.title, "Da busca")
+        self.assertEqual(manga.description, "Descrição")
+        self.assertEqual(manga.genres, ["Ação"])
+        self.assertIsNotNone(manga.details_synced_at)
+        self.assertEqual(Manga.objects.count(), 1)
+
+    def test_providers_upsert_is_idempotent(self):
+        nodes = [{"id": 1, "name": "Fonte", "lang": "pt", "iconUrl": "/icon", "isNsfw": False}]
+        catalog._save_providers(nodes)
+        catalog._save_providers([dict(nodes[0], name="Fonte renomeada")])
+        self.assertEqual(Provider.objects.count(), 1)
+        self.assertEqual(Provider.objects.get(pk="1").name, "Fonte renomeada")
+
+
+@override_settings(CATALOG_MIRROR_ENABLED=True, CATALOG_MIRROR_MAX_AGE=600)
+class CatalogDatabaseDownTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(catalog, '_db_breaker', CircuitBreaker(failure_threshold=1, reset_timeout=60)),
+            mock.patch.object(catalog, '_pending', 1),
+            mock.patch.object(catalog, 'close_old_connections'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failure_skips_reads_and_writes_until_the_retry(self):
+        down = mock.patch.object(catalog.Manga.objects, 'filter', side_effect=OperationalError("no such table: api_manga"))
+        with down as query, self.assertLogs('api.catalog', 'WARNING') as logs:
+            self.assertIsNone(catalog.read_details(7))
+            self.assertIsNone(catalog.read_details(7))
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(len(logs.records), 1)
+
+        job = mock.Mock(__name__='job')
+        catalog._run(job)
+        job.assert_not_called()
+
+        later = time.monotonic() + 61
+        with mock.patch.object(resilience.time, 'monotonic', return_value=later), self.assertLogs('api.catalog', 'INFO'):
+            catalog._run(job)
+        job.assert_called_once_with()
+        self.assertEqual(catalog._db_breaker.state, CLOSED)
 
-# Create your tests here.
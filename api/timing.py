@@ -0,0 +1,105 @@
+# gateway_service/api/timing.py
+"""
+Tempo gasto por fase em cada requisição, devolvido no cabeçalho Server-Timing.
+
+O ServerTimingMiddleware abre um Timings por requisição numa ContextVar; o
+código instrumentado soma a duração de cada fase nele:
+
+* upstream: chamadas ao ExternalProvider, incluindo a espera por uma chamada
+  coalescida (sem o tempo de decode);
+* decode: leitura do JSON das respostas do ExternalProvider;
+* origin: requisições à origem das imagens (até os cabeçalhos);
+* catalog: leituras do espelho do catálogo no banco (api/catalog.py);
+* format: montagem das respostas (api/formatters.py);
+* render: serialização do JSON da resposta;
+* total: do início ao fim da requisição no middleware.
+
+Chamadas concorrentes numa mesma requisição (views assíncronas) somam as suas
+durações. Fora de uma requisição, ou em threads auxiliares (hedging, busca
+multi-provedor), as fases não são registradas.
+"""
+
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DESCRIPTIONS = {
+    'upstream': 'ExternalProvider',
+    'decode': 'JSON do ExternalProvider',
+    'origin': 'Origem das imagens',
+    'catalog': 'Espelho do catálogo',
+    'format': 'Formatação',
+    'render': 'Serialização',
+}
+
+_current = contextvars.ContextVar('server_timing', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def get(self, name):
+        return self.phases.get(name, 0.0)
+
+    def header(self, total):
+        entries = [
+            f'{name};dur={seconds * 1000:.1f};desc="{DESCRIPTIONS.get(name, name)}"'
+            for name, seconds in self.phases.items()
+        ]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def enabled():
+    return getattr(settings, 'SERVER_TIMING_ENABLED', True)
+
+def start():
+    """Abre o Timings da requisição. Retorna (timings, token para stop)."""
+    timings = Timings()
+    return timings, _current.set(timings)
+
+def stop(token):
+    _current.reset(token)
+
+def current():
+    return _current.get()
+
+@contextmanager
+def phase(name, exclude=()):
+    """
+    Soma a duração do bloco à fase `name`, descontando o que foi registrado
+    nas fases de `exclude` durante o bloco (ex.: decode dentro de upstream).
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    nested = sum(timings.get(other) for other in exclude)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.add(name, elapsed - (sum(timings.get(other) for other in exclude) - nested))
+
+def timed(name):
+    """Decorador: registra cada chamada da função na fase `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(response, timings, total):
+    value = timings.header(total)
+    existing = response.get('Server-Timing')
+    response.headers['Server-Timing'] = f'{existing}, {value}' if existing else value
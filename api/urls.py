@@ -1,12 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    # Sob ASGI as views que falam com o ExternalProvider usam o cliente assíncrono
+    from . import async_views as upstream_views
+else:
+    upstream_views = views
+
 urlpatterns = [
     path('status/', views.status_check, name='status_check'),
-    path('content-providers/list/', views.list_content_providers, name='list_content_providers'),
-    path('content-discovery/search/', views.search_content, name='search_content'),
-    path('content-discovery/filters/', views.SourceFiltersView.as_view(), name='get_source_filters'),
-    path('content/item/<str:provider_id>/<str:content_id>/detail/', views.get_manga_details, name='get_manga_details'),
-    path('content/item/<str:provider_id>/<str:content_id>/chapter/<str:chapter_id>/pages/', views.get_chapter_pages, name='get_chapter_pages'),
-    path('image-proxy/', views.image_proxy, name='image-proxy'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('content-providers/list/', upstream_views.list_content_providers, name='list_content_providers'),
+    path('content-discovery/search/', upstream_views.search_content, name='search_content'),
+    path('content-discovery/autocomplete/', upstream_views.autocomplete_titles, name='autocomplete'),
+    path('content-discovery/search/multi/', upstream_views.search_content_multi, name='search_content_multi'),
+    path('content-discovery/filters/', upstream_views.SourceFiltersView.as_view(), name='get_source_filters'),
+    path('content/item/<str:provider_id>/<str:content_id>/detail/', upstream_views.get_manga_details, name='get_manga_details'),
+    path('content/items/detail/', upstream_views.get_manga_details_batch, name='get_manga_details_batch'),
+    path('content/item/<str:provider_id>/<str:content_id>/chapter/<str:chapter_id>/pages/', upstream_views.get_chapter_pages, name='get_chapter_pages'),
+    path('content/item/<str:provider_id>/<str:content_id>/chapter/<str:chapter_id>/download/', upstream_views.download_chapter, name='download_chapter'),
+    path('image-proxy/', upstream_views.image_proxy, name='image-proxy'),
 ]
@@ -1,232 +1,389 @@
+import json
+import logging
+import time
 import requests
-from urllib.parse import urljoin
 from django.conf import settings
-from django.http import StreamingHttpResponse, JsonResponse
-from django_ratelimit.decorators import ratelimit
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from .api_service import execute_externalprovider_query # Assumindo que api_service.py também será atualizado
+from . import autocomplete, catalog, feeds, metrics
+from .api_service import UpstreamError, execute_graphql
+from .cache import get_or_fetch
+from .chapter_archive import ARCHIVE_FORMATS, ChapterArchive, archive_response
+from .fields import DETAILS_FIELDS, SEARCH_FIELDS, manga_selection, parse_fields, wants_chapters
+from .formatters import (
+    format_chapter_pages, format_chapters_page, format_manga_details, format_providers, format_search_results,
+)
+from .image_transform import parse_variant
+from .image_proxy import OriginBusy, prefetch_original, proxy_image, resolve_image_url
+from .prefetch import pages_to_prefetch, schedule as schedule_prefetch
+from .renderers import FastJsonResponse
+from .search_fanout import NDJSON_CONTENT_TYPE, iter_search, select_providers
+from .queries import (
+    FETCH_CHAPTER_PAGES_MUTATION, GET_SOURCE_BROWSE_QUERY, GET_SOURCES_LIST_QUERY,
+    manga_chapters_operation, manga_details_batch_operation, manga_details_operation, source_manga_operation,
+)
 
-# --- Função Auxiliar ---
-def _make_graphql_request(query, variables=None, timeout=30):
-    external_provider_url = settings.EXTERNAL_PROVIDER_API_URL
-    external_provider_url_2 = getattr(settings, 'EXTERNAL_PROVIDER_API_URL_2', None)
-    json_payload = {'query': query, 'variables': variables or {}}
+logger = logging.getLogger(__name__)
+
+# --- Funções Auxiliares ---
+def _upstream_error_response(error, response_class=FastJsonResponse, body=None):
+    """Resposta de uma UpstreamError (com body no lugar de as_dict()); recusas por sobrecarga levam Retry-After."""
+    response = response_class(error.as_dict() if body is None else body, status=error.status_code)
+    if error.retry_after:
+        response['Retry-After'] = str(error.retry_after)
+    return response
+
+def _make_graphql_request(query, variables=None, timeout=30, cached=False, partial=False):
+    """
+    Executa a operação no ExternalProvider. Retorna (data, None) ou (None, Response de erro).
+    Com cached=True a resposta passa pelo cache TTL/stale-while-revalidate de api/cache.py;
+    com partial=True respostas com erros em parte dos campos são devolvidas como dados.
+    """
     try:
-        response = requests.post(external_provider_url, json=json_payload, timeout=timeout)
-        response.raise_for_status()
-        data = response.json()
-        if 'errors' in data and external_provider_url_2:
-            # Se a resposta da primeira URL tem erro, tenta a segunda
-            response2 = requests.post(external_provider_url_2, json=json_payload, timeout=timeout)
-            response2.raise_for_status()
-            data2 = response2.json()
-            if 'errors' in data2:
-                return None, Response({"error": "Erro nas duas APIs GraphQL do ExternalProvider.", "details": [data['errors'], data2['errors']]}, status=status.HTTP_502_BAD_GATEWAY)
-            return data2, None
-        if 'errors' in data:
-            return None, Response({"error": "Erro na resposta da API GraphQL do ExternalProvider.", "details": data['errors']}, status=status.HTTP_502_BAD_GATEWAY)
-        return data, None
-    except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
-        # Se a primeira URL falhar, tenta a segunda
-        if external_provider_url_2:
-            try:
-                response2 = requests.post(external_provider_url_2, json=json_payload, timeout=timeout)
-                response2.raise_for_status()
-                data2 = response2.json()
-                if 'errors' in data2:
-                    return None, Response({"error": "Erro na segunda API GraphQL do ExternalProvider.", "details": data2['errors']}, status=status.HTTP_502_BAD_GATEWAY)
-                return data2, None
-            except Exception as e2:
-                return None, Response({"error": "Falha ao comunicar com ambas as APIs do ExternalProvider.", "details": [str(e), str(e2)]}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        return None, Response({"error": "Falha ao comunicar com o ExternalProvider-Server.", "details": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if cached:
+            return get_or_fetch(query, variables, lambda: execute_graphql(query, variables, timeout=timeout)), None
+        return execute_graphql(query, variables, timeout=timeout, partial=partial), None
+    except UpstreamError as e:
+        return None, _upstream_error_response(e, Response)
+
+def _parse_fields(params, allowed):
+    """Lê ?fields= contra a lista do endpoint. Retorna (campos ou None, None) ou (None, corpo do erro 400)."""
+    try:
+        return parse_fields(params.get('fields'), allowed), None
     except ValueError as e:
-        return None, Response({"error": "Resposta inválida do ExternalProvider-Server (formato não JSON).", "details": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return None, {"error": f"Campos inválidos em 'fields': {e}.", "details": {"allowed": list(allowed)}}
+
+def _parse_search_params(params):
+    """
+    Valida os parâmetros de search_content. Retorna (busca, None) ou (None, corpo do erro 400).
+    """
+    provider_id = params.get('provider_id')
+    search_type = params.get('type', 'SEARCH').upper()
+    query_term = params.get('query')
+    try:
+        page = int(params.get('page', 1))
+    except ValueError:
+        return None, {"error": "O parâmetro 'page' deve ser um número válido."}
+    # Aceita filtros customizados como JSON serializado
+    filters_json = params.get('filters')
+    filters_dict = None
+    if filters_json:
+        try:
+            filters_dict = json.loads(filters_json)
+        except Exception as e:
+            return None, {"error": "Formato inválido para o parâmetro 'filters' (deve ser JSON serializado).", "details": str(e)}
+
+    if not provider_id:
+        return None, {"error": "Parâmetro 'provider_id' é obrigatório."}
+    if search_type not in ('SEARCH', 'POPULAR', 'LATEST'):
+        return None, {"error": f"Tipo de busca inválido: '{search_type}'. Use 'POPULAR', 'LATEST' ou 'SEARCH'."}
+    if search_type == 'SEARCH' and not query_term and not filters_dict:
+        return None, {"error": "Parâmetro 'query' ou 'filters' é obrigatório para o tipo 'SEARCH'."}
+    fields, error_body = _parse_fields(params, SEARCH_FIELDS)
+    if error_body:
+        return None, error_body
+    return {
+        "search_type": search_type,
+        "provider_id": provider_id,
+        "page": page,
+        "query_term": query_term,
+        "filters": filters_dict,
+        "fields": fields,
+    }, None
+
+def _parse_fanout_params(params):
+    """
+    Valida os parâmetros de search_content_multi. Retorna (busca, None) ou (None, corpo do erro 400).
+    provider_ids vazio ou 'all' significa todos os provedores (filtráveis por 'lang').
+    """
+    query_term = params.get('query')
+    if not query_term:
+        return None, {"error": "Parâmetro 'query' é obrigatório."}
+    try:
+        page = int(params.get('page', 1))
+    except ValueError:
+        return None, {"error": "O parâmetro 'page' deve ser um número válido."}
+    fields, error_body = _parse_fields(params, SEARCH_FIELDS)
+    if error_body:
+        return None, error_body
+    raw_ids = params.get('provider_ids', '')
+    provider_ids = None if raw_ids in ('', 'all') else [p.strip() for p in raw_ids.split(',') if p.strip()]
+    return {"query_term": query_term, "page": page, "provider_ids": provider_ids, "lang": params.get('lang'), "fields": fields}, None
+
+def _fanout_providers(search, providers_list):
+    """Ids a consultar na busca multi-provedor, ou (None, corpo do erro 400) se passar do limite."""
+    provider_ids = select_providers(providers_list, search["provider_ids"], search["lang"])
+    max_providers = getattr(settings, 'SEARCH_FANOUT_MAX_PROVIDERS', 50)
+    if len(provider_ids) > max_providers:
+        return None, {"error": f"No máximo {max_providers} provedores por busca. Use 'provider_ids' ou 'lang' para restringir."}
+    return provider_ids, None
+
+def _parse_chapter_paging(params):
+    """
+    Lê ?limit= e ?cursor= de get_manga_details. Retorna ((limit, cursor), None)
+    ou (None, corpo do erro 400); limit None mantém a lista completa de capítulos.
+    """
+    limit = params.get('limit')
+    cursor = params.get('cursor') or None
+    if limit in (None, ''):
+        if not cursor:
+            return (None, None), None
+        limit = getattr(settings, 'CHAPTERS_PAGE_DEFAULT_LIMIT', 50)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return None, {"error": "O parâmetro 'limit' deve ser um número válido."}
+    max_limit = getattr(settings, 'CHAPTERS_PAGE_MAX_LIMIT', 500)
+    if not 1 <= limit <= max_limit:
+        return None, {"error": f"O parâmetro 'limit' deve estar entre 1 e {max_limit}."}
+    return (limit, cursor), None
+
+def _chapters_from_response(chapters_data, limit):
+    """Extrai (capítulos, chapters_page) da resposta de manga_chapters_operation."""
+    connection = (chapters_data or {}).get("data", {}).get("chapters") or {}
+    chapters_page = format_chapters_page(limit, connection) if limit is not None else None
+    return connection.get("nodes", []), chapters_page
+
+def _parse_batch_ids(raw_ids):
+    """
+    Interpreta ?ids=<provider_id>:<content_id>,... de get_manga_details_batch.
+    Retorna (itens, None) ou (None, corpo do erro 400). Itens com content_id
+    inválido recebem o erro individual já aqui.
+    """
+    entries = [entry.strip() for entry in (raw_ids or '').split(',') if entry.strip()]
+    if not entries:
+        return None, {"error": "Parâmetro 'ids' é obrigatório (formato: provider_id:content_id,...)."}
+    max_items = getattr(settings, 'BATCH_DETAILS_MAX_ITEMS', 50)
+    if len(entries) > max_items:
+        return None, {"error": f"No máximo {max_items} itens por requisição."}
+    items = []
+    for entry in entries:
+        provider_id, separator, content_id = entry.rpartition(':')
+        item = {"provider_id": provider_id or None, "content_id": content_id, "manga_id": None}
+        if not separator or not provider_id:
+            item["error"] = (400, {"error": f"Item inválido: '{entry}'. Use provider_id:content_id."})
+        else:
+            try:
+                item["manga_id"] = int(content_id)
+            except ValueError:
+                item["error"] = (400, {"error": "O content_id deve ser um número válido."})
+        items.append(item)
+    return items, None
+
+def _collect_batch(manga_ids, data, fetched, failed):
+    """
+    Separa a resposta do documento em lote (aliases m<i>/c<i>) por mangá:
+    preenche fetched[id] = (manga, capítulos) e failed[id] = (status, corpo).
+    Erros em m<i> ou c<i> pertencem ao item i. Retorna os ids a repetir quando
+    um campo não-nulo com erro de outro item anulou a resposta inteira
+    (`data: null`).
+    """
+    body = data.get("data") or {}
+    nulled = data.get("data") is None
+    errors_by_alias = {}
+    for error in data.get("errors", []):
+        path = error.get("path") or []
+        if path:
+            errors_by_alias.setdefault(path[0], []).append(error)
+
+    retry = []
+    for i, manga_id in enumerate(manga_ids):
+        manga = body.get(f"m{i}")
+        errors = errors_by_alias.get(f"m{i}", []) + errors_by_alias.get(f"c{i}", [])
+        # Com a resposta inteira anulada, erro nos capítulos também derruba o item
+        if f"m{i}" in errors_by_alias or (nulled and errors):
+            failed[manga_id] = (502, {"error": "Erro na resposta da API GraphQL do ExternalProvider.", "details": errors})
+        elif manga:
+            # Como em get_manga_details, falha nos capítulos resulta em lista vazia
+            fetched[manga_id] = (manga, (body.get(f"c{i}") or {}).get("nodes", []))
+        elif nulled:
+            retry.append(manga_id)
+        else:
+            failed[manga_id] = (404, {"error": f"Conteúdo com id '{manga_id}' não encontrado ou dados de mangá ausentes na resposta."})
+    if len(retry) == len(manga_ids):
+        # Nenhum alias identificado como culpado: não há o que remover do lote
+        for manga_id in retry:
+            failed[manga_id] = (502, {"error": "Erro na resposta da API GraphQL do ExternalProvider.", "details": data.get("errors")})
+        return []
+    return retry
+
+def _batch_results(items, fetched, failed, fields=None):
+    """Monta a lista de resultados na ordem pedida, com status e erro por item."""
+    results = []
+    for item in items:
+        result = {"provider_id": item["provider_id"], "content_id": item["content_id"]}
+        manga_id = item["manga_id"]
+        if manga_id in fetched:
+            result["status"] = 200
+            result["data"] = format_manga_details(*fetched[manga_id], fields=fields)
+        else:
+            status_code, error_body = item.get("error") or failed[manga_id]
+            result["status"] = status_code
+            result.update(error_body)
+        results.append(result)
+    return {"results": results}
+
+def _origin_busy_response(error):
+    """503 imediato quando o host das imagens está no limite de downloads simultâneos."""
+    metrics.count_image_error('origin_busy')
+    response = FastJsonResponse({"error": str(error)}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+def _parse_archive_request(chapter_id, params):
+    """Valida chapter_id e ?format= do download. Retorna (variáveis GraphQL, formato, None) ou (None, None, corpo do erro 400)."""
+    try:
+        chapter_id_as_int = int(chapter_id)
+    except ValueError:
+        return None, None, {"error": "O chapter_id fornecido não é um número válido."}
+    archive_format = params.get('format', 'cbz').lower()
+    if archive_format not in ARCHIVE_FORMATS:
+        return None, None, {"error": f"Formato inválido: '{archive_format}'. Use {' ou '.join(ARCHIVE_FORMATS)}."}
+    return {"input": {"chapterId": chapter_id_as_int}}, archive_format, None
+
+def _archive_page_urls(data, chapter_id):
+    """URLs absolutas das páginas para o download. Retorna (urls, None) ou (None, (corpo do erro, status))."""
+    pages_data = (data or {}).get("data", {}).get("fetchChapterPages", {})
+    if not isinstance(pages_data, dict) or not pages_data.get("pages"):
+        return None, ({"error": f"Páginas para o capítulo '{chapter_id}' não encontradas ou resposta inválida do ExternalProvider."}, 404)
+    page_urls = [resolve_image_url(url) for url in pages_data["pages"]]
+    if None in page_urls:
+        return None, ({"error": "EXTERNAL_PROVIDER_BASE_URL não está configurada."}, 500)
+    return page_urls, None
+
+def _archive_error_response(error, chapter_id):
+    """Resposta para a falha da primeira página do download (antes de qualquer byte do arquivo)."""
+    if isinstance(error, OriginBusy):
+        return _origin_busy_response(error)
+    metrics.count_image_error(error)
+    logger.warning("Falha ao buscar as páginas do capítulo %s: %s", chapter_id, error)
+    return FastJsonResponse({"error": f"Falha ao buscar as páginas do capítulo '{chapter_id}': {error}"}, status=502)
+
+def _prefetch_pages(page_urls, requested):
+    """Aquece o cache de imagens com as primeiras páginas (opt-in via ?prefetch=N ou IMAGE_PREFETCH_PAGES)."""
+    count = pages_to_prefetch(requested)
+    if count:
+        schedule_prefetch([resolve_image_url(url) for url in page_urls[:count] if url], prefetch_original)
 
 # --- Views da API ---
 
-@ratelimit(key='ip', rate=f'{settings.RATE_LIMIT_PER_MINUTE}/m', method='ALL', block=True)
 @api_view(['GET'])
 def status_check(request):
     return Response({"status": "ok", "message": "API Gateway está funcionando!"})
 
 @api_view(['GET'])
 def list_content_providers(request):
-    graphql_query = "query GetSourcesList { sources { nodes { id, name, lang, iconUrl, isNsfw } } }"
-    data, error_response = _make_graphql_request(graphql_query)
+    data, error_response = _make_graphql_request(GET_SOURCES_LIST_QUERY, cached=True)
     if error_response: return error_response
     # Adicionando verificação se data é None antes de prosseguir
     if data is None:
         return Response({"error": "Não foi possível obter dados da API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
     providers_list = data.get("data", {}).get("sources", {}).get("nodes", [])
-    formatted_providers = [{"id": p.get("id"),"name": p.get("name"),"language": p.get("lang"),"icon_url_proxy": f"/api/v1/image-proxy/?url={p.get('iconUrl')}" if p.get("iconUrl") else None,"is_nsfw": p.get("isNsfw")} for p in providers_list]
-    return Response(formatted_providers)
+    catalog.record_providers(providers_list)
+    return Response(format_providers(providers_list))
 
 @api_view(['GET'])
 def search_content(request):
-    provider_id = request.query_params.get('provider_id')
-    search_type = request.query_params.get('type', 'SEARCH').upper()
-    query_term = request.query_params.get('query')
-    page = int(request.query_params.get('page', 1))
-    # Novo: Aceita filtros customizados como JSON serializado
-    import json
-    filters_json = request.query_params.get('filters')
-    filters_dict = None
-    if filters_json:
-        try:
-            filters_dict = json.loads(filters_json)
-        except Exception as e:
-            return Response({"error": "Formato inválido para o parâmetro 'filters' (deve ser JSON serializado).", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    search, error_body = _parse_search_params(request.query_params)
+    if error_body:
+        return Response(error_body, status=status.HTTP_400_BAD_REQUEST)
+    body = feeds.lookup(search)
+    if body is not None:
+        return Response(body)
 
-    if not provider_id:
-        return Response({"error": "Parâmetro 'provider_id' é obrigatório."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    mangas_list, has_more = [], False
-    data = None # Inicializa data como None
-
-    if search_type == 'SEARCH':
-        if not query_term and not filters_dict:
-            return Response({"error": "Parâmetro 'query' ou 'filters' é obrigatório para o tipo 'SEARCH'."}, status=status.HTTP_400_BAD_REQUEST)
-        graphql_mutation = """
-        fragment MANGA_BASE_FIELDS on MangaType {
-            id
-            title
-            thumbnailUrl
-            thumbnailUrlLastFetched
-            inLibrary
-            initialized
-            sourceId
-            __typename
-        }
-        mutation GET_SOURCE_MANGAS_FETCH($input: FetchSourceMangaInput!) {
-            fetchSourceManga(input: $input) {
-                hasNextPage
-                mangas {
-                    ...MANGA_BASE_FIELDS
-                    __typename
-                }
-                __typename
-            }
-        }
-        """
-        # Novo: repassa os filtros customizados se existirem
-        input_payload = {
-            "type": "SEARCH",
-            "source": provider_id,
-            "page": page
-        }
-        if query_term:
-            input_payload["query"] = query_term
-        if filters_dict:
-            input_payload["filters"] = filters_dict
-        variables = {"input": input_payload}
-        data, error_response = _make_graphql_request(graphql_mutation, variables, timeout=60)
-        if error_response: return error_response
-        if data is None:
-            return Response({"error": "Não foi possível obter dados da busca na API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
-        results_data = data.get("data", {}).get("fetchSourceManga", {})
-        mangas_list = results_data.get("mangas", [])
-        has_more = results_data.get("hasNextPage", False)
-    elif search_type == 'POPULAR':
-        page = int(request.query_params.get('page', 1))
-        graphql_mutation = "mutation FetchSourceManga($input: FetchSourceMangaInput!) { fetchSourceManga(input: $input) { hasNextPage, mangas { id, title, thumbnailUrl, sourceId } } }"
-        variables = {"input": {"type": "POPULAR", "source": provider_id, "page": page}}
-        data, error_response = _make_graphql_request(graphql_mutation, variables, timeout=60)
-        if error_response: return error_response
-        if data is None: # Verificação de data
-            return Response({"error": "Não foi possível obter dados de populares na API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
-        results_data = data.get("data", {}).get("fetchSourceManga", {})
-        mangas_list = results_data.get("mangas", [])
-        has_more = results_data.get("hasNextPage", False)
-    elif search_type == 'LATEST':
-        page = int(request.query_params.get('page', 1))
-        graphql_mutation = "mutation FetchSourceManga($input: FetchSourceMangaInput!) { fetchSourceManga(input: $input) { hasNextPage, mangas { id, title, thumbnailUrl, sourceId } } }"
-        variables = {"input": {"type": "LATEST", "source": provider_id, "page": page}}
-        data, error_response = _make_graphql_request(graphql_mutation, variables, timeout=60)
-        if error_response: return error_response
-        if data is None: # Verificação de data
-            return Response({"error": "Não foi possível obter dados de latest na API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
-        results_data = data.get("data", {}).get("fetchSourceManga", {})
-        mangas_list = results_data.get("mangas", [])
-        has_more = results_data.get("hasNextPage", False)
-    else:
-        return Response({"error": f"Tipo de busca inválido: '{search_type}'. Use 'POPULAR', 'LATEST' ou 'SEARCH'."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    formatted_results = [{"provider_id": item.get("sourceId"),"content_id": str(item.get("id")),"title": item.get("title"),"thumbnail_url_proxy": f"/api/v1/image-proxy/?url={item.get('thumbnailUrl')}" if item.get("thumbnailUrl") else None} for item in mangas_list]
-    return Response({"results": formatted_results, "has_more": has_more})
+    graphql_mutation, variables = source_manga_operation(
+        search["search_type"], search["provider_id"], search["page"], search["query_term"], search["filters"],
+        selection=manga_selection(search["fields"]),
+    )
+    data, error_response = _make_graphql_request(graphql_mutation, variables, timeout=60)
+    if error_response: return error_response
+    if data is None:
+        return Response({"error": "Não foi possível obter dados da busca na API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
+    results_data = data.get("data", {}).get("fetchSourceManga", {})
+    mangas_list = results_data.get("mangas", [])
+    has_more = results_data.get("hasNextPage", False)
+    catalog.record_search(mangas_list)
+    autocomplete.add_mangas(mangas_list)
+    feeds.record(search, mangas_list, has_more)
+    return Response({"results": format_search_results(mangas_list, search["fields"]), "has_more": has_more})
 
 @api_view(['GET'])
 def get_manga_details(request, provider_id, content_id):
     """
     Busca os detalhes e a lista de capítulos de um mangá específico,
     com a estrutura de variáveis para a busca de capítulos corrigida.
+    Com ?limit= (e ?cursor= da resposta anterior) devolve só uma página de capítulos;
+    com ?fields= só os campos pedidos são buscados (sem "chapters", a segunda chamada é omitida).
+    Sem paginação, responde pelo espelho do catálogo (api/catalog.py) se ele estiver em dia.
     """
     try:
         manga_id_as_int = int(content_id)
     except ValueError:
         return Response({"error": "O content_id deve ser um número válido."}, status=status.HTTP_400_BAD_REQUEST)
+    paging, error_body = _parse_chapter_paging(request.query_params)
+    if not error_body:
+        fields, error_body = _parse_fields(request.query_params, DETAILS_FIELDS)
+    if error_body:
+        return Response(error_body, status=status.HTTP_400_BAD_REQUEST)
+    limit, cursor = paging
+
+    mirrored = catalog.read_details(manga_id_as_int, fields) if limit is None else None
+    if mirrored:
+        return Response(format_manga_details(*mirrored, None, fields))
 
     # 1. Primeira Chamada: Buscar os detalhes do Mangá
-    details_query = "query GetMangaDetails($id: Int!) { manga(id: $id) { id, sourceId, title, author, artist, description, genre, status, thumbnailUrl } }"
-    details_data, error_response = _make_graphql_request(details_query, {"id": manga_id_as_int})
+    details_data, error_response = _make_graphql_request(*manga_details_operation(manga_id_as_int, manga_selection(fields)))
     if error_response: return error_response
-    
+
     # Adicionando a verificação para details_data como sugerido anteriormente para robustez
     if details_data is None:
         return Response({"error": "Não foi possível obter dados de detalhes do mangá da API ExternalProvider (details_data is None)."}, status=status.HTTP_502_BAD_GATEWAY)
-        
+
     manga_details = details_data.get("data", {}).get("manga")
     if not manga_details:
         return Response({"error": f"Conteúdo com id '{content_id}' não encontrado ou dados de mangá ausentes na resposta."}, status=status.HTTP_404_NOT_FOUND)
 
     # 2. Segunda Chamada: Buscar a lista de Capítulos
-    chapters_query = "query GetMangaChapters($condition: ChapterConditionInput, $order: [ChapterOrderInput!]) { chapters(condition: $condition, order: $order) { nodes { id, name, chapterNumber, scanlator, uploadDate } } }"
-    
-    chapters_variables = {
-        "condition": {
-            "mangaId": manga_id_as_int
-        },
-        "order": [{
-            "by": "SOURCE_ORDER",
-            "byType": "DESC"
-        }]
-    }
-
-    chapters_data, error_response = _make_graphql_request(chapters_query, variables=chapters_variables)
-    chapters_list = []
-    if not error_response:
-        # Adicionando verificação para chapters_data para robustez
-        if chapters_data is None:
-            # Considerar logar isso ou decidir se é um erro que deve parar o fluxo
-            # Por enquanto, permite que a resposta seja enviada com capítulos vazios se a query falhar silenciosamente
-            pass # chapters_list permanecerá vazia
-        else:
-            chapters_list = chapters_data.get("data", {}).get("chapters", {}).get("nodes", [])
+    chapters_list, chapters_page = [], None
+    full_chapters = None
+    if wants_chapters(fields):
+        chapters_query, chapters_variables = manga_chapters_operation(manga_id_as_int, limit, cursor)
+        chapters_data, error_response = _make_graphql_request(chapters_query, variables=chapters_variables)
+        # Se a busca de capítulos falhar, a resposta é enviada com capítulos vazios
+        chapters_list, chapters_page = _chapters_from_response(None if error_response else chapters_data, limit)
+        if not error_response and limit is None:
+            full_chapters = chapters_list
+    catalog.record_details(manga_details, full_chapters, complete=fields is None)
+    autocomplete.add_mangas([manga_details])
 
     # 3. Montar a resposta final
-    final_response = {
-        "provider_id": manga_details.get("sourceId"), 
-        "content_id": str(manga_details.get("id")),
-        "title": manga_details.get("title"), 
-        "author": manga_details.get("author"), 
-        "artist": manga_details.get("artist"),
-        "description": manga_details.get("description"), 
-        "status": manga_details.get("status"), 
-        "genres": manga_details.get("genre", []),
-        "thumbnail_url_proxy": f"/api/v1/image-proxy/?url={manga_details.get('thumbnailUrl')}" if manga_details.get("thumbnailUrl") else None,
-        "chapters": [
-            {
-                "id": str(c.get("id")),
-                "name": c.get("name"),
-                "chapter_number": c.get("chapterNumber"),
-                "scanlator": c.get("scanlator"),
-                "uploaded_at": c.get("uploadDate")
-            } for c in chapters_list
-        ]
-    }
-    return Response(final_response)
+    return Response(format_manga_details(manga_details, chapters_list, chapters_page, fields))
+
+@api_view(['GET'])
+def get_manga_details_batch(request):
+    """
+    Detalhes e capítulos de vários mangás (?ids=provider_id:content_id,...) com
+    uma única requisição ao ExternalProvider, usando aliases GraphQL.
+    Erros são reportados por item; a resposta é 200 se o upstream respondeu.
+    """
+    items, error_body = _parse_batch_ids(request.query_params.get('ids'))
+    if not error_body:
+        fields, error_body = _parse_fields(request.query_params, DETAILS_FIELDS)
+    if error_body:
+        return Response(error_body, status=status.HTTP_400_BAD_REQUEST)
+
+    fetched, failed = {}, {}
+    pending = list(dict.fromkeys(item["manga_id"] for item in items if item["manga_id"] is not None))
+    while pending:
+        query, variables = manga_details_batch_operation(pending, manga_selection(fields), wants_chapters(fields))
+        data, error_response = _make_graphql_request(query, variables, partial=True)
+        if error_response: return error_response
+        pending = _collect_batch(pending, data, fetched, failed)
+    return Response(_batch_results(items, fetched, failed, fields))
 
 @api_view(['GET'])
 def get_chapter_pages(request, provider_id, content_id, chapter_id):
@@ -239,86 +396,119 @@ def get_chapter_pages(request, provider_id, content_id, chapter_id):
         return Response({"error": "O chapter_id fornecido não é um número válido."}, status=status.HTTP_400_BAD_REQUEST)
 
     # 2.1: Terceira Chamada (Backend) -> GET_CHAPTER_PAGES_FETCH para obter as URLs das páginas.
-    graphql_mutation = "mutation FetchChapterPages($input: FetchChapterPagesInput!) { fetchChapterPages(input: $input) { pages } }"
     variables = {"input": {"chapterId": chapter_id_as_int}}
-    data, error_response = _make_graphql_request(graphql_mutation, variables, timeout=90)
+    data, error_response = _make_graphql_request(FETCH_CHAPTER_PAGES_MUTATION, variables, timeout=90)
     if error_response: return error_response
     if data is None: # Verificação de data
         return Response({"error": "Não foi possível obter dados das páginas do capítulo na API ExternalProvider."}, status=status.HTTP_502_BAD_GATEWAY)
-    
+
     pages_data = data.get("data", {}).get("fetchChapterPages", {})
-    # A verificação de pages_data e "pages" in pages_data já estava boa
     if pages_data is None or not isinstance(pages_data, dict) or "pages" not in pages_data or pages_data.get("pages") is None:
         return Response({"error": f"Páginas para o capítulo '{chapter_id}' não encontradas ou resposta inválida do ExternalProvider."}, status=status.HTTP_404_NOT_FOUND)
-        
-    page_urls = pages_data.get("pages", [])
-    if page_urls is None: page_urls = [] # Segurança adicional
-
-    # Retornando a estrutura completa como na versão anterior que funcionava
-    formatted_pages = [
-        {
-            "page_index": i, 
-            "proxy_image_url": f"/api/v1/image-proxy/?url={url}" if url else None,
-            "original_url": url # Incluindo a original_url
-        } for i, url in enumerate(page_urls)
-    ]
-    return Response({
-        "provider_id": provider_id,
-        "content_id": content_id,
-        "chapter_id": chapter_id,
-        "pages": formatted_pages
-    })
 
-@api_view(['GET'])
+    page_urls = pages_data.get("pages", []) or []
+    _prefetch_pages(page_urls, request.query_params.get('prefetch'))
+    return Response(format_chapter_pages(provider_id, content_id, chapter_id, page_urls))
+
+@require_GET
+def download_chapter(request, provider_id, content_id, chapter_id):
+    """
+    Capítulo inteiro num só arquivo CBZ (?format=zip para .zip), gerado em
+    streaming na ordem das páginas. View Django simples: a resposta é binária.
+    """
+    variables, archive_format, error_body = _parse_archive_request(chapter_id, request.GET)
+    if error_body:
+        return FastJsonResponse(error_body, status=400)
+    try:
+        data = execute_graphql(FETCH_CHAPTER_PAGES_MUTATION, variables, timeout=90)
+    except UpstreamError as e:
+        return _upstream_error_response(e)
+    page_urls, error = _archive_page_urls(data, chapter_id)
+    if error:
+        return FastJsonResponse(error[0], status=error[1])
+    archive = ChapterArchive(page_urls)
+    try:
+        archive.prepare()
+    except (OriginBusy, requests.exceptions.RequestException, OSError) as e:
+        return _archive_error_response(e, chapter_id)
+    return archive_response(archive, f"{provider_id}-{content_id}-{chapter_id}", archive_format)
+
+@require_GET
 def image_proxy(request):
-    original_url = request.query_params.get('url')
+    """
+    Proxy de imagens. View Django simples (sem @api_view): a resposta é binária e
+    a negociação de conteúdo do DRF recusaria clientes com Accept: image/webp.
+    """
+    original_url = request.GET.get('url')
     if not original_url:
-        return Response({"error": "Parâmetro 'url' não fornecido."}, status=status.HTTP_400_BAD_REQUEST)
-    if original_url.startswith('/'):
-        external_provider_base_url = settings.EXTERNAL_PROVIDER_BASE_URL
-        if not external_provider_base_url:
-             return Response({"error": "EXTERNAL_PROVIDER_BASE_URL não está configurada."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        full_image_url = urljoin(external_provider_base_url, original_url)
-    else:
-        full_image_url = original_url
+        return FastJsonResponse({"error": "Parâmetro 'url' não fornecido."}, status=400)
+    full_image_url = resolve_image_url(original_url)
+    if full_image_url is None:
+        return FastJsonResponse({"error": "EXTERNAL_PROVIDER_BASE_URL não está configurada."}, status=500)
     try:
-        # Adicionando User-Agent como na versão anterior bem-sucedida
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        print(f"Proxying image from: {full_image_url}")
-        response = requests.get(full_image_url, stream=True, timeout=20, headers=headers)
-        response.raise_for_status()
-        return StreamingHttpResponse(response.iter_content(chunk_size=8192), content_type=response.headers['Content-Type'])
+        variant = parse_variant(request.GET, request.headers.get('Accept'))
+    except ValueError as e:
+        return FastJsonResponse({"error": "Parâmetros de imagem inválidos ('w'/'q').", "details": str(e)}, status=400)
+    started = time.monotonic()
+    try:
+        return metrics.track_image_response(proxy_image(full_image_url, request.headers.get('Range'), variant), started)
+    except OriginBusy as e:
+        return _origin_busy_response(e)
     except requests.exceptions.RequestException as e:
+        metrics.count_image_error(e)
         print(f"Falha na requisição da imagem externa ({full_image_url}): {e}")
-        return Response({"error": f"Falha na requisição da imagem externa ({original_url}): {e}"}, status=status.HTTP_502_BAD_GATEWAY)
-
-GET_SOURCE_BROWSE_QUERY = """
-    query GET_SOURCE_BROWSE($id: LongString!) {
-      source(id: $id) {
-        id
-        name
-        filters {
-          ... on GroupFilter {
-            type: __typename
-            name
-            filters {
-              ... on CheckBoxFilter {
-                type: __typename
-                name
-              }
-              ... on SelectFilter {
-                 type: __typename
-                 name
-                 values
-              }
-              # Adicionar outros tipos de filtro conforme necessário
-            }
-          }
-          # Adicionar outros tipos de filtro de nível superior se existirem
-        }
-      }
-    }
-"""
+        return FastJsonResponse({"error": f"Falha na requisição da imagem externa ({original_url}): {e}"}, status=502)
+
+def _autocomplete_response(params):
+    """Resposta do autocomplete; compartilhada com a view assíncrona, já que não há I/O."""
+    query = (params.get('q') or '').strip()
+    if not query:
+        return FastJsonResponse({"error": "Parâmetro 'q' não fornecido."}, status=400)
+    max_limit = getattr(settings, 'AUTOCOMPLETE_MAX_LIMIT', 25)
+    try:
+        limit = int(params.get('limit') or 10)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= max_limit:
+        return FastJsonResponse({"error": f"O parâmetro 'limit' deve estar entre 1 e {max_limit}."}, status=400)
+    if not autocomplete.enabled():
+        return FastJsonResponse({"error": "Autocomplete desativado."}, status=404)
+    return FastJsonResponse({
+        "query": query,
+        "suggestions": autocomplete.suggest(query, limit, params.get('provider_id') or None),
+    })
+
+@require_GET
+def autocomplete_titles(request):
+    """
+    Sugestões de títulos para o campo de busca (?q=, ?limit=, ?provider_id=),
+    respondidas pelo índice local (api/autocomplete.py), sem chamar o ExternalProvider.
+    """
+    return _autocomplete_response(request.GET)
+
+@require_GET
+def search_content_multi(request):
+    """
+    Busca em vários provedores ao mesmo tempo, com resposta NDJSON: uma linha por
+    provedor, na ordem em que respondem, e uma linha final com o resumo. View Django
+    simples para que o DRF não negocie (nem bufferize) a resposta.
+    """
+    search, error_body = _parse_fanout_params(request.GET)
+    if error_body:
+        return FastJsonResponse(error_body, status=400)
+    providers_list = []
+    if not search["provider_ids"]:
+        try:
+            data = get_or_fetch(GET_SOURCES_LIST_QUERY, None, lambda: execute_graphql(GET_SOURCES_LIST_QUERY))
+        except UpstreamError as e:
+            return _upstream_error_response(e)
+        providers_list = data.get("data", {}).get("sources", {}).get("nodes", [])
+    provider_ids, error_body = _fanout_providers(search, providers_list)
+    if error_body:
+        return FastJsonResponse(error_body, status=400)
+    return StreamingHttpResponse(
+        iter_search(provider_ids, search["query_term"], search["page"], search["fields"]), content_type=NDJSON_CONTENT_TYPE
+    )
 
 class SourceFiltersView(APIView):
     """
@@ -328,27 +518,36 @@ class SourceFiltersView(APIView):
         provider_id = request.query_params.get('provider_id')
 
         if not provider_id:
-            return JsonResponse({'error': 'O parâmetro provider_id é obrigatório.'}, status=400)
+            return FastJsonResponse({'error': 'O parâmetro provider_id é obrigatório.'}, status=400)
 
         variables = {'id': provider_id}
-
         try:
-            external_provider_data = execute_externalprovider_query(
-                query=GET_SOURCE_BROWSE_QUERY,
-                variables=variables
+            external_provider_data = get_or_fetch(
+                GET_SOURCE_BROWSE_QUERY,
+                variables,
+                lambda: execute_graphql(GET_SOURCE_BROWSE_QUERY, variables, timeout=settings.EXTERNAL_PROVIDER_TIMEOUT),
             )
+        except UpstreamError as e:
+            return _upstream_error_response(e, body={'error': 'Erro retornado pela API ExternalProvider', 'details': e.details or e.message})
+        source_data = external_provider_data.get('data', {}).get('source', {})
+        return FastJsonResponse(source_data)
 
-            if external_provider_data.get('errors'):
-                 return JsonResponse({'error': 'Erro retornado pela API ExternalProvider', 'details': external_provider_data['errors']}, status=502)
-
-            source_data = external_provider_data.get('data', {}).get('source', {})
-            return JsonResponse(source_data)
-
-        except Exception as e:
-            return JsonResponse({'error': f'Erro interno no servidor: {str(e)}'}, status=500)
+@require_GET
+def metrics_view(request):
+    """
+    Métricas no formato de texto do Prometheus (api/metrics.py). Com METRICS_TOKEN
+    definido, exige o cabeçalho Authorization: Bearer <token>.
+    """
+    if not metrics.enabled():
+        return FastJsonResponse({"error": "Métricas desativadas ou prometheus_client não instalado."}, status=404)
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return FastJsonResponse({"error": "Não autorizado."}, status=401)
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
 
 def home(request):
     """
     View para a página inicial que retorna uma mensagem de status em JSON.
     """
-    return JsonResponse({'status': 'ok', 'message': 'Servidor Gateway está no ar e funcionando!'})
\ No newline at end of file
+    return FastJsonResponse({'status': 'ok', 'message': 'Servidor Gateway está no ar e funcionando!'})
@@ -2,6 +2,11 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI the API is served by the async views in api/async_views.py
+(set DJANGO_ASYNC_VIEWS=False to fall back to the sync views).
+
+Opt-in (the Dockerfile serves backend.wsgi by default):
+gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
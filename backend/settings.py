@@ -3,8 +3,10 @@ Django settings for backend project.
 Optimized for Vercel deployment.
 """
 
+import json
 import os
 import sys
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -65,7 +67,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.HttpCachingMiddleware',
+    'api.middleware.RateLimitMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,6 +102,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Views assíncronas (api/async_views.py). Ativadas por padrão em backend/asgi.py.
+ASYNC_VIEWS = config('DJANGO_ASYNC_VIEWS', default=False, cast=bool)
 
 # Database configuration
 _raw_db_url = config('DATABASE_URL', default=None)
@@ -163,6 +174,10 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # REST Framework
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -175,6 +190,25 @@ REST_FRAMEWORK = {
 # External Provider URLs
 EXTERNAL_PROVIDER_API_URL = config('EXTERNAL_PROVIDER_API_URL', default='https://seu-servidor-suwayomi.com/api/graphql')
 EXTERNAL_PROVIDER_BASE_URL = config('EXTERNAL_PROVIDER_BASE_URL', default='https://seu-servidor-suwayomi.com')
+EXTERNAL_PROVIDER_API_URL_2 = config('EXTERNAL_PROVIDER_API_URL_2', default=None)
+EXTERNAL_PROVIDER_TIMEOUT = config('EXTERNAL_PROVIDER_TIMEOUT', default=10, cast=int)
+
+# Circuit breaker por URL e hedging entre EXTERNAL_PROVIDER_API_URL e _URL_2
+UPSTREAM_BREAKER_FAILURES = config('UPSTREAM_BREAKER_FAILURES', default=5, cast=int)
+UPSTREAM_BREAKER_RESET_TIMEOUT = config('UPSTREAM_BREAKER_RESET_TIMEOUT', default=30, cast=float)
+UPSTREAM_HEDGING = config('UPSTREAM_HEDGING', default=False, cast=bool)
+UPSTREAM_HEDGE_PERCENTILE = config('UPSTREAM_HEDGE_PERCENTILE', default=95, cast=int)
+UPSTREAM_HEDGE_DEFAULT_DELAY = config('UPSTREAM_HEDGE_DEFAULT_DELAY', default=1.0, cast=float)
+UPSTREAM_HEDGE_MIN_DELAY = config('UPSTREAM_HEDGE_MIN_DELAY', default=0.05, cast=float)
+UPSTREAM_HEDGE_WORKERS = config('UPSTREAM_HEDGE_WORKERS', default=16, cast=int)
+UPSTREAM_HEDGE_MAX_INFLIGHT = config('UPSTREAM_HEDGE_MAX_INFLIGHT', default=4, cast=int)
+# Requisições idênticas simultâneas ao ExternalProvider compartilham uma só chamada
+UPSTREAM_COALESCING = config('UPSTREAM_COALESCING', default=True, cast=bool)
+
+# Pool de conexões keep-alive com o ExternalProvider (um por processo)
+EXTERNAL_PROVIDER_POOL_SIZE = config('EXTERNAL_PROVIDER_POOL_SIZE', default=20, cast=int)
+EXTERNAL_PROVIDER_POOL_CONNECTIONS = config('EXTERNAL_PROVIDER_POOL_CONNECTIONS', default=4, cast=int)
+EXTERNAL_PROVIDER_KEEPALIVE = config('EXTERNAL_PROVIDER_KEEPALIVE', default=True, cast=bool)
 
 # Logging otimizado para Vercel
 LOGGING = {
@@ -206,11 +240,204 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # Clientes HTTP do ExternalProvider e das imagens: uma linha DEBUG por
+        # requisição no root em DEBUG; só avisos e erros chegam ao console
+        'urllib3': {'level': 'WARNING'},
+        'httpx': {'level': 'WARNING'},
+        'httpcore': {'level': 'WARNING'},
     },
 }
 
+# Cache (Redis se REDIS_URL estiver definida, senão memória local do processo)
+REDIS_URL = config('REDIS_URL', default=None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gateway-service',
+        }
+    }
+
+# Cache de respostas do ExternalProvider (lista de fontes e filtros)
+RESPONSE_CACHE_ENABLED = config('RESPONSE_CACHE_ENABLED', default=True, cast=bool)
+RESPONSE_CACHE_ALIAS = config('RESPONSE_CACHE_ALIAS', default='default')
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=300, cast=int)
+RESPONSE_CACHE_STALE_TTL = config('RESPONSE_CACHE_STALE_TTL', default=3600, cast=int)
+
+# Feeds POPULAR/LATEST pré-calculados (api/feeds.py): search_content responde
+# pelo cache para as primeiras FEED_WARM_PAGES páginas. O aquecimento roda pelo
+# comando warm_feeds ou, com FEED_WARM_IN_PROCESS, em cada worker do gunicorn;
+# FEED_WARM_PROVIDERS (ids separados por vírgula) restringe as fontes aquecidas
+FEED_CACHE_ENABLED = config('FEED_CACHE_ENABLED', default=True, cast=bool)
+FEED_CACHE_TTL = config('FEED_CACHE_TTL', default=600, cast=int)
+FEED_WARM_PAGES = config('FEED_WARM_PAGES', default=2, cast=int)
+FEED_WARM_IN_PROCESS = config('FEED_WARM_IN_PROCESS', default=False, cast=bool)
+FEED_WARM_INTERVAL = config('FEED_WARM_INTERVAL', default=300, cast=int)
+FEED_WARM_JITTER = config('FEED_WARM_JITTER', default=0.2, cast=float)
+FEED_WARM_CONCURRENCY = config('FEED_WARM_CONCURRENCY', default=2, cast=int)
+FEED_WARM_MAX_LOAD = config('FEED_WARM_MAX_LOAD', default=0.5, cast=float)
+FEED_WARM_PROVIDERS = tuple(p.strip() for p in config('FEED_WARM_PROVIDERS', default='').split(',') if p.strip())
+
+# Autocomplete (content-discovery/autocomplete/): índice de títulos em memória
+# por processo, com no máximo AUTOCOMPLETE_MAX_TITLES títulos
+AUTOCOMPLETE_ENABLED = config('AUTOCOMPLETE_ENABLED', default=True, cast=bool)
+AUTOCOMPLETE_MAX_TITLES = config('AUTOCOMPLETE_MAX_TITLES', default=20000, cast=int)
+AUTOCOMPLETE_MAX_LIMIT = config('AUTOCOMPLETE_MAX_LIMIT', default=25, cast=int)
+
+# Espelho do catálogo no banco (api/catalog.py): get_manga_details responde pelo
+# espelho se foi sincronizado há menos de CATALOG_MIRROR_MAX_AGE segundos (0 =
+# só grava); CATALOG_SYNC_QUEUE limita as gravações pendentes
+CATALOG_MIRROR_ENABLED = config('CATALOG_MIRROR_ENABLED', default=True, cast=bool)
+CATALOG_MIRROR_MAX_AGE = config('CATALOG_MIRROR_MAX_AGE', default=600, cast=int)
+CATALOG_SYNC_QUEUE = config('CATALOG_SYNC_QUEUE', default=256, cast=int)
+# Segundos sem consultar o banco depois de uma falha do espelho (as views usam só o upstream)
+CATALOG_DB_RETRY = config('CATALOG_DB_RETRY', default=60.0, cast=float)
+
+# Cache em disco do image_proxy (LRU limitado por IMAGE_CACHE_MAX_BYTES)
+IMAGE_CACHE_ENABLED = config('IMAGE_CACHE_ENABLED', default=True, cast=bool)
+IMAGE_CACHE_DIR = config('IMAGE_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'gateway-image-cache'))
+IMAGE_CACHE_MAX_BYTES = config('IMAGE_CACHE_MAX_BYTES', default=1024 ** 3, cast=int)
+IMAGE_CACHE_DEFAULT_TTL = config('IMAGE_CACHE_DEFAULT_TTL', default=3600, cast=int)
+
+# Redimensionamento/conversão no image_proxy (?w=&q=, formato negociado pelo Accept)
+IMAGE_TRANSFORM_ENABLED = config('IMAGE_TRANSFORM_ENABLED', default=True, cast=bool)
+IMAGE_TRANSFORM_WORKERS = config('IMAGE_TRANSFORM_WORKERS', default=2, cast=int)
+IMAGE_TRANSFORM_QUEUE = config('IMAGE_TRANSFORM_QUEUE', default=8, cast=int)
+IMAGE_RESIZE_WIDTHS = [int(w) for w in config('IMAGE_RESIZE_WIDTHS', default='96,150,200,300,450,600,900,1200').split(',')]
+IMAGE_DEFAULT_QUALITY = config('IMAGE_DEFAULT_QUALITY', default=80, cast=int)
+
+# Downloads da origem no image_proxy: limite de downloads simultâneos por host
+# de origem em cada processo (0 = sem limite), espera máxima por um slot antes
+# do 503, tamanho dos chunks (~1/4 da imagem, entre MIN e MAX) e bytes mantidos
+# em memória quando a origem proíbe cache (acima disso, arquivo temporário)
+IMAGE_ORIGIN_MAX_CONCURRENCY = config('IMAGE_ORIGIN_MAX_CONCURRENCY', default=8, cast=int)
+IMAGE_ORIGIN_QUEUE_TIMEOUT = config('IMAGE_ORIGIN_QUEUE_TIMEOUT', default=1.0, cast=float)
+IMAGE_PROXY_SPOOL_BYTES = config('IMAGE_PROXY_SPOOL_BYTES', default=1024 ** 2, cast=int)
+IMAGE_PROXY_CHUNK_MIN = config('IMAGE_PROXY_CHUNK_MIN', default=16 * 1024, cast=int)
+IMAGE_PROXY_CHUNK_MAX = config('IMAGE_PROXY_CHUNK_MAX', default=256 * 1024, cast=int)
+
+# Pré-carregamento das páginas retornadas por get_chapter_pages (0 = desativado;
+# o cliente pode pedir ?prefetch=N até IMAGE_PREFETCH_MAX_PAGES) e quantos dos
+# slots de cada host de origem o pré-carregamento pode ocupar
+IMAGE_PREFETCH_PAGES = config('IMAGE_PREFETCH_PAGES', default=0, cast=int)
+IMAGE_PREFETCH_MAX_PAGES = config('IMAGE_PREFETCH_MAX_PAGES', default=20, cast=int)
+IMAGE_PREFETCH_WORKERS = config('IMAGE_PREFETCH_WORKERS', default=4, cast=int)
+IMAGE_PREFETCH_QUEUE = config('IMAGE_PREFETCH_QUEUE', default=64, cast=int)
+IMAGE_PREFETCH_ORIGIN_CONCURRENCY = config('IMAGE_PREFETCH_ORIGIN_CONCURRENCY', default=2, cast=int)
+
+# Download do capítulo em CBZ (chapter/<id>/download/): páginas buscadas à
+# frente por download, threads do pool compartilhado, espera máxima (s) por um
+# slot da origem e bytes de cada página mantidos em memória quando a origem
+# proíbe cache (acima disso, arquivo temporário)
+CHAPTER_ARCHIVE_WINDOW = config('CHAPTER_ARCHIVE_WINDOW', default=4, cast=int)
+CHAPTER_ARCHIVE_WORKERS = config('CHAPTER_ARCHIVE_WORKERS', default=16, cast=int)
+CHAPTER_ARCHIVE_QUEUE_TIMEOUT = config('CHAPTER_ARCHIVE_QUEUE_TIMEOUT', default=30.0, cast=float)
+CHAPTER_ARCHIVE_SPOOL_BYTES = config('CHAPTER_ARCHIVE_SPOOL_BYTES', default=1024 ** 2, cast=int)
+
+# Busca multi-provedor (content-discovery/search/multi/, NDJSON)
+SEARCH_FANOUT_TIMEOUT = config('SEARCH_FANOUT_TIMEOUT', default=15, cast=float)
+SEARCH_FANOUT_CONCURRENCY = config('SEARCH_FANOUT_CONCURRENCY', default=8, cast=int)
+SEARCH_FANOUT_MAX_PROVIDERS = config('SEARCH_FANOUT_MAX_PROVIDERS', default=50, cast=int)
+
+# Compressão gzip/brotli das respostas JSON (api/middleware.py)
+COMPRESSION_CONTENT_TYPES = tuple(t.strip().lower() for t in config('COMPRESSION_CONTENT_TYPES', default='application/json,application/x-ndjson').split(',') if t.strip())
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+
+# Cache HTTP por rota (nome da URL -> Cache-Control), com ETag/304 nessas rotas.
+# API_CACHE_CONTROL no ambiente (JSON) sobrescreve ou acrescenta rotas.
+API_CACHE_CONTROL = {
+    'list_content_providers': 'public, max-age=300, s-maxage=3600, stale-while-revalidate=600',
+    'get_source_filters': 'public, max-age=300, s-maxage=3600, stale-while-revalidate=600',
+    'search_content': 'public, max-age=30, s-maxage=120',
+    'autocomplete': 'public, max-age=30',
+    'get_manga_details': 'public, max-age=60, s-maxage=300, stale-while-revalidate=60',
+    'get_manga_details_batch': 'public, max-age=60, s-maxage=300, stale-while-revalidate=60',
+    'get_chapter_pages': 'public, max-age=300, s-maxage=3600',
+    'image-proxy': 'public, max-age=86400, s-maxage=604800',
+    'status_check': 'no-store',
+    **config('API_CACHE_CONTROL', default='{}', cast=json.loads),
+}
+
+# Paginação dos capítulos em get_manga_details (?limit=&cursor=)
+CHAPTERS_PAGE_DEFAULT_LIMIT = config('CHAPTERS_PAGE_DEFAULT_LIMIT', default=50, cast=int)
+CHAPTERS_PAGE_MAX_LIMIT = config('CHAPTERS_PAGE_MAX_LIMIT', default=500, cast=int)
+
+# Máximo de itens por chamada ao endpoint de detalhes em lote
+BATCH_DETAILS_MAX_ITEMS = config('BATCH_DETAILS_MAX_ITEMS', default=50, cast=int)
+
+# Métricas Prometheus em /api/v1/metrics/ (api/metrics.py). Com METRICS_TOKEN o
+# endpoint exige Authorization: Bearer <token>. Com vários workers defina
+# PROMETHEUS_MULTIPROC_DIR no ambiente (ver gunicorn.conf.py).
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='') or None
+
+# Server-Timing com o tempo por fase (upstream, decode, format, render) em cada resposta
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=True, cast=bool)
+
+# Profiling amostrado (api/profiling.py): fração das requisições sob o cProfile e
+# token do cabeçalho X-Profile que força o profiling de uma requisição
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_TOKEN = config('PROFILING_TOKEN', default='') or None
+PROFILING_DIR = config('PROFILING_DIR', default=os.path.join(tempfile.gettempdir(), 'gateway-profiles'))
+PROFILING_MAX_FILES = config('PROFILING_MAX_FILES', default=200, cast=int)
+
 # Rate Limiting
 RATE_LIMIT_PER_MINUTE = config('DJANGO_RATE_LIMIT_PER_MINUTE', default=100, cast=int)
+# Token bucket por cliente (RateLimitMiddleware): compartilhado no Redis quando
+# REDIS_URL existe, senão por processo. RATE_LIMIT_BURST é a capacidade do balde.
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_BURST = config('RATE_LIMIT_BURST', default=RATE_LIMIT_PER_MINUTE, cast=int)
+# Cabeçalho com o IP real do cliente atrás de proxy (ex.: Fly-Client-IP); vazio usa REMOTE_ADDR
+RATE_LIMIT_CLIENT_IP_HEADER = config('RATE_LIMIT_CLIENT_IP_HEADER', default='') or None
+RATE_LIMIT_REDIS_TIMEOUT = config('RATE_LIMIT_REDIS_TIMEOUT', default=0.1, cast=float)
+# Segundos sem consultar o Redis depois de uma falha (usa o balde local nesse meio-tempo)
+RATE_LIMIT_REDIS_RETRY = config('RATE_LIMIT_REDIS_RETRY', default=5.0, cast=float)
+# Balde separado e maior para as rotas de imagem: um capítulo aberto pede dezenas
+# de imagens de uma vez, o que esgotaria o balde das rotas da API
+RATE_LIMIT_IMAGE_ROUTES = ('image-proxy',)
+RATE_LIMIT_IMAGE_PER_MINUTE = config('RATE_LIMIT_IMAGE_PER_MINUTE', default=1200, cast=int)
+RATE_LIMIT_IMAGE_BURST = config('RATE_LIMIT_IMAGE_BURST', default=300, cast=int)
+# Custo em fichas por rota (nome da URL); rotas ausentes não são limitadas.
+# RATE_LIMIT_COSTS no ambiente (JSON) sobrescreve ou acrescenta rotas.
+RATE_LIMIT_COSTS = {
+    'status_check': 1,
+    'list_content_providers': 1,
+    'get_source_filters': 1,
+    'search_content': 5,
+    'search_content_multi': 10,
+    'autocomplete': 1,
+    'get_manga_details': 2,
+    'get_manga_details_batch': 5,
+    'get_chapter_pages': 3,
+    'download_chapter': 10,
+    'image-proxy': 1,
+    **config('RATE_LIMIT_COSTS', default='{}', cast=json.loads),
+}
+
+# Limite de concorrência ao ExternalProvider por processo (api/resilience.py,
+# AdaptiveLimiter): varia entre UPSTREAM_MIN_CONCURRENCY e UPSTREAM_MAX_CONCURRENCY
+# (0 desativa) conforme a latência do upstream. O excesso espera até
+# UPSTREAM_BULKHEAD_TIMEOUT segundos numa fila de UPSTREAM_QUEUE_SIZE chamadas,
+# com as operações de UPSTREAM_LOW_PRIORITY_OPERATIONS atrás das demais; fila
+# cheia ou espera esgotada respondem 503 com Retry-After
+UPSTREAM_MAX_CONCURRENCY = config('UPSTREAM_MAX_CONCURRENCY', default=32, cast=int)
+UPSTREAM_MIN_CONCURRENCY = config('UPSTREAM_MIN_CONCURRENCY', default=4, cast=int)
+UPSTREAM_ADAPTIVE_CONCURRENCY = config('UPSTREAM_ADAPTIVE_CONCURRENCY', default=True, cast=bool)
+UPSTREAM_LATENCY_TOLERANCE = config('UPSTREAM_LATENCY_TOLERANCE', default=2.0, cast=float)
+UPSTREAM_QUEUE_SIZE = config('UPSTREAM_QUEUE_SIZE', default=64, cast=int)
+UPSTREAM_BULKHEAD_TIMEOUT = config('UPSTREAM_BULKHEAD_TIMEOUT', default=2.0, cast=float)
+UPSTREAM_LOW_PRIORITY_OPERATIONS = tuple(
+    op.strip() for op in config('UPSTREAM_LOW_PRIORITY_OPERATIONS', default='FetchChapterPages').split(',') if op.strip()
+)
 
 # Configurações de segurança para produção
 if not DEBUG:
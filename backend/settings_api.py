@@ -0,0 +1,44 @@
+"""
+Perfil enxuto e sem estado só com a API (/api/v1/).
+
+As views da API não usam admin, auth, sessões, mensagens, CSRF nem templates;
+este perfil remove esses apps e middlewares para reduzir o tempo de import e
+de montagem da aplicação no cold start (Vercel/Fly com scale-to-zero).
+
+Uso: DJANGO_SETTINGS_MODULE=backend.settings_api
+Tempo de inicialização comparado com o perfil completo: scripts/bench_startup.py
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    'corsheaders',
+    'rest_framework',
+    'api',
+]
+
+MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.HttpCachingMiddleware',
+    'api.middleware.RateLimitMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'backend.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+# Sem a API navegável (templates) e sem autenticação: o DRF não importa django.contrib.auth
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['api.renderers.FastJSONRenderer'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -0,0 +1,11 @@
+"""
+URLs do perfil backend.settings_api: só a API, sem o admin.
+"""
+
+from django.urls import path, include
+from api import views as api_views
+
+urlpatterns = [
+    path('', api_views.home, name='home'),
+    path('api/v1/', include('api.urls')),
+]
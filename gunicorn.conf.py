@@ -0,0 +1,41 @@
+"""
+Configuração do gunicorn, carregada automaticamente do diretório de trabalho.
+
+Com PROMETHEUS_MULTIPROC_DIR definido, cada worker grava as suas métricas em
+arquivos nesse diretório (api/metrics.py): a partida do servidor apaga os
+arquivos da execução anterior e cada worker encerrado é descartado.
+
+Com FEED_WARM_IN_PROCESS, cada worker aquece os feeds POPULAR/LATEST numa
+thread (api/feeds.py).
+
+Cada worker conta o uso do cache de imagens em segundo plano ao iniciar, o
+que também apaga os temporários antigos (api/image_cache.py).
+"""
+
+import glob
+import os
+
+
+def on_starting(server):
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in glob.glob(os.path.join(path, '*.db')):
+            os.remove(name)
+
+
+def post_worker_init(worker):
+    from api import feeds, image_cache
+    feeds.start_worker()
+    if image_cache.enabled():
+        image_cache.start_accounting()
+
+
+def child_exit(server, worker):
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+Benchmark de carga do gateway contra o ExternalProvider stub (scripts/stub_provider.py).
+
+Sobe o stub e o gateway (gunicorn, WSGI ou ASGI) em processos separados,
+dispara --requests requisições por rota de api/urls.py com --concurrency
+clientes simultâneos e imprime, por rota, vazão (req/s) e latências
+p50/p95/p99 em JSON. Com --target mede um gateway já em execução.
+
+Os ids variam a cada requisição para que o cache de respostas e o
+coalescing não transformem o teste em medição de cache.
+
+Uso:
+    python scripts/bench_load.py --requests 500 --concurrency 32 --latency 50 --output atual.json
+    python scripts/bench_load.py --server asgi --compare atual.json
+    python scripts/bench_load.py --target http://127.0.0.1:8000 --endpoints get_manga_details,image-proxy
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from stub_provider import add_stub_arguments  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BATCH_SIZE = 5
+
+# Nome da rota em api/urls.py -> caminho da i-ésima requisição
+ENDPOINTS = {
+    'status_check': lambda i, n: '/api/v1/status/',
+    'metrics': lambda i, n: '/api/v1/metrics/',
+    'list_content_providers': lambda i, n: '/api/v1/content-providers/list/',
+    'search_content': lambda i, n: f'/api/v1/content-discovery/search/?provider_id={i % n}&query=busca{i}',
+    'search_content_feed': lambda i, n: f'/api/v1/content-discovery/search/?provider_id={i % n}&type=POPULAR&page=1',
+    'search_content_multi': lambda i, n: f'/api/v1/content-discovery/search/multi/?query=busca{i}&provider_ids=all',
+    # Depois das buscas, que alimentam o índice com os títulos "Manga <id>" do stub
+    'autocomplete': lambda i, n: f'/api/v1/content-discovery/autocomplete/?q=manga+{i % 100}',
+    'get_source_filters': lambda i, n: f'/api/v1/content-discovery/filters/?provider_id={i % n}',
+    'get_manga_details': lambda i, n: f'/api/v1/content/item/{i % n}/{i + 1}/detail/',
+    'get_manga_details_batch': lambda i, n: '/api/v1/content/items/detail/?ids=' + ','.join(
+        f'{i % n}:{i * BATCH_SIZE + k + 1}' for k in range(BATCH_SIZE)),
+    'get_chapter_pages': lambda i, n: f'/api/v1/content/item/{i % n}/{i + 1}/chapter/{i + 1}/pages/',
+    'download_chapter': lambda i, n: f'/api/v1/content/item/{i % n}/{i + 1}/chapter/{i + 1}/download/',
+    'image-proxy': lambda i, n: f'/api/v1/image-proxy/?url=/api/v1/chapter/{i}/page/0',
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo terminou antes de ficar pronto (código {process.returncode}).")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} não respondeu em {timeout} s.")
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_stub(args, log):
+    port = _free_port()
+    command = [
+        sys.executable, str(PROJECT_ROOT / 'scripts' / 'stub_provider.py'), '--port', str(port),
+        '--latency', str(args.latency), '--jitter', str(args.jitter), '--image-latency', str(args.image_latency),
+        '--sources', str(args.sources), '--mangas', str(args.mangas), '--chapters', str(args.chapters),
+        '--pages', str(args.pages), '--description-size', str(args.description_size), '--image-size', str(args.image_size),
+    ]
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    _wait_ready(base_url + '/ping', process)
+    return process, base_url
+
+def start_gateway(args, stub_url, log, workdir):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=args.settings,
+        DJANGO_DEBUG='False',
+        DJANGO_ALLOWED_HOSTS='127.0.0.1,localhost',
+        EXTERNAL_PROVIDER_API_URL=f'{stub_url}/api/graphql',
+        EXTERNAL_PROVIDER_BASE_URL=stub_url,
+        IMAGE_CACHE_DIR=str(Path(workdir) / 'image-cache'),
+        RATE_LIMIT_ENABLED='False',
+    )
+    if args.no_cache:
+        env.update(RESPONSE_CACHE_ENABLED='False', IMAGE_CACHE_ENABLED='False')
+    if args.server == 'asgi':
+        command = ['gunicorn', 'backend.asgi:application', '-k', 'uvicorn.workers.UvicornWorker']
+    else:
+        command = ['gunicorn', 'backend.wsgi:application', '--worker-class', 'gthread', '--threads', str(args.threads)]
+    command += ['--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    _wait_ready(base_url + '/api/v1/status/', process)
+    return process, base_url
+
+
+def percentile(sorted_values, pct):
+    """Percentil pelo método nearest-rank."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+async def run_endpoint(client, name, path_for, requests, concurrency, sources, warmup):
+    latencies, statuses, errors = [], {}, 0
+    received = 0
+    counter = iter(range(warmup + requests))
+
+    async def worker():
+        nonlocal errors, received
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path_for(i, sources))
+                body = await response.aread()
+            except httpx.HTTPError:
+                if i >= warmup:
+                    errors += 1
+                    statuses['error'] = statuses.get('error', 0) + 1
+                continue
+            elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            received += len(body)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    # A fase de aquecimento entra no tempo total; ela é curta perto de --requests
+    duration = time.perf_counter() - started
+    latencies.sort()
+    return name, {
+        'requests': requests,
+        'errors': errors,
+        'statuses': statuses,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(requests / duration, 1) if duration else None,
+        'bytes_received': received,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50': round(percentile(latencies, 50), 2) if latencies else None,
+            'p95': round(percentile(latencies, 95), 2) if latencies else None,
+            'p99': round(percentile(latencies, 99), 2) if latencies else None,
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+    }
+
+async def run_all(base_url, names, args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        results = {}
+        for name in names:
+            _, results[name] = await run_endpoint(
+                client, name, ENDPOINTS[name], args.requests, args.concurrency, args.sources, args.warmup,
+            )
+            print(f"{name}: {results[name]['throughput_rps']} req/s, p95 {results[name]['latency_ms']['p95']} ms", file=sys.stderr)
+        return results
+
+
+def compare(current, baseline):
+    """Variação percentual de vazão e latências em relação a um relatório anterior."""
+    deltas = {}
+    for name, result in current.items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        delta = {}
+        pairs = [('throughput_rps', result['throughput_rps'], previous['throughput_rps'])]
+        pairs += [(key, result['latency_ms'][key], previous['latency_ms'][key]) for key in ('p50', 'p95', 'p99')]
+        for key, now, before in pairs:
+            if now is not None and before:
+                delta[key] = f"{(now - before) / before * 100:+.1f}%"
+        deltas[name] = delta
+    return deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', help='URL de um gateway já em execução (não sobe stub nem gateway).')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--settings', default='backend.settings')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads por worker WSGI (gthread).')
+    parser.add_argument('--no-cache', action='store_true', help='Desativa os caches de respostas e de imagens do gateway.')
+    parser.add_argument('--endpoints', help='Rotas a medir, separadas por vírgula (padrão: todas).')
+    parser.add_argument('--requests', type=int, default=200, help='Requisições medidas por rota.')
+    parser.add_argument('--warmup', type=int, default=10, help='Requisições descartadas no início de cada rota.')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', help='Grava o relatório JSON neste arquivo.')
+    parser.add_argument('--compare', help='Relatório JSON anterior para calcular a variação.')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.endpoints.split(',')] if args.endpoints else list(ENDPOINTS)
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Rotas desconhecidas: {', '.join(unknown)}. Disponíveis: {', '.join(ENDPOINTS)}")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix='bench-load-') as workdir:
+        log_path = Path(workdir) / 'servers.log'
+        with open(log_path, 'w') as log:
+            try:
+                base_url = args.target
+                if not base_url:
+                    stub, stub_url = start_stub(args, log)
+                    processes.append(stub)
+                    gateway, base_url = start_gateway(args, stub_url, log, workdir)
+                    processes.append(gateway)
+                results = asyncio.run(run_all(base_url.rstrip('/'), names, args))
+            except RuntimeError:
+                log.flush()
+                sys.stderr.write(log_path.read_text())
+                raise
+            finally:
+                for process in reversed(processes):
+                    process.terminate()
+                    process.wait(timeout=10)
+
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'python': sys.version.split()[0],
+            'target': args.target,
+            'server': None if args.target else args.server,
+            'settings': None if args.target else args.settings,
+            'workers': None if args.target else args.workers,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'stub': None if args.target else {
+                'latency_ms': args.latency, 'jitter_ms': args.jitter, 'image_latency_ms': args.image_latency,
+                'sources': args.sources, 'mangas': args.mangas, 'chapters': args.chapters, 'pages': args.pages,
+                'description_size': args.description_size, 'image_size': args.image_size,
+            },
+        },
+        'endpoints': results,
+    }
+    if args.compare:
+        report['compare'] = {'baseline': args.compare, 'delta': compare(results, json.loads(Path(args.compare).read_text()))}
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Benchmark de cold start do gateway.
+
+Para cada perfil de settings, sobe N processos Python novos e mede:
+
+* import_ms: django.setup() + get_wsgi_application() (imports e middlewares);
+* first_response_ms: import_ms + a primeira requisição (padrão /api/v1/status/),
+  que também carrega o URLconf e as views;
+* process_ms: tempo total do processo visto de fora, com a inicialização do interpretador.
+
+Uso:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 20 --settings backend.settings_api --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PROFILES = ('backend.settings', 'backend.settings_api')
+
+# Executado em cada processo filho; imprime uma linha JSON com as medidas
+CHILD = r'''
+import time
+t0 = time.perf_counter()
+import io, json, sys
+import django
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+t1 = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'REMOTE_ADDR': '127.0.0.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''),
+    'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0), 'wsgi.multithread': False,
+    'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+status = []
+body = b''.join(application(environ, lambda s, h, exc_info=None: status.append(s)))
+t2 = time.perf_counter()
+print(json.dumps({
+    'status': status[0], 'bytes': len(body),
+    'import_ms': (t1 - t0) * 1000, 'first_response_ms': (t2 - t0) * 1000,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def run_once(settings_module, path):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module, PYTHONDONTWRITEBYTECODE='1')
+    env.setdefault('DJANGO_ALLOWED_HOSTS', 'localhost')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, path], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao iniciar com {settings_module}:\n{result.stderr}")
+    # Logs da aplicação podem sair no stdout; a medida é a última linha
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['process_ms'] = elapsed
+    return sample
+
+
+def summarize(samples, key):
+    values = sorted(sample[key] for sample in samples)
+    return {
+        'min': round(values[0], 1),
+        'median': round(statistics.median(values), 1),
+        'max': round(values[-1], 1),
+    }
+
+
+def bench(settings_module, path, runs):
+    # Primeira execução descartada: aquece o cache de bytecode e do sistema de arquivos
+    run_once(settings_module, path)
+    samples = [run_once(settings_module, path) for _ in range(runs)]
+    return {
+        'settings': settings_module,
+        'runs': runs,
+        'status': samples[-1]['status'],
+        'modules': samples[-1]['modules'],
+        'import_ms': summarize(samples, 'import_ms'),
+        'first_response_ms': summarize(samples, 'first_response_ms'),
+        'process_ms': summarize(samples, 'process_ms'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', action='append', help='Módulo de settings (repetível). Padrão: completo e api-only.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/v1/status/', help='Rota da primeira requisição.')
+    parser.add_argument('--output', help='Grava o resultado JSON neste arquivo.')
+    args = parser.parse_args()
+
+    report = {
+        'python': sys.version.split()[0],
+        'path': args.path,
+        'profiles': [bench(settings_module, args.path, args.runs) for settings_module in args.settings or DEFAULT_PROFILES],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
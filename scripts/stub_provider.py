@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+Servidor local que imita o ExternalProvider (Suwayomi) para benchmarks.
+
+* POST /api/graphql responde às operações que o gateway envia (api/queries.py)
+  com dados sintéticos e determinísticos;
+* qualquer GET serve uma "imagem" de --image-size bytes com ETag e Cache-Control,
+  fazendo o papel da origem das capas e páginas.
+
+Latência (--latency/--jitter, em ms) e tamanho das respostas (--mangas,
+--chapters, --pages, --description-size, --image-size) são configuráveis.
+Usa só a biblioteca padrão.
+
+Uso:
+    python scripts/stub_provider.py --port 8765 --latency 50 --jitter 20
+    EXTERNAL_PROVIDER_API_URL=http://127.0.0.1:8765/api/graphql EXTERNAL_PROVIDER_BASE_URL=http://127.0.0.1:8765 ...
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPERATION_RE = re.compile(r'\b(?:query|mutation)\s+(\w+)')
+
+
+class StubOptions:
+    def __init__(self, latency=0.0, jitter=0.0, image_latency=0.0, sources=5, mangas=20, chapters=100,
+                 pages=20, description_size=500, image_size=100_000):
+        self.latency = latency
+        self.jitter = jitter
+        self.image_latency = image_latency
+        self.sources = sources
+        self.mangas = mangas
+        self.chapters = chapters
+        self.pages = pages
+        self.description_size = description_size
+        self.image_size = image_size
+
+
+def _manga(manga_id, source_id, options):
+    return {
+        "id": manga_id,
+        "sourceId": str(source_id),
+        "title": f"Manga {manga_id}",
+        "author": "Autor",
+        "artist": "Artista",
+        "description": ("Lorem ipsum " * (options.description_size // 12 + 1))[:options.description_size],
+        "genre": ["Ação", "Aventura", "Fantasia"],
+        "status": "ONGOING",
+        "thumbnailUrl": f"/api/v1/manga/{manga_id}/thumbnail",
+        "thumbnailUrlLastFetched": "0",
+        "inLibrary": False,
+        "initialized": True,
+        "__typename": "MangaType",
+    }
+
+def _chapters(manga_id, options, first=None, after=None):
+    start = int(after or 0)
+    end = options.chapters if first is None else min(start + first, options.chapters)
+    nodes = [
+        {"id": manga_id * 10_000 + i, "name": f"Capítulo {i + 1}", "chapterNumber": i + 1,
+         "scanlator": "Scan", "uploadDate": "1700000000000"}
+        for i in range(start, end)
+    ]
+    return {
+        "nodes": nodes,
+        "pageInfo": {"hasNextPage": end < options.chapters, "endCursor": str(end)},
+        "totalCount": options.chapters,
+    }
+
+def graphql_data(operation, variables, options, base_url):
+    """Campo data da resposta para a operação pedida, ou None se desconhecida."""
+    if operation == "GetSourcesList":
+        return {"sources": {"nodes": [
+            {"id": str(i), "name": f"Fonte {i}", "lang": "pt-BR" if i % 2 else "en",
+             "iconUrl": f"/api/v1/extension/icon/{i}", "isNsfw": False}
+            for i in range(options.sources)
+        ]}}
+    if operation in ("GET_SOURCE_MANGAS_FETCH", "FetchSourceManga"):
+        source = variables["input"]["source"]
+        page = int(variables["input"].get("page") or 1)
+        first_id = page * options.mangas
+        return {"fetchSourceManga": {
+            "hasNextPage": True,
+            "mangas": [_manga(first_id + i, source, options) for i in range(options.mangas)],
+            "__typename": "FetchSourceMangaPayload",
+        }}
+    if operation == "GetMangaDetails":
+        return {"manga": _manga(variables["id"], 1, options)}
+    if operation in ("GetMangaChapters", "GetMangaChaptersPage"):
+        manga_id = variables["condition"]["mangaId"]
+        return {"chapters": _chapters(manga_id, options, variables.get("first"), variables.get("after"))}
+    if operation == "GetMangaDetailsBatch":
+        data = {}
+        for name, value in variables.items():
+            if name.startswith("m"):
+                data[name] = _manga(value, 1, options)
+            elif name.startswith("c"):
+                data[name] = {"nodes": _chapters(value["mangaId"], options)["nodes"]}
+        return data
+    if operation == "FetchChapterPages":
+        chapter_id = variables["input"]["chapterId"]
+        return {"fetchChapterPages": {"pages": [
+            f"{base_url}/api/v1/chapter/{chapter_id}/page/{i}" for i in range(options.pages)
+        ]}}
+    if operation == "GET_SOURCE_BROWSE":
+        return {"source": {"id": variables["id"], "name": f"Fonte {variables['id']}", "filters": [
+            {"type": "GroupFilter", "name": "Gêneros", "filters": [
+                {"type": "CheckBoxFilter", "name": genre} for genre in ("Ação", "Aventura", "Comédia", "Drama")
+            ]},
+        ]}}
+    return None
+
+
+def make_handler(options, image_body):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _sleep(self, base_ms):
+            delay = base_ms + (random.uniform(0, options.jitter) if options.jitter else 0)
+            if delay > 0:
+                time.sleep(delay / 1000)
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length))
+            except ValueError:
+                return self._send(400, json.dumps({"errors": [{"message": "JSON inválido"}]}).encode(), "application/json")
+            match = OPERATION_RE.search(payload.get("query") or "")
+            operation = match.group(1) if match else None
+            self._sleep(options.latency)
+            host, port = self.server.server_address[:2]
+            data = graphql_data(operation, payload.get("variables") or {}, options, f"http://{host}:{port}")
+            if data is None:
+                body = {"data": None, "errors": [{"message": f"Operação desconhecida: {operation}"}]}
+            else:
+                body = {"data": data}
+            self._send(200, json.dumps(body).encode(), "application/json")
+
+        def do_GET(self):
+            self._sleep(options.image_latency)
+            etag = '"stub-%d"' % options.image_size
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"", "image/jpeg", {"ETag": etag})
+            self._send(200, image_body, "image/jpeg", {"ETag": etag, "Cache-Control": "public, max-age=3600"})
+
+        do_HEAD = do_GET
+
+    return StubHandler
+
+
+class StubProvider:
+    """Servidor stub numa thread; útil para subir o stub dentro de outro script."""
+
+    def __init__(self, options=None, host="127.0.0.1", port=0):
+        self.options = options or StubOptions()
+        # Cabeçalho JPEG seguido de bytes fixos: o gateway só repassa o conteúdo
+        image_body = (b"\xff\xd8\xff\xe0" + bytes(range(256)) * (self.options.image_size // 256 + 1))[:self.options.image_size]
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.options, image_body))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def graphql_url(self):
+        return f"{self.base_url}/api/graphql"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-provider", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Latência fixa do GraphQL (ms).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latência aleatória extra, de 0 a N ms.")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="Latência fixa da origem de imagens (ms).")
+    parser.add_argument("--sources", type=int, default=5, help="Quantidade de fontes (provedores).")
+    parser.add_argument("--mangas", type=int, default=20, help="Mangás por página de busca.")
+    parser.add_argument("--chapters", type=int, default=100, help="Capítulos por mangá.")
+    parser.add_argument("--pages", type=int, default=20, help="Páginas por capítulo.")
+    parser.add_argument("--description-size", type=int, default=500, help="Tamanho da descrição dos mangás (bytes).")
+    parser.add_argument("--image-size", type=int, default=100_000, help="Tamanho das imagens (bytes).")
+
+def options_from_args(args):
+    return StubOptions(
+        latency=args.latency, jitter=args.jitter, image_latency=args.image_latency, sources=args.sources,
+        mangas=args.mangas, chapters=args.chapters, pages=args.pages,
+        description_size=args.description_size, image_size=args.image_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    stub = StubProvider(options_from_args(args), args.host, args.port)
+    print(f"Stub do ExternalProvider em {stub.graphql_url} (imagens em {stub.base_url}/...)", flush=True)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()